@@ -3,6 +3,17 @@ ASGI config for ai_forum_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+SSE 实时事件接口（/api/threads/<id>/events/）和异步读接口（帖子列表/详情、当前用户）需要通过这里部署，例如：
+
+    uvicorn ai_forum_project.asgi:application
+
+多 worker 部署时需要把 FORUM_EVENTS_BACKEND 设为 'postgres'，让事件跨进程分发。
+
+/api/ 下的请求由 APIHandler 处理：
+- 使用精简的中间件（FORUM_API_MIDDLEWARE）：Django 内置中间件在异步请求中每个钩子都要切换一次线程，
+  而 JWT 认证的接口用不到 session、messages、CSRF 等后台管理所需的中间件
+- 按 FORUM_API_URLCONF 解析路由：帖子列表/详情、当前用户换成异步视图（forum_app/async_views.py）
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -10,7 +21,40 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 import os
 
 from django.core.asgi import get_asgi_application
+from dotenv import load_dotenv
+
+# 与 manage.py 一致，加载 .env 中的 AI 接口配置
+load_dotenv()
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ai_forum_project.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+from django.core.handlers.asgi import ASGIHandler  # noqa: E402
+
+
+class APIHandler(ASGIHandler):
+    """只处理 /api/ 请求的 ASGI handler：FORUM_API_MIDDLEWARE + FORUM_API_URLCONF"""
+
+    def load_middleware(self, is_async=False):
+        middleware = settings.MIDDLEWARE
+        settings.MIDDLEWARE = settings.FORUM_API_MIDDLEWARE
+        try:
+            super().load_middleware(is_async)
+        finally:
+            settings.MIDDLEWARE = middleware
+
+    async def get_response_async(self, request):
+        request.urlconf = settings.FORUM_API_URLCONF
+        return await super().get_response_async(request)
+
+
+api_application = APIHandler()
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'].startswith('/api/'):
+        await api_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
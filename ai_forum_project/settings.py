@@ -1,3 +1,4 @@
+import importlib.util
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -25,7 +26,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'forum_app.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'forum_app.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -105,6 +108,11 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    # 安装了 orjson 时用它编码 JSON，输出与 DRF 默认的 JSONRenderer 一致
+    'DEFAULT_RENDERER_CLASSES': (
+        'forum_app.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
 # JWT 配置
@@ -116,3 +124,153 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': False,
 }
+
+# 论坛分页配置（游标分页，每页条数可通过 ?page_size= 调整）
+FORUM_PAGE_SIZE = 20
+FORUM_MAX_PAGE_SIZE = 100
+
+# 实时事件分发方式：'local' 仅当前进程；'postgres' 通过 LISTEN/NOTIFY 跨进程（多 worker 部署时使用）
+FORUM_EVENTS_BACKEND = 'local'
+
+# AI 生成任务队列
+FORUM_AI_WORKERS = 2                  # 每个进程的 worker 数量（同时进行的生成轮次上限）
+FORUM_AI_EMBEDDED_WORKERS = True      # 开发环境：web 进程内自动启动 worker；生产环境设为 False 并运行 run_ai_worker
+FORUM_AI_JOB_LEASE_SECONDS = 60       # 任务租约时长，worker 每 1/3 租约时长续约一次
+FORUM_AI_JOB_MAX_ATTEMPTS = 2         # 进程崩溃后任务最多重试的次数
+
+# AI 生成的准入控制（令牌桶 + 全局并发上限，见 admission.py）
+FORUM_AI_ADMISSION_ENABLED = True
+FORUM_AI_USER_BURST = 5               # 每个用户可连续触发 AI 的次数
+FORUM_AI_USER_REFILL_PER_MINUTE = 2   # 每个用户每分钟恢复的次数；用完后发帖/回帖照常保存，但不触发 AI
+FORUM_AI_THREAD_BURST = 10            # 每个帖子可连续触发的生成轮数
+FORUM_AI_THREAD_REFILL_PER_MINUTE = 4 # 每个帖子每分钟恢复的轮数；用完后推迟生成（期间的回复合并为一轮）
+FORUM_AI_MAX_PENDING_JOBS = 200       # 排队任务超过该数量时新请求不再触发 AI
+FORUM_AI_MAX_INFLIGHT_CALLS = 8       # 所有进程同时进行的模型调用上限（0 表示不限制）
+FORUM_AI_CALL_SLOT_WAIT = 30          # 等待调用名额的最长秒数，超时则跳过该角色的回复
+
+# 一轮 AI 回复的生成方式：'concurrent' 并发调用模型；'chained' 依次生成，后者能看到前者的回复
+FORUM_AI_REPLY_MODE = 'concurrent'
+FORUM_AI_ROUND_CONCURRENCY = 5        # 并发模式下同时进行的模型调用上限
+FORUM_AI_ROUND_TIMEOUT = 120          # 并发模式下一轮生成的总超时（秒），超时的回复被丢弃
+FORUM_AI_DISPLAY_PACING_MS = 1500     # 前端依次展示新 AI 回复的间隔（毫秒），0 表示立即展示
+
+# 每轮回复的 AI 角色选择（按最新对话内容与角色画像的向量相似度）
+FORUM_AI_AGENT_SELECTION = 'relevance'  # 'relevance' | 'random'
+FORUM_AI_AGENT_MAX_REPLIES = 3          # 每轮最多回复的角色数
+FORUM_AI_AGENT_MIN_REPLIES = 1          # 没有角色达到阈值时，仍由最相关的几个角色回复
+FORUM_AI_AGENT_MIN_SIMILARITY = 0.3     # 余弦相似度阈值，与所用 embedding 模型有关，需按实际数据调整
+FORUM_AI_AGENT_REGISTRY_TTL = 300       # 角色注册表最长缓存秒数（未配置共享缓存时，其他进程的修改最多延迟这么久生效）
+
+# AI 对话上下文（token 为估算值）
+FORUM_AI_CONTEXT_TOKEN_BUDGET = 3000  # 提示词中对话历史的总预算，超出部分的旧回复进入滚动摘要
+FORUM_AI_CONTEXT_HEAD_TOKENS = 800    # 楼主内容最多占用的 token
+FORUM_AI_SUMMARY_TOKENS = 400         # 滚动摘要的目标长度
+FORUM_AI_SUMMARY_MODEL = 'gemini-2.5-flash'
+
+# RAG 知识库检索
+FORUM_RAG_TOP_K = 3                         # 每个 AI 引用的参考资料条数
+FORUM_RAG_EF_SEARCH = 40                    # HNSW 搜索宽度，越大召回越高、越慢（用 benchmark_rag 评估）
+FORUM_RAG_IVFFLAT_PROBES = 10               # 改用 IVFFlat 索引时每次查询扫描的列表数
+FORUM_RAG_ITERATIVE_SCAN = 'relaxed_order'  # pgvector >= 0.8 的过滤迭代扫描模式，None 关闭
+FORUM_RAG_EMBEDDING_CACHE_SECONDS = 60 * 60 * 24  # 查询向量缓存时长
+FORUM_RAG_EMBEDDER = 'openai'               # 'openai' | 'local'（离线哈希向量）| 点分路径；导入与检索须一致
+
+# 帖子列表/详情的响应缓存（键带版本号，写入后自动失效）
+FORUM_RESPONSE_CACHE_ENABLED = True
+FORUM_RESPONSE_CACHE_MAX_ENTRIES = 1000     # 每个进程内存 LRU 的条目上限
+FORUM_RESPONSE_CACHE_SHARED = None          # 共享缓存的 CACHES 别名（如 Redis）；未配置时列表版本号存放在 Postgres 序列中，每次列表请求多一条查询
+FORUM_RESPONSE_CACHE_LIST_TTL = 10          # 列表缓存秒数（键带全局列表版本号，任一进程写入即失效）
+FORUM_RESPONSE_CACHE_DETAIL_TTL = 300       # 详情缓存秒数（键带 Thread.version，写入即失效）
+
+# 帖子/回复搜索（/api/search/，全文检索 + 语义检索融合排序）
+FORUM_SEARCH_CANDIDATES = 100               # 每路检索取的候选数，也是可翻页的结果总数上限
+FORUM_SEARCH_TIMEOUT_MS = 500               # 每条检索 SQL 的 statement_timeout（毫秒）
+FORUM_SEARCH_EMBEDDINGS = True              # 是否为帖子/回复计算向量并参与排序（使用 FORUM_RAG_EMBEDDER）
+FORUM_SEARCH_EMBED_CHARS = 2000             # 计算向量时截取的最大字符数
+FORUM_SEARCH_MAX_DISTANCE = 0.6             # 语义检索的余弦距离上限，超过的结果不返回；None 不限制
+FORUM_SEARCH_TEXT_WEIGHT = 1.0              # 融合排序中全文检索的权重
+FORUM_SEARCH_VECTOR_WEIGHT = 1.0            # 融合排序中语义检索的权重
+
+# 帖子详情每页回复数（?page_size= 可调整，上限 FORUM_MAX_PAGE_SIZE）
+FORUM_THREAD_POSTS_PAGE_SIZE = 50
+
+# 头像上传处理（在独立进程池中解码和缩放）
+FORUM_AVATAR_SIZES = (40, 96, 200)          # 上传时生成的尺寸（最长边像素），读取时用 ?size= 选择
+FORUM_AVATAR_QUALITY = 85                   # JPEG 质量
+FORUM_AVATAR_MAX_BYTES = 5 * 1024 * 1024    # 上传文件大小上限（解码前检查）
+FORUM_AVATAR_MAX_PIXELS = 40_000_000        # 宽 x 高上限（只读文件头检查，防止解压炸弹）
+FORUM_AVATAR_WORKERS = 2                    # 处理进程数；0 表示在请求线程中处理（开发/测试）
+FORUM_AVATAR_MAX_PENDING = 8                # 每个 web 进程同时处理/排队的上传数，超出返回 503
+FORUM_AVATAR_TIMEOUT = 10                   # 单张图片处理超时（秒）
+
+# 数据库连接管理（见 forum_app/db.py）
+# 安装了 psycopg 3 和 psycopg_pool 时每个进程使用连接池；否则（psycopg2）使用带健康检查的持久连接
+FORUM_DB_POOL = True                  # 可用时是否使用连接池
+FORUM_DB_POOL_MIN_SIZE = 2            # 每个进程常驻的连接数
+FORUM_DB_POOL_MAX_SIZE = 20           # 每个进程的连接上限，需覆盖：请求线程 + AI worker x 每轮并发数 + 后台线程
+FORUM_DB_POOL_TIMEOUT = 10            # 连接池用尽时等待空闲连接的秒数，超时请求报错
+FORUM_DB_CONN_MAX_AGE = 60            # 不使用连接池时持久连接的复用秒数（ASGI 部署且没有连接池时建议设为 0）
+FORUM_DB_APPLICATION_NAME = 'ai_forum'  # pg_stat_activity 中的 application_name，用于统计本应用的连接
+
+DATABASES['default'].setdefault('OPTIONS', {})['application_name'] = FORUM_DB_APPLICATION_NAME
+if FORUM_DB_POOL and importlib.util.find_spec('psycopg') and importlib.util.find_spec('psycopg_pool'):
+    # 连接池要求 CONN_MAX_AGE = 0：请求结束时连接归还给连接池而不是关闭
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': FORUM_DB_POOL_MIN_SIZE,
+        'max_size': FORUM_DB_POOL_MAX_SIZE,
+        'timeout': FORUM_DB_POOL_TIMEOUT,
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = FORUM_DB_CONN_MAX_AGE
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# ASGI 部署时 /api/ 请求的处理（见 asgi.py）
+FORUM_API_URLCONF = 'ai_forum_project.urls_api'  # 帖子列表/详情、当前用户使用异步视图
+# 接口使用 JWT 认证，不需要 session、messages、CSRF 等中间件
+FORUM_API_MIDDLEWARE = [
+    'forum_app.middleware.MetricsMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'forum_app.middleware.CompressionMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+# 响应压缩（forum_app/middleware.py，按 Accept-Encoding 协商 br / gzip）
+FORUM_COMPRESSION_MIN_BYTES = 1024          # 小于该长度的响应不压缩
+FORUM_COMPRESSION_GZIP_LEVEL = 6
+FORUM_COMPRESSION_BROTLI_QUALITY = 4        # 0-11；4 左右比 gzip 6 快，压缩率相近（需要安装 brotli）
+
+# 投票与热门排序（?sort=hot）：热度 = sign(v)·log10(max(|v|, 1)) + (发帖时间 - FORUM_HOT_EPOCH) / FORUM_HOT_DECAY_SECONDS
+# 其中 v = 帖子得分 + 回复数 × FORUM_HOT_REPLY_WEIGHT；修改后运行 repair_thread_counters 重新计算
+FORUM_HOT_DECAY_SECONDS = 45000             # 晚发这么多秒，相当于 v 大 10 倍
+FORUM_HOT_REPLY_WEIGHT = 1                  # 每条回复相当于几票
+FORUM_HOT_EPOCH = 1704067200                # 2024-01-01T00:00:00Z，只是让数值小一些，不影响排序
+
+# 监控与日志（forum_app/metrics.py、forum_app/log.py）
+FORUM_METRICS_TOKEN = None                  # 抓取端用 Authorization: Bearer <token> 访问 /api/metrics/ 和 worker 的指标端口
+FORUM_METRICS_PUBLIC = False                # 默认没有 token 时 /api/metrics/ 只对管理员（JWT）开放；只在内网可达时可设为 True 免认证
+FORUM_LOG_FORMAT = 'text'                   # 'text' 便于本地阅读；'json' 每行一个 JSON 对象（带 thread_id / job_id 等字段）
+FORUM_LOG_LEVEL = 'INFO'
+FORUM_AI_STREAM_USAGE = True                # 流式调用时请求返回 token 用量（stream_options）；兼容接口不支持时关闭
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'context': {'()': 'forum_app.log.ContextFilter'},
+    },
+    'formatters': {
+        'text': {'()': 'forum_app.log.TextFormatter'},
+        'json': {'()': 'forum_app.log.JSONFormatter'},
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'filters': ['context'],
+            'formatter': FORUM_LOG_FORMAT,
+        },
+    },
+    'loggers': {
+        'forum_app': {'handlers': ['console'], 'level': FORUM_LOG_LEVEL, 'propagate': False},
+    },
+}
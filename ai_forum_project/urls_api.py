@@ -0,0 +1,6 @@
+"""ASGI 部署时 /api/ 请求使用的 URLconf（FORUM_API_URLCONF，见 asgi.py）"""
+from django.urls import include, path
+
+urlpatterns = [
+    path('api/', include('forum_app.urls_async')),
+]
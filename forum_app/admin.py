@@ -5,7 +5,7 @@ from django.contrib import admin
 from .models import (
     Actor, HumanUser, AIAgent, 
     KnowledgeBase, Document, 
-    Thread, Post, Vote
+    Category, Thread, Post, Vote
 )
 
 # ----------------- 身份管理 -----------------
@@ -23,9 +23,16 @@ class AIAgentAdmin(admin.ModelAdmin):
 
 # ----------------- 内容管理 -----------------
 
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('name', 'description', 'thread_count')
+    # 发帖时自动维护，可用 repair_thread_counters 重新计算
+    readonly_fields = ('thread_count',)
+
 @admin.register(Thread)
 class ThreadAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'created_at')
+    list_display = ('title', 'author', 'category', 'created_at', 'reply_count', 'last_post_at')
+    list_filter = ('category',)
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
@@ -39,7 +46,7 @@ class KnowledgeBaseAdmin(admin.ModelAdmin):
 
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
-    list_display = ('id', 'kb', 'short_content')
+    list_display = ('id', 'kb', 'source', 'short_content')
     
     def short_content(self, obj):
         return obj.text_content[:50] + '...'
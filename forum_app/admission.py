@@ -0,0 +1,260 @@
+"""
+AI 生成的准入控制
+
+发帖/回帖时（admit_generation）：
+- 每个用户一个令牌桶（FORUM_AI_USER_BURST / FORUM_AI_USER_REFILL_PER_MINUTE），用完则本次不触发 AI（skipped）
+- 每个帖子一个令牌桶（FORUM_AI_THREAD_BURST / FORUM_AI_THREAD_REFILL_PER_MINUTE），用完则推迟到
+  有令牌时再生成（deferred），期间的新回复合并进同一轮
+- 排队中的任务超过 FORUM_AI_MAX_PENDING_JOBS 时直接放弃（skipped）
+人类的帖子/回复总会保存，是否触发 AI 由接口响应中的 ai.status 告知前端。
+
+调用模型时（llm_slot）：
+- 全局同时进行的模型调用不超过 FORUM_AI_MAX_INFLIGHT_CALLS（跨进程，基于 Postgres advisory lock，
+  连接断开时自动释放）；等待超过 FORUM_AI_CALL_SLOT_WAIT 秒则放弃该次调用
+"""
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import GenerationJob, RateLimitBucket
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+DEFERRED = 'deferred'
+SKIPPED = 'skipped'
+
+# advisory lock 的第一个键，与其他用途的 advisory lock 区分
+_SLOT_LOCK_CLASS = 0x464F5255  # 'FORU'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+class LLMBusy(RuntimeError):
+    """等待模型调用名额超时"""
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+# ==================== 令牌桶 ====================
+
+@dataclass
+class Admission:
+    status: str
+    reason: str = ''
+    retry_after: float = 0
+
+    @property
+    def admitted(self):
+        return self.status != SKIPPED
+
+    def as_dict(self):
+        data = {"status": self.status}
+        if self.reason:
+            data["reason"] = self.reason
+        if self.retry_after:
+            data["retry_after"] = round(self.retry_after, 1)
+        return data
+
+
+class _Exhausted(Exception):
+    def __init__(self, key, retry_after):
+        self.key = key
+        self.retry_after = retry_after
+
+
+def _take(key, burst, per_minute):
+    """从桶中取一个令牌；不足时抛出 _Exhausted（带预计可用的等待秒数）"""
+    rate = per_minute / 60.0
+    table = RateLimitBucket._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} AS b (key, tokens, updated_at) VALUES (%(key)s, %(burst)s - 1, now())
+            ON CONFLICT (key) DO UPDATE SET
+                tokens = LEAST(%(burst)s, b.tokens + %(rate)s * EXTRACT(EPOCH FROM now() - b.updated_at)) - 1,
+                updated_at = now()
+            WHERE LEAST(%(burst)s, b.tokens + %(rate)s * EXTRACT(EPOCH FROM now() - b.updated_at)) >= 1
+            RETURNING tokens
+            """,
+            {'key': key, 'burst': float(burst), 'rate': rate},
+        )
+        if cursor.fetchone() is not None:
+            return
+        cursor.execute(
+            f"SELECT LEAST(%s, tokens + %s * EXTRACT(EPOCH FROM now() - updated_at)) FROM {table} WHERE key = %s",
+            [float(burst), rate, key],
+        )
+        row = cursor.fetchone()
+    available = float(row[0]) if row else 0.0
+    raise _Exhausted(key, (1 - available) / rate if rate > 0 else 0)
+
+
+def admit_generation(user_id, thread_id=None):
+    """
+    发帖/回帖后决定是否触发一轮 AI 生成，返回 Admission
+    用户和帖子两个桶在同一事务中扣减：帖子桶不足而被推迟时，用户令牌照常扣减；
+    用户桶不足而被拒绝时不扣减任何令牌（也不检查帖子桶）
+    """
+    if not settings.FORUM_AI_ADMISSION_ENABLED:
+        return Admission(QUEUED)
+
+    pending = GenerationJob.objects.filter(status=GenerationJob.PENDING).count()
+    if pending >= settings.FORUM_AI_MAX_PENDING_JOBS:
+        _count('shed_overloaded')
+        return Admission(SKIPPED, 'overloaded', retry_after=30)
+
+    deferred = None
+    try:
+        # 按 用户→帖子 的固定顺序锁桶行；_take 令牌不足时不写入任何行，事务可以继续使用
+        with transaction.atomic():
+            _take(f'user:{user_id}', settings.FORUM_AI_USER_BURST, settings.FORUM_AI_USER_REFILL_PER_MINUTE)
+            if thread_id is not None:
+                try:
+                    _take(f'thread:{thread_id}', settings.FORUM_AI_THREAD_BURST,
+                          settings.FORUM_AI_THREAD_REFILL_PER_MINUTE)
+                except _Exhausted as e:
+                    deferred = e
+    except _Exhausted as e:
+        _count('shed_user_limit')
+        return Admission(SKIPPED, 'user_rate_limited', e.retry_after)
+
+    if deferred is not None:
+        _count('deferred_thread_limit')
+        return Admission(DEFERRED, 'thread_rate_limited', deferred.retry_after)
+    _count('admitted')
+    return Admission(QUEUED)
+
+
+# ==================== 全局模型调用上限 ====================
+
+class _LocalSlots:
+    """非 Postgres 数据库时退化为进程内信号量"""
+    _semaphore = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls):
+        with cls._lock:
+            if cls._semaphore is None:
+                cls._semaphore = threading.BoundedSemaphore(settings.FORUM_AI_MAX_INFLIGHT_CALLS)
+            return cls._semaphore
+
+
+def _try_slot(slot):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s, %s)", [_SLOT_LOCK_CLASS, slot])
+        return cursor.fetchone()[0]
+
+
+def _release_slot(raw, slot):
+    # 直接使用获取名额时的底层连接：流式调用的生成器可能在其他线程被回收，
+    # 而 Django 的连接包装不允许跨线程使用；锁必须在连接关闭或归还连接池之前释放
+    with raw.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_unlock(%s, %s)", [_SLOT_LOCK_CLASS, slot])
+
+
+@contextmanager
+def llm_slot():
+    """占用一个全局模型调用名额；等待超时抛出 LLMBusy"""
+    limit = settings.FORUM_AI_MAX_INFLIGHT_CALLS
+    if not limit:
+        yield
+        return
+    deadline = time.monotonic() + settings.FORUM_AI_CALL_SLOT_WAIT
+    started = time.monotonic()
+
+    if connection.vendor != 'postgresql':
+        if not _LocalSlots.get().acquire(timeout=settings.FORUM_AI_CALL_SLOT_WAIT):
+            _count('slot_timeouts')
+            raise LLMBusy('模型调用并发已满')
+        try:
+            _count('calls')
+            yield
+        finally:
+            _LocalSlots.get().release()
+        return
+
+    slot = None
+    delay = 0.05
+    while slot is None:
+        # 从随机位置开始尝试，减少多个等待者争抢同一个名额
+        offset = random.randrange(limit)
+        for i in range(limit):
+            candidate = (offset + i) % limit
+            if _try_slot(candidate):
+                slot = candidate
+                break
+        if slot is None:
+            if time.monotonic() >= deadline:
+                _count('slot_timeouts')
+                raise LLMBusy('模型调用并发已满')
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+    waited = time.monotonic() - started
+    if waited > 0.1:
+        _count('slot_waits')
+    raw = connection.connection
+    try:
+        _count('calls')
+        yield
+    finally:
+        try:
+            _release_slot(raw, slot)
+        except Exception as e:
+            # 解锁失败（如连接上的事务已中止）时连接仍持有会话级的锁，归还连接池后这个名额
+            # 直到进程重启都无法再用；关闭底层连接，由 Postgres 随会话释放锁
+            _count('slot_release_errors')
+            logger.warning(f"⚠️ 释放模型调用名额失败，关闭数据库连接: {e}", extra={'slot': slot})
+            try:
+                raw.close()
+            except Exception:
+                # 连接已断开时锁已随之释放
+                pass
+            if connection.connection is raw:
+                # 让 Django 丢弃这个已关闭的连接，本线程下一次查询重新建立连接
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+
+
+def inflight_calls():
+    """当前全局占用中的模型调用名额数"""
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND classid = %s AND granted",
+            [_SLOT_LOCK_CLASS],
+        )
+        return cursor.fetchone()[0]
+
+
+def admission_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    return {
+        "admitted": stats.get('admitted', 0),
+        "deferred_thread_limit": stats.get('deferred_thread_limit', 0),
+        "shed_user_limit": stats.get('shed_user_limit', 0),
+        "shed_overloaded": stats.get('shed_overloaded', 0),
+        "llm_calls": stats.get('calls', 0),
+        "llm_slot_waits": stats.get('slot_waits', 0),
+        "llm_slot_timeouts": stats.get('slot_timeouts', 0),
+        "llm_slot_release_errors": stats.get('slot_release_errors', 0),
+        "llm_inflight": inflight_calls(),
+        "llm_max_inflight": settings.FORUM_AI_MAX_INFLIGHT_CALLS,
+    }
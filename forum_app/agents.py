@@ -0,0 +1,165 @@
+"""
+AI 角色注册表与按相关性选择回复者
+
+- 注册表缓存在进程内：所有 AIAgent（已 prefetch 知识库）及其“画像”向量
+  （system_prompt + bio + 知识库名称/简介），不再每轮查库、每轮向量化
+- AIAgent / KnowledgeBase 保存、删除或知识库挂载变化时递增版本号（存放在 Django cache 中），
+  各进程下次选择时发现版本变化即重建；另有 FORUM_AI_AGENT_REGISTRY_TTL 兜底
+- 每轮按“最新对话内容”与画像的余弦相似度排序，相似度不低于 FORUM_AI_AGENT_MIN_SIMILARITY 的
+  角色最多选 FORUM_AI_AGENT_MAX_REPLIES 个；都不够相关时仍选最相关的 FORUM_AI_AGENT_MIN_REPLIES 个
+- 向量不可用时退回随机选择
+"""
+import logging
+import random
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import AIAgent
+from .rag import embed_query, embed_texts
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'forum:agents:registry_version'
+# 旧的随机策略每轮平均调用 4 次模型（3-5 个角色），用来估算节省的调用次数
+LEGACY_REPLIES_PER_ROUND = 4
+PROFILE_CHARS = 2000
+
+
+def agent_profile_text(agent):
+    """用于匹配话题的角色画像文本"""
+    parts = [agent.username, agent.system_prompt or '', agent.bio or '']
+    for kb in agent.knowledge_bases.all():
+        parts.append(f"{kb.name} {kb.description or ''}")
+    return '\n'.join(p.strip() for p in parts if p and p.strip())[:PROFILE_CHARS]
+
+
+class AgentRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._agents = None
+        self._matrix = None  # 每行一个归一化的画像向量；向量不可用时为 None
+        self._version = None
+        self._built_at = 0.0
+        self._stats = Counter()
+
+    # ---------- 缓存 ----------
+
+    def _current_version(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, 1, timeout=None)
+            version = cache.get(VERSION_KEY, 1)
+        return version
+
+    def _is_stale(self, version):
+        return (
+            self._agents is None
+            or version != self._version
+            or time.monotonic() - self._built_at > settings.FORUM_AI_AGENT_REGISTRY_TTL
+        )
+
+    def agents(self):
+        """返回 (agents, matrix)，必要时重建"""
+        version = self._current_version()
+        with self._lock:
+            if self._is_stale(version):
+                self._build(version)
+            return self._agents, self._matrix
+
+    def _build(self, version):
+        agents = list(AIAgent.objects.prefetch_related('knowledge_bases').order_by('pk'))
+        matrix = None
+        if agents and settings.FORUM_AI_AGENT_SELECTION == 'relevance':
+            try:
+                matrix = _normalize(np.asarray(embed_texts([agent_profile_text(a) for a in agents]), dtype=np.float32))
+            except Exception as e:
+                logger.warning(f"⚠️ AI 角色画像向量化失败，本次使用随机选择: {e}")
+        self._agents, self._matrix = agents, matrix
+        self._version, self._built_at = version, time.monotonic()
+        self._stats['rebuilds'] += 1
+        logger.info(f"📇 AI 角色注册表已加载：{len(agents)} 个角色")
+
+    def invalidate(self):
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.add(VERSION_KEY, 2, timeout=None)
+        with self._lock:
+            self._agents = None
+
+    # ---------- 选择 ----------
+
+    def select(self, content):
+        """按与 content 的相关性选择本轮回复的角色，返回 [(agent, score), ...]"""
+        agents, matrix = self.agents()
+        if not agents:
+            return []
+        max_replies = max(1, settings.FORUM_AI_AGENT_MAX_REPLIES)
+        min_replies = min(settings.FORUM_AI_AGENT_MIN_REPLIES, max_replies)
+
+        embedding = embed_query(content) if matrix is not None and content.strip() else None
+        if embedding is None:
+            picked = [(agent, None) for agent in random.sample(agents, min(max_replies, len(agents)))]
+            self._record(len(agents), len(picked), gated=0, fallback=True)
+            return picked
+
+        query = _normalize(np.asarray([embedding], dtype=np.float32))[0]
+        scores = matrix @ query
+        # 相似度相同时随机排序，避免总是同一个角色
+        order = np.lexsort((np.random.random(len(scores)), -scores))
+        threshold = settings.FORUM_AI_AGENT_MIN_SIMILARITY
+        relevant = [i for i in order if scores[i] >= threshold]
+        chosen = relevant[:max_replies]
+        if len(chosen) < min_replies:
+            chosen = list(order[:min_replies])
+        self._record(len(agents), len(chosen), gated=len(agents) - len(relevant), fallback=False)
+        return [(agents[i], float(scores[i])) for i in chosen]
+
+    # ---------- 统计 ----------
+
+    def _record(self, considered, selected, gated, fallback):
+        baseline = min(LEGACY_REPLIES_PER_ROUND, considered)
+        with self._lock:
+            self._stats['rounds'] += 1
+            self._stats['considered'] += considered
+            self._stats['selected'] += selected
+            self._stats['gated'] += gated
+            self._stats['calls_saved'] += max(0, baseline - selected)
+            if fallback:
+                self._stats['random_fallbacks'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            agents = len(self._agents) if self._agents is not None else None
+        rounds = stats.get('rounds', 0)
+        return {
+            "agents": agents,
+            "rounds": rounds,
+            "selected": stats.get('selected', 0),
+            "gated": stats.get('gated', 0),
+            "calls_saved": stats.get('calls_saved', 0),
+            "avg_selected_per_round": round(stats.get('selected', 0) / rounds, 3) if rounds else 0,
+            "avg_calls_saved_per_round": round(stats.get('calls_saved', 0) / rounds, 3) if rounds else 0,
+            "random_fallbacks": stats.get('random_fallbacks', 0),
+            "rebuilds": stats.get('rebuilds', 0),
+        }
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+registry = AgentRegistry()
+
+
+def invalidate_agent_registry(**kwargs):
+    """信号处理函数：角色或知识库变化后（事务提交后）让所有进程重建注册表"""
+    transaction.on_commit(registry.invalidate)
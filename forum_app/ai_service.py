@@ -0,0 +1,154 @@
+"""
+OpenAI 兼容接口的封装（对话生成 + 文本向量）
+
+配置来自环境变量：
+- OPENAI_API_KEY
+- OPENAI_API_BASE（兼容站点地址，可选）
+- OPENAI_EMBEDDING_MODEL（可选，默认 text-embedding-3-small，维度 1536）
+"""
+import logging
+import os
+import time
+
+from django.conf import settings
+from openai import OpenAI
+
+from . import metrics
+from .admission import LLMBusy, llm_slot
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_REPLY = "（AI 暂时无法回复，请稍后再试）"
+
+
+def _record_usage(usage, model, agent):
+    # 兼容接口不一定返回用量，没有时不记录
+    if usage is None:
+        return
+    metrics.LLM_TOKENS.inc(usage.prompt_tokens or 0, model=model, agent=agent, kind='prompt')
+    metrics.LLM_TOKENS.inc(usage.completion_tokens or 0, model=model, agent=agent, kind='completion')
+
+
+class AIService:
+    def __init__(self, api_key=None, base_url=None):
+        self.client = OpenAI(
+            api_key=api_key or os.getenv('OPENAI_API_KEY'),
+            base_url=base_url or os.getenv('OPENAI_API_BASE') or None,
+        )
+        self.embedding_model = os.getenv('OPENAI_EMBEDDING_MODEL', 'text-embedding-3-small')
+
+    def chat(self, model, system_message, user_message, temperature=0.8, max_tokens=2000, raise_on_error=False,
+             agent=''):
+        """agent 只用于指标和日志（区分是哪个角色/用途发起的调用）"""
+        # 全局模型调用名额（admission.llm_slot），等待超时抛出 LLMBusy，由调用方跳过本次生成
+        try:
+            with llm_slot():
+                return self._chat(model, system_message, user_message, temperature, max_tokens, raise_on_error, agent)
+        except LLMBusy:
+            metrics.LLM_REQUESTS.inc(model=model, agent=agent, outcome='busy')
+            raise
+
+    def _chat(self, model, system_message, user_message, temperature, max_tokens, raise_on_error, agent):
+        log_fields = {'model': model, 'agent': agent}
+        started = time.perf_counter()
+        try:
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": user_message},
+                ],
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+            content = response.choices[0].message.content or ""
+        except Exception as e:
+            metrics.LLM_REQUESTS.inc(model=model, agent=agent, outcome='error')
+            logger.error(f"💥 AI 调用失败: {e}", extra=log_fields)
+            if raise_on_error:
+                raise
+            return FALLBACK_REPLY
+        elapsed = time.perf_counter() - started
+        metrics.LLM_REQUESTS.inc(model=model, agent=agent, outcome='ok')
+        metrics.LLM_SECONDS.observe(elapsed, model=model, agent=agent)
+        _record_usage(response.usage, model, agent)
+        logger.info("✅ AI 回复成功", extra={**log_fields, 'chars': len(content), 'seconds': round(elapsed, 3)})
+        return content
+
+    def chat_stream(self, model, system_message, user_message, temperature=0.8, max_tokens=2000, agent=''):
+        """流式生成，逐段 yield 文本片段（整个流期间占用一个全局调用名额）"""
+        try:
+            with llm_slot():
+                yield from self._chat_stream(model, system_message, user_message, temperature, max_tokens, agent)
+        except LLMBusy:
+            metrics.LLM_REQUESTS.inc(model=model, agent=agent, outcome='busy')
+            raise
+
+    def _chat_stream(self, model, system_message, user_message, temperature, max_tokens, agent):
+        log_fields = {'model': model, 'agent': agent}
+        extra_args = {'stream_options': {'include_usage': True}} if settings.FORUM_AI_STREAM_USAGE else {}
+        started = time.perf_counter()
+        first_token = None
+        chars = 0
+        try:
+            stream = self.client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": user_message},
+                ],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                **extra_args,
+            )
+            try:
+                for chunk in stream:
+                    # 开启 include_usage 时最后一个 chunk 只有用量，没有 choices
+                    if getattr(chunk, 'usage', None) is not None:
+                        _record_usage(chunk.usage, model, agent)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if first_token is None:
+                            first_token = time.perf_counter() - started
+                            metrics.LLM_FIRST_TOKEN_SECONDS.observe(first_token, model=model, agent=agent)
+                        chars += len(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            finally:
+                # 调用方中途关闭生成器（GeneratorExit）时也断开与模型接口的连接
+                stream.close()
+        except Exception as e:
+            metrics.LLM_REQUESTS.inc(model=model, agent=agent, outcome='error')
+            logger.error(f"💥 AI 调用失败: {e}", extra=log_fields)
+            yield FALLBACK_REPLY
+            return
+        elapsed = time.perf_counter() - started
+        metrics.LLM_REQUESTS.inc(model=model, agent=agent, outcome='ok')
+        metrics.LLM_SECONDS.observe(elapsed, model=model, agent=agent)
+        logger.info("✅ AI 流式回复完成", extra={
+            **log_fields, 'chars': chars, 'seconds': round(elapsed, 3),
+            'first_token_seconds': round(first_token, 3) if first_token is not None else None,
+        })
+
+    def get_embedding(self, text):
+        try:
+            response = self.client.embeddings.create(model=self.embedding_model, input=text)
+            return response.data[0].embedding
+        except Exception as e:
+            logger.error(f"💥 向量生成失败: {e}")
+            return None
+
+    def get_embeddings(self, texts):
+        """批量向量化，失败时抛出异常（由调用方决定重试）"""
+        response = self.client.embeddings.create(model=self.embedding_model, input=list(texts))
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+_service = None
+
+
+def get_ai_service():
+    """进程内共享同一个 AIService 实例"""
+    global _service
+    if _service is None:
+        _service = AIService()
+    return _service
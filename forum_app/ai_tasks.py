@@ -0,0 +1,175 @@
+"""
+一轮 AI 回复生成（由 jobs.py 中的 worker 调用）
+
+FORUM_AI_REPLY_MODE:
+- 'concurrent' 被选中的 AI 共享同一份对话历史，并发调用模型，谁先完成谁先发帖
+- 'chained'    依次生成，后一个 AI 能看到前一个 AI 的回复（旧行为）
+"""
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import metrics
+from .admission import LLMBusy
+from .agents import registry as agent_registry
+from .context import build_conversation_context
+from .events import publish, TokenBuffer
+from .models import Post, Thread
+from .rag import rag_query, retrieve_for_agents
+from .serializers import PostSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def generate_replies(thread_id):
+    """按与最新对话内容的相关性挑选 AI 角色（见 agents.py），基于对话历史生成回复，返回写入的回复"""
+    thread = Thread.objects.select_related('author').get(id=thread_id)
+
+    # 楼主内容 + 早前讨论摘要 + 预算内最新的回复（纯文本）
+    conversation_history, message_count = build_conversation_context(thread)
+
+    # 选角色和知识库检索使用同一段查询文本，向量只计算一次（有缓存）
+    query = rag_query(conversation_history)
+    selection = agent_registry.select(query)
+    if not selection:
+        return []
+    selected_agents = [agent for agent, _ in selection]
+
+    logger.info(
+        f"🤖 读取了 {message_count} 条历史消息，选中 "
+        + "、".join(agent.username if score is None else f"{agent.username}({score:.2f})" for agent, score in selection)
+        + "，正在思考...",
+        extra={'messages': message_count, 'agents': [agent.username for agent in selected_agents]},
+    )
+
+    # 本轮所有 AI 共用一次知识库检索（一次向量化 + 一次查询）
+    try:
+        snippets = retrieve_for_agents(query, selected_agents)
+    except Exception as e:
+        logger.warning(f"⚠️ 知识库检索失败: {e}")
+        snippets = {}
+
+    if settings.FORUM_AI_REPLY_MODE == 'chained':
+        posts = _generate_chained(thread, selected_agents, conversation_history, snippets)
+    else:
+        posts = _generate_concurrent(thread, selected_agents, conversation_history, snippets)
+
+    logger.info(f"✅ AI 回复生成完成：{len(posts)}/{len(selected_agents)} 条")
+    return posts
+
+
+def _commit_reply(thread, agent, reply_text):
+    with transaction.atomic():
+        post = Post.objects.create(
+            thread=thread,
+            author=agent.actor_ptr,
+            content=reply_text
+        )
+        Thread.record_post(post)
+    publish(thread.id, 'post_committed', PostSerializer(post).data)
+    metrics.AI_REPLIES.inc(agent=agent.username, outcome='posted')
+    logger.info("💬 AI 回复已写入", extra={'agent': agent.username, 'post_id': post.id})
+    return post
+
+
+class RoundAbandoned(Exception):
+    """本轮已超时放弃：仍在进行的调用收到下一段文本时抛出，停止生成并释放调用名额"""
+
+
+def _generate_one(thread_id, agent, conversation_history, rag_snippets, abandoned=None):
+    publish(thread_id, 'agent_started', {'agent': agent.username})
+    tokens = TokenBuffer(thread_id, agent.username)
+
+    def on_token(text):
+        # 从流式循环中抛出：关闭流（连同 llm_slot）并且不再发布不会提交的回复片段
+        if abandoned is not None and abandoned.is_set():
+            raise RoundAbandoned(agent.username)
+        tokens(text)
+
+    reply_text = agent.generate_reply(
+        full_conversation_context=conversation_history,
+        on_token=on_token,
+        rag_snippets=rag_snippets,
+    )
+    tokens.flush()
+    return reply_text
+
+
+def _generate_chained(thread, agents, conversation_history, snippets):
+    posts = []
+    for agent in agents:
+        try:
+            reply_text = _generate_one(thread.id, agent, conversation_history, snippets.get(agent.pk, []))
+        except LLMBusy as e:
+            _skipped(agent, e)
+            continue
+        except Exception as e:
+            # 与并发模式一致：一个角色失败不影响后面的角色
+            metrics.AI_REPLIES.inc(agent=agent.username, outcome='failed')
+            logger.exception(f"💥 {agent.username} 生成失败: {e}", extra={'agent': agent.username})
+            continue
+        posts.append(_commit_reply(thread, agent, reply_text))
+        conversation_history += f"{agent.username}: {reply_text}\n"
+    return posts
+
+
+def _skipped(agent, error):
+    metrics.AI_REPLIES.inc(agent=agent.username, outcome='busy')
+    logger.warning(f"🚦 {agent.username} 跳过: {error}", extra={'agent': agent.username})
+
+
+def _generate_in_pool(thread_id, agent, conversation_history, rag_snippets, abandoned):
+    try:
+        return _generate_one(thread_id, agent, conversation_history, rag_snippets, abandoned)
+    except RoundAbandoned:
+        logger.info(f"⏹️ {agent.username} 的调用已随本轮超时停止", extra={'agent': agent.username})
+        return None
+    finally:
+        # 线程池中的线程各自持有数据库连接，线程结束前释放
+        connection.close()
+
+
+def _generate_concurrent(thread, agents, conversation_history, snippets):
+    max_workers = max(1, min(settings.FORUM_AI_ROUND_CONCURRENCY, len(agents)))
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'ai-round-{thread.id}')
+    abandoned = threading.Event()
+    # 每个任务复制一份当前上下文，线程池中的日志也带上 job_id / thread_id
+    futures = {
+        executor.submit(
+            contextvars.copy_context().run,
+            _generate_in_pool, thread.id, agent, conversation_history, snippets.get(agent.pk, []), abandoned
+        ): agent
+        for agent in agents
+    }
+    posts = []
+    try:
+        pending = set(futures)
+        timeout = settings.FORUM_AI_ROUND_TIMEOUT
+        deadline = time.monotonic() + timeout
+        while pending:
+            done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                names = [futures[f].username for f in pending]
+                for name in names:
+                    metrics.AI_REPLIES.inc(agent=name, outcome='timeout')
+                logger.warning(f"⏱️ 本轮生成超时（{timeout}s），放弃: {', '.join(names)}", extra={'agents': names})
+                break
+            for future in done:
+                agent = futures[future]
+                try:
+                    posts.append(_commit_reply(thread, agent, future.result()))
+                except LLMBusy as e:
+                    _skipped(agent, e)
+                except Exception as e:
+                    metrics.AI_REPLIES.inc(agent=agent.username, outcome='failed')
+                    logger.exception(f"💥 {agent.username} 生成失败: {e}", extra={'agent': agent.username})
+    finally:
+        # 不再等待超时的调用：它们在收到下一段文本时停止（见 _generate_one），结果直接丢弃
+        abandoned.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    return posts
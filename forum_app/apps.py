@@ -4,3 +4,28 @@ from django.apps import AppConfig
 class ForumAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'forum_app'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import m2m_changed, post_delete, post_save
+
+        from .agents import invalidate_agent_registry
+        from .db import count_connection
+        from .metrics import instrument_connection
+        from .models import AIAgent, KnowledgeBase, Thread
+        from .models.content_models import thread_deleted
+
+        # 角色、知识库以及挂载关系变化时重建 AI 角色注册表
+        for model in (AIAgent, KnowledgeBase):
+            post_save.connect(invalidate_agent_registry, sender=model, dispatch_uid=f'agent_registry_save_{model.__name__}')
+            post_delete.connect(invalidate_agent_registry, sender=model, dispatch_uid=f'agent_registry_delete_{model.__name__}')
+        m2m_changed.connect(invalidate_agent_registry, sender=AIAgent.knowledge_bases.through,
+                            dispatch_uid='agent_registry_knowledge_bases')
+
+        # 删除帖子（含级联删除）后更新分类帖子数
+        post_delete.connect(thread_deleted, sender=Thread, dispatch_uid='thread_category_count')
+
+        # 统计本进程建立数据库连接的次数（/api/db/stats/）
+        connection_created.connect(count_connection, dispatch_uid='forum_db_connection_count')
+        # 为每个数据库连接挂上 SQL 计时（/api/metrics/）
+        connection_created.connect(instrument_connection, dispatch_uid='forum_db_query_metrics')
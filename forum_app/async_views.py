@@ -0,0 +1,153 @@
+"""
+高频轮询读接口的异步版本（帖子列表、帖子详情、当前用户），以及 SSE 实时事件流
+
+只在 ASGI 部署（asgi.py）下使用：/api/ 请求由 APIHandler 按 FORUM_API_URLCONF（urls_async.py）解析，
+这里的视图优先于 views.py 中的同名同步视图。缓存命中时不占用线程，只有查库时才交给 Django 的异步 ORM。
+WSGI 下每个异步视图都要新建一次事件循环，反而更慢，因此 urls.py 仍使用同步视图；
+SSE 事件流在 WSGI 下会一直占住线程，urls.py 中只有返回 204 的占位视图。
+
+DRF 的 @api_view 不支持 async def，这里直接返回 HttpResponse，输出与同步视图相同。
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from .authentication import aauthenticate
+from .db import release_connection
+from .events import broker
+from .models import Post, Thread
+from .renderers import dumps
+from .pagination import InvalidCursor, akeyset_paginate, get_page_size
+from .response_cache import response_cache
+from .serializers import (
+    POST_VALUES, THREAD_LIST_VALUES, THREAD_VALUES, absolute_avatar_url, serialize_posts, serialize_thread,
+    serialize_thread_list,
+)
+from .views import THREAD_SORT_FIELDS, _cache_key, _parse_category
+
+
+def _json(data, status=200):
+    # 与 DRF 的 JSONRenderer 输出一致（见 renderers.dumps）
+    return HttpResponse(dumps(data), status=status, content_type='application/json')
+
+
+@require_GET
+async def api_get_threads(request):
+    # 回复数、最后活动、得分都是 Thread 上的冗余字段，列表页不再聚合 Post 表
+    # ?sort=activity 按最后回复时间排序，?sort=hot 按热度排序，默认按发帖时间；?category=<id> 只看一个分类
+    field = THREAD_SORT_FIELDS.get(request.GET.get('sort'), 'created_at')
+    try:
+        category = _parse_category(request.GET.get('category'))
+    except ValueError:
+        return _json({"error": "无效的分类"}, status=400)
+
+    async def build():
+        threads = Thread.objects.values(*THREAD_LIST_VALUES)
+        if category is not None:
+            threads = threads.filter(category_id=category)
+        rows, next_cursor, prev_cursor = await akeyset_paginate(threads, request, field=field)
+        return {
+            "results": serialize_thread_list(rows, request),
+            "next_cursor": next_cursor,
+            "prev_cursor": prev_cursor,
+        }
+
+    key = _cache_key(request, 'threads', await response_cache.alist_version())
+    try:
+        data = await response_cache.aget_or_build(key, build, settings.FORUM_RESPONSE_CACHE_LIST_TTL)
+    except InvalidCursor as e:
+        return _json({"error": str(e)}, status=400)
+    return _json(data)
+
+
+@require_GET
+async def api_get_single_thread(request, thread_id):
+    # 用一次主键查询拿到版本号，版本号不变时直接返回缓存
+    version = await Thread.objects.filter(id=thread_id).values_list('version', flat=True).afirst()
+    if version is None:
+        return _json({"error": "帖子不存在"}, status=404)
+
+    async def build():
+        thread = await Thread.objects.filter(id=thread_id).values(*THREAD_VALUES).afirst()
+        if thread is None:
+            raise Thread.DoesNotExist
+        posts = Post.objects.filter(thread_id=thread_id).values(*POST_VALUES)
+        page_size = get_page_size(request, default=settings.FORUM_THREAD_POSTS_PAGE_SIZE)
+        rows, older_cursor, newer_cursor = await akeyset_paginate(posts, request, page_size=page_size)
+        data = serialize_thread(thread, request)
+        # 分页按时间倒序取，展示时按时间正序
+        data["posts"] = serialize_posts(rows[::-1], request)
+        data["posts_older_cursor"] = older_cursor
+        data["posts_newer_cursor"] = newer_cursor
+        return data
+
+    key = _cache_key(request, f'thread:{thread_id}', version)
+    try:
+        data = await response_cache.aget_or_build(key, build, settings.FORUM_RESPONSE_CACHE_DETAIL_TTL)
+    except Thread.DoesNotExist:
+        return _json({"error": "帖子不存在"}, status=404)
+    except InvalidCursor as e:
+        return _json({"error": str(e)}, status=400)
+    return _json(data)
+
+
+@require_GET
+async def api_current_user(request):
+    """获取当前登录用户信息（通过token）"""
+    user = await aauthenticate(request)
+    if user is None:
+        response = _json({"error": "Token无效或已过期"}, status=401)
+        response['WWW-Authenticate'] = 'Bearer realm="api"'
+        return response
+    return _json({
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "avatar": absolute_avatar_url(request, user.avatar)
+    })
+
+
+# ==================== 实时事件 (SSE) ====================
+
+def _sse_message(event, data):
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+@require_GET
+async def api_thread_events(request, thread_id):
+    """
+    SSE：推送 AI 生成过程中的事件（agent_started / token / post_committed / generation_finished）
+
+    需要通过 asgi.py 部署（如 uvicorn），每个空闲连接只是事件循环里的一个协程。
+    """
+    if not await Thread.objects.filter(pk=thread_id).aexists():
+        return _json({"error": "帖子不存在"}, status=404)
+
+    async def event_stream():
+        queue = broker.subscribe(thread_id)
+        try:
+            # 先订阅再读取状态，避免两者之间的事件丢失
+            state = await Thread.objects.filter(pk=thread_id).values('ai_generating', 'version').afirst()
+            # 推送期间不再查库，立即归还连接，空闲的 SSE 连接不占用数据库连接
+            await sync_to_async(release_connection)()
+            yield _sse_message('state', {**state, 'pacing_ms': settings.FORUM_AI_DISPLAY_PACING_MS})
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # 心跳，防止代理断开空闲连接
+                    yield ": ping\n\n"
+                    continue
+                yield _sse_message(message['event'], message['data'])
+        finally:
+            broker.unsubscribe(thread_id, queue)
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
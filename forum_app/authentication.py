@@ -0,0 +1,48 @@
+"""
+不经过 DRF 的视图中的 JWT 认证
+
+DRF 的 @api_view 不支持 async def，异步视图不经过 DRF 的认证流程。这里按与
+JWTAuthentication 相同的规则校验 Authorization 头，用户通过异步 ORM 读取。
+普通 Django 视图（如 /api/metrics/）用同步版本 authenticate()。
+"""
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+def authenticate(request):
+    """返回请求携带的 token 对应的用户；未携带或无效时返回 None"""
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+async def aauthenticate(request):
+    """返回请求携带的 token 对应的用户；未携带或无效时返回 None"""
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    if header is None:
+        return None
+    raw_token = auth.get_raw_token(header)
+    if raw_token is None:
+        return None
+    try:
+        token = auth.get_validated_token(raw_token)
+        user_id = token[api_settings.USER_ID_CLAIM]
+    except (InvalidToken, TokenError, KeyError):
+        return None
+
+    user = await auth.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).afirst()
+    if user is None:
+        return None
+    if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        return None
+    if api_settings.CHECK_REVOKE_TOKEN and (
+        token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+    ):
+        return None
+    return user
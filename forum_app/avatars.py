@@ -0,0 +1,179 @@
+"""
+头像上传处理
+
+解码、缩放、编码都在独立的进程池中进行（FORUM_AVATAR_WORKERS 个进程），请求线程只做校验和等待：
+- 解码前检查字节数（FORUM_AVATAR_MAX_BYTES）、格式和像素数（FORUM_AVATAR_MAX_PIXELS），此时只读取了文件头
+- JPEG 使用 draft 模式，解码时直接按 1/2、1/4、1/8 缩小，大照片不必完整解码
+- 排队中的任务数有上限（FORUM_AVATAR_MAX_PENDING），单张图片处理超时（FORUM_AVATAR_TIMEOUT）后放弃
+- 一次生成 FORUM_AVATAR_SIZES 中的所有尺寸并入库，读取时按 ?size= 直接返回
+
+注意：本模块会在子进程中导入，不能在模块级别导入 Django 模型。
+"""
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from PIL import Image, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+CONTENT_TYPE = 'image/jpeg'
+
+
+class AvatarError(ValueError):
+    """图片本身不合格（返回 400）"""
+
+
+class AvatarBusy(RuntimeError):
+    """处理能力不足或超时（返回 503）"""
+
+
+# ---------- 读取与校验（请求线程） ----------
+
+def read_upload(request):
+    """
+    取出上传的原始字节：优先 multipart 的 avatar 文件，其次 JSON 中的 base64（兼容旧客户端）
+    两种方式都在解码前检查大小
+    """
+    max_bytes = settings.FORUM_AVATAR_MAX_BYTES
+    upload = request.FILES.get('avatar')
+    if upload is not None:
+        if upload.size > max_bytes:
+            raise AvatarError(f'图片不能超过 {max_bytes // 1024 // 1024}MB')
+        return upload.read()
+
+    value = request.data.get('avatar')
+    if not value or not isinstance(value, str):
+        raise AvatarError('请提供头像数据')
+    # 移除 data:image/xxx;base64, 前缀（如果有）
+    if ',' in value:
+        value = value.split(',', 1)[1]
+    if len(value) > (max_bytes + 2) // 3 * 4:
+        raise AvatarError(f'图片不能超过 {max_bytes // 1024 // 1024}MB')
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        raise AvatarError('头像数据不是有效的 base64')
+
+
+def _open_checked(data, max_pixels):
+    """只读文件头，检查格式和像素数后返回尚未解码的 Image"""
+    try:
+        image = Image.open(io.BytesIO(data))
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise AvatarError('无法识别的图片格式')
+    if image.format not in ALLOWED_FORMATS:
+        raise AvatarError(f"不支持的图片格式，仅支持 {', '.join(sorted(ALLOWED_FORMATS))}")
+    width, height = image.size
+    if width * height > max_pixels:
+        raise AvatarError(f'图片尺寸过大（{width}x{height}）')
+    return image
+
+
+def inspect_upload(data):
+    """请求线程中的快速校验，不合格的图片不进入进程池"""
+    _open_checked(data, settings.FORUM_AVATAR_MAX_PIXELS)
+
+
+# ---------- 渲染（子进程） ----------
+
+def render_avatar(data, sizes, max_pixels, quality):
+    """
+    生成各尺寸的 JPEG，返回 [(size, bytes), ...]（从大到小）
+    在进程池中运行，参数和返回值都是可 pickle 的普通对象
+    """
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    image = _open_checked(data, max_pixels)
+    largest = max(sizes)
+    if image.format == 'JPEG':
+        # 解码时直接缩小到不小于目标尺寸的 1/2^n
+        image.draft('RGB', (largest, largest))
+
+    # 转换为 RGB（处理 PNG 透明度），GIF 只取第一帧
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    image.thumbnail((largest, largest), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    renditions = []
+    for size in sorted(set(sizes), reverse=True):
+        # 每个尺寸从上一级结果缩小，代价随尺寸递减
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=quality, optimize=True)
+        renditions.append((size, buffer.getvalue()))
+    return renditions
+
+
+# ---------- 进程池 ----------
+
+_pool = None
+_slots = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool, _slots
+    with _pool_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(settings.FORUM_AVATAR_MAX_PENDING)
+        if _pool is None and settings.FORUM_AVATAR_WORKERS > 0:
+            # spawn：web 进程中有数据库连接和后台线程，不适合 fork
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.FORUM_AVATAR_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool, _slots
+
+
+def _discard_pool(pool):
+    """超时的任务无法单独取消，整个进程池作废，下次请求重新创建"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    for process in list(getattr(pool, '_processes', {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def process_avatar(data):
+    """校验并生成各尺寸头像，返回 (版本哈希, [(size, bytes), ...])"""
+    inspect_upload(data)
+    args = (data, tuple(settings.FORUM_AVATAR_SIZES), settings.FORUM_AVATAR_MAX_PIXELS,
+            settings.FORUM_AVATAR_QUALITY)
+    pool, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        raise AvatarBusy('头像处理繁忙，请稍后重试')
+    try:
+        if pool is None:
+            # FORUM_AVATAR_WORKERS = 0：在当前进程处理（开发/测试）
+            renditions = render_avatar(*args)
+        else:
+            future = pool.submit(render_avatar, *args)
+            try:
+                renditions = future.result(timeout=settings.FORUM_AVATAR_TIMEOUT)
+            except FutureTimeout:
+                logger.warning(f"⏱️ 头像处理超时（{len(data)} 字节），重建进程池")
+                _discard_pool(pool)
+                raise AvatarBusy('头像处理超时')
+            except BrokenProcessPool:
+                _discard_pool(pool)
+                raise AvatarBusy('头像处理进程异常退出，请重试')
+    finally:
+        slots.release()
+    # 最大尺寸的内容哈希作为版本号（地址中的 ?v=）
+    version = hashlib.sha256(renditions[0][1]).hexdigest()
+    return version, renditions
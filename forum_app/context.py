@@ -0,0 +1,198 @@
+"""
+AI 回复用的对话上下文构建
+
+- 每个帖子在缓存中保留一个「最近回复窗口」（纯文本 + 估算的 token 数），
+  有新回复时只追加新行，不再每轮从头拼接
+- 窗口按 FORUM_AI_CONTEXT_TOKEN_BUDGET 截断，总是保留最新的回复
+- 被挤出窗口的旧回复在后台合并进 ThreadSummary 的滚动摘要，长帖子的提示词长度保持有界
+"""
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .models import Post, ThreadSummary
+
+logger = logging.getLogger(__name__)
+
+_CJK_RE = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+CACHE_TIMEOUT = 60 * 60
+FETCH_BATCH = 50
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中日韩字符约 1 字 1 token，其余约 4 字符 1 token"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text, max_tokens):
+    """截断到估算 token 数不超过 max_tokens；预算不足一个 token 时返回空串"""
+    if max_tokens <= 0:
+        return ''
+    tokens = estimate_tokens(text)
+    while tokens > max_tokens and text:
+        # 按比例估计截断位置，并且每次至少去掉一个字符，循环一定结束
+        text = text[:max(0, min(len(text) - 1, int(len(text) * max_tokens / tokens) - 1))]
+        tokens = estimate_tokens(text)
+    return text
+
+
+def _cache_key(thread_id):
+    return f'forum:context:{thread_id}'
+
+
+def _format_line(author_name, plain_text):
+    # plain_text 在保存回复时已经算好，这里不再解析 HTML
+    line = f"{author_name}: {plain_text}"
+    return line, estimate_tokens(line)
+
+
+def _initial_window(thread_id, summarized_until, budget):
+    """缓存未命中：从最新的回复往前读，直到填满预算"""
+    lines, used = [], 0
+    dropped_until = 0
+    before_id = None
+    while True:
+        qs = Post.objects.filter(thread_id=thread_id, id__gt=summarized_until)
+        if before_id is not None:
+            qs = qs.filter(id__lt=before_id)
+        batch = list(qs.order_by('-id').values_list('id', 'author__username', 'plain_text')[:FETCH_BATCH])
+        for post_id, author_name, plain_text in batch:
+            line, tokens = _format_line(author_name, plain_text)
+            if used + tokens > budget and lines:
+                # 更早的回复放不下了，交给摘要处理
+                dropped_until = post_id
+                lines.reverse()
+                return lines, dropped_until
+            lines.append((post_id, line, tokens))
+            used += tokens
+        if len(batch) < FETCH_BATCH:
+            break
+        before_id = batch[-1][0]
+    lines.reverse()
+    return lines, dropped_until
+
+
+def _load_window(thread_id, summarized_until, budget):
+    entry = cache.get(_cache_key(thread_id))
+    if entry is None or entry['summarized_until'] != summarized_until:
+        lines, dropped_until = _initial_window(thread_id, summarized_until, budget)
+        entry = {
+            'summarized_until': summarized_until,
+            'last_post_id': lines[-1][0] if lines else summarized_until,
+            'dropped_until': dropped_until,
+            'lines': lines,
+        }
+    else:
+        # 缓存命中：只读取新回复并追加
+        new_posts = Post.objects.filter(
+            thread_id=thread_id, id__gt=entry['last_post_id']
+        ).order_by('id').values_list('id', 'author__username', 'plain_text')
+        for post_id, author_name, plain_text in new_posts:
+            line, tokens = _format_line(author_name, plain_text)
+            entry['lines'].append((post_id, line, tokens))
+            entry['last_post_id'] = post_id
+
+    # 从最旧的一端裁剪，保证窗口在预算内（至少保留最新一条）
+    used = sum(tokens for _, _, tokens in entry['lines'])
+    while used > budget and len(entry['lines']) > 1:
+        post_id, _, tokens = entry['lines'].pop(0)
+        entry['dropped_until'] = max(entry['dropped_until'], post_id)
+        used -= tokens
+
+    cache.set(_cache_key(thread_id), entry, CACHE_TIMEOUT)
+    return entry
+
+
+def build_conversation_context(thread):
+    """
+    返回 (context, post_count)：楼主内容 + 早前讨论摘要 + 预算内最新的若干条回复
+    """
+    budget = settings.FORUM_AI_CONTEXT_TOKEN_BUDGET
+    head_text = truncate_to_tokens(thread.plain_text, settings.FORUM_AI_CONTEXT_HEAD_TOKENS)
+    context = f"【楼主】{thread.author.username}: {head_text}\n"
+
+    summary = ThreadSummary.objects.filter(thread_id=thread.id).values('text', 'summarized_until').first()
+    summarized_until = summary['summarized_until'] if summary else 0
+    if summary and summary['text']:
+        context += f"【早前讨论摘要】{summary['text']}\n"
+
+    remaining = max(1, budget - estimate_tokens(context))
+    entry = _load_window(thread.id, summarized_until, remaining)
+    for _, line, _ in entry['lines']:
+        context += line + "\n"
+
+    if entry['dropped_until'] > summarized_until:
+        schedule_summary_refresh(thread.id, entry['dropped_until'])
+
+    return context, len(entry['lines']) + 1
+
+
+# ==================== 后台摘要 ====================
+
+_summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ai-summary')
+_inflight = set()
+_inflight_lock = threading.Lock()
+
+
+def schedule_summary_refresh(thread_id, until_post_id):
+    """把 (已摘要位置, until_post_id] 之间的回复合并进摘要；同一帖子同时只跑一个"""
+    with _inflight_lock:
+        if thread_id in _inflight:
+            return
+        _inflight.add(thread_id)
+    _summary_executor.submit(_refresh_summary, thread_id, until_post_id)
+
+
+def _refresh_summary(thread_id, until_post_id):
+    from .ai_service import get_ai_service
+
+    try:
+        summary, _ = ThreadSummary.objects.get_or_create(thread_id=thread_id)
+        chunk_budget = settings.FORUM_AI_CONTEXT_TOKEN_BUDGET
+        while summary.summarized_until < until_post_id:
+            # 每次最多取一个预算量的旧回复，避免摘要请求本身过大
+            lines, used, last_id = [], 0, summary.summarized_until
+            posts = Post.objects.filter(
+                thread_id=thread_id, id__gt=summary.summarized_until, id__lte=until_post_id
+            ).order_by('id').values_list('id', 'author__username', 'plain_text')
+            for post_id, author_name, plain_text in posts.iterator(chunk_size=FETCH_BATCH):
+                line, tokens = _format_line(author_name, plain_text)
+                if used + tokens > chunk_budget and lines:
+                    break
+                lines.append(truncate_to_tokens(line, chunk_budget))
+                used += tokens
+                last_id = post_id
+            if not lines:
+                break
+
+            previous = summary.text or '（暂无）'
+            new_text = get_ai_service().chat(
+                model=settings.FORUM_AI_SUMMARY_MODEL,
+                system_message=(
+                    "你是论坛讨论的记录员。请把已有摘要和新增的讨论内容合并成一份简洁的中文摘要，"
+                    "保留主要观点、分歧和未解决的问题，不要编造内容。"
+                    f"摘要长度控制在 {settings.FORUM_AI_SUMMARY_TOKENS} 字以内。"
+                ),
+                user_message=f"【已有摘要】\n{previous}\n\n【新增讨论】\n" + "\n".join(lines),
+                temperature=0.3,
+                max_tokens=settings.FORUM_AI_SUMMARY_TOKENS * 2,
+                raise_on_error=True,
+                agent='summary',
+            )
+            summary.text = truncate_to_tokens(new_text.strip(), settings.FORUM_AI_SUMMARY_TOKENS * 2)
+            summary.summarized_until = last_id
+            summary.save(update_fields=['text', 'summarized_until', 'updated_at'])
+        logger.info(f"📝 讨论摘要已更新（覆盖到回复 {summary.summarized_until}）", extra={'thread_id': thread_id})
+    except Exception as e:
+        logger.error(f"💥 摘要更新失败: {e}", extra={'thread_id': thread_id})
+    finally:
+        with _inflight_lock:
+            _inflight.discard(thread_id)
+        connection.close()
@@ -0,0 +1,110 @@
+"""
+数据库连接管理
+
+- 连接方式在 settings 中选择：安装了 psycopg 3 和 psycopg_pool 时每个进程使用一个连接池（FORUM_DB_POOL_*），
+  否则使用带健康检查的持久连接（FORUM_DB_CONN_MAX_AGE），都不再每个请求新建连接
+- 后台线程在每个任务结束时关闭/归还自己的连接（WorkerPool 每轮 close_old_connections，
+  线程池中的任务在 finally 中 connection.close()）
+- 长时间占用连接的场景：LISTEN 监听使用不经过连接池的独立连接（dedicated_connection）；
+  SSE 在读取初始状态后立即归还连接（release_connection），推送期间不占用
+- db_stats() 汇总连接池占用、等待情况和服务端连接数
+"""
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def count_connection(sender, connection, **kwargs):
+    """connection_created 信号：统计本进程建立（连接池模式下为取出）连接的次数"""
+    with _stats_lock:
+        _stats[connection.alias] += 1
+
+
+def release_connection():
+    """立即关闭当前线程的连接（连接池模式下归还给连接池）"""
+    connection.close()
+
+
+def dedicated_connection(alias=DEFAULT_DB_ALIAS):
+    """
+    新建一个不经过连接池的连接包装（用于 LISTEN 等长期占用的连接）
+    调用方负责 close()
+    """
+    settings_dict = connections.settings[alias]
+    options = {k: v for k, v in settings_dict['OPTIONS'].items() if k != 'pool'}
+    wrapper_class = type(connections[alias])
+    return wrapper_class({**settings_dict, 'OPTIONS': options}, alias=f'{alias}-dedicated')
+
+
+def pool_mode(alias=DEFAULT_DB_ALIAS):
+    wrapper = connections[alias]
+    if getattr(wrapper, 'pool', None) is not None:
+        return 'pool'
+    return 'persistent' if wrapper.settings_dict.get('CONN_MAX_AGE') else 'per_request'
+
+
+def _pool_stats(pool):
+    raw = pool.get_stats()
+    size, available = raw.get('pool_size', 0), raw.get('pool_available', 0)
+    in_use = size - available
+    return {
+        "min_size": raw.get('pool_min', pool.min_size),
+        "max_size": raw.get('pool_max', pool.max_size),
+        "size": size,
+        "in_use": in_use,
+        "available": available,
+        "waiting": raw.get('requests_waiting', 0),
+        "requests": raw.get('requests_num', 0),
+        "requests_queued": raw.get('requests_queued', 0),
+        "requests_wait_ms": raw.get('requests_wait_ms', 0),
+        "requests_errors": raw.get('requests_errors', 0),
+        "connections_opened": raw.get('connections_num', 0),
+        "utilization": round(in_use / pool.max_size, 3) if pool.max_size else None,
+    }
+
+
+def server_connection_stats():
+    """服务端视角：本应用的连接按状态计数，以及整个实例的连接数和 max_connections"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT coalesce(state, 'unknown'), count(*) FROM pg_stat_activity
+            WHERE datname = current_database() AND application_name = %s
+            GROUP BY 1
+            """,
+            [settings.FORUM_DB_APPLICATION_NAME],
+        )
+        by_state = dict(cursor.fetchall())
+        cursor.execute(
+            "SELECT count(*), current_setting('max_connections')::int FROM pg_stat_activity "
+            "WHERE backend_type = 'client backend'"
+        )
+        total, max_connections = cursor.fetchone()
+    return {
+        "app_connections": sum(by_state.values()),
+        "app_by_state": by_state,
+        "total_connections": total,
+        "max_connections": max_connections,
+        "utilization": round(total / max_connections, 3) if max_connections else None,
+    }
+
+
+def db_stats(alias=DEFAULT_DB_ALIAS):
+    wrapper = connections[alias]
+    pool = getattr(wrapper, 'pool', None)
+    with _stats_lock:
+        connects = _stats.get(alias, 0)
+    stats = {
+        "mode": pool_mode(alias),
+        "conn_max_age": wrapper.settings_dict.get('CONN_MAX_AGE'),
+        "process_connects": connects,
+        "pool": _pool_stats(pool) if pool is not None else None,
+    }
+    if wrapper.vendor == 'postgresql':
+        stats["server"] = server_connection_stats()
+    return stats
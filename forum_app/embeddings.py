@@ -0,0 +1,84 @@
+"""
+文本向量化（知识库写入与检索共用）
+
+FORUM_RAG_EMBEDDER:
+- 'openai' 通过 AIService 调用 OPENAI_EMBEDDING_MODEL，支持批量请求
+- 'local'  确定性的本地哈希向量，不联网，用于离线测试和开发
+- 其他值按点分路径导入，需为 embed(texts) -> [[float, ...], ...] 的可调用对象
+
+写入和检索必须使用同一个 embedder，否则向量不在同一空间。
+"""
+import hashlib
+import math
+import re
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DIMENSIONS = 1536
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+|[\u3400-\u4dbf\u4e00-\u9fff]')
+
+
+def content_hash(text):
+    """文本的 sha256，用于知识库分块去重"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class OpenAIEmbedder:
+    name = 'openai'
+
+    def __call__(self, texts):
+        from .ai_service import get_ai_service
+        return get_ai_service().get_embeddings(texts)
+
+    @property
+    def model(self):
+        from .ai_service import get_ai_service
+        return get_ai_service().embedding_model
+
+
+class LocalHashEmbedder:
+    """
+    特征哈希：英文按单词、中文按单字和相邻二字组，每个特征哈希到一个维度并带正负号。
+    同样的文本总是得到同样的向量，词面相近的文本向量也相近。
+    """
+    name = 'local'
+    model = 'local-hash-v1'
+
+    def __call__(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def _embed(self, text):
+        vector = [0.0] * DIMENSIONS
+        tokens = _TOKEN_RE.findall(text.lower())
+        features = tokens + [a + b for a, b in zip(tokens, tokens[1:])]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], 'little') % DIMENSIONS
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+
+_BUILTIN = {
+    'openai': OpenAIEmbedder,
+    'local': LocalHashEmbedder,
+}
+
+_embedders = {}
+
+
+def get_embedder(name=None):
+    """按名称返回 embedder 实例（进程内缓存）"""
+    name = name or settings.FORUM_RAG_EMBEDDER
+    if name not in _embedders:
+        factory = _BUILTIN.get(name) or import_string(name)
+        embedder = factory() if isinstance(factory, type) else factory
+        _embedders[name] = embedder
+    return _embedders[name]
+
+
+def embedder_key(embedder):
+    """区分不同向量空间的标识（用于缓存键）"""
+    return f"{getattr(embedder, 'name', embedder)}:{getattr(embedder, 'model', '')}"
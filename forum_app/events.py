@@ -0,0 +1,186 @@
+"""
+帖子实时事件的发布/订阅（供 SSE 接口使用）
+
+AI 后台任务通过 publish() 发出事件：
+- agent_started       某个 AI 开始生成
+- token               流式生成的文本片段
+- post_committed      回复已写入数据库
+- generation_finished 本轮生成结束
+
+订阅方（SSE 连接）在事件循环中通过 subscribe() 拿到一个 asyncio.Queue。
+同一进程内所有观看者共享一份分发表，空闲连接不会产生任何数据库查询。
+
+FORUM_EVENTS_BACKEND:
+- 'local'    只在当前进程内分发（单进程部署、开发环境）
+- 'postgres' 通过 Postgres LISTEN/NOTIFY 跨进程分发，每个进程只占用一个监听连接
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from .db import dedicated_connection
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'forum_thread_events'
+# NOTIFY 的负载上限是 8000 字节，留一点余量
+MAX_NOTIFY_PAYLOAD = 7900
+
+
+class ThreadEventBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # thread_id -> {(loop, queue), ...}
+        self._subscribers = {}
+        self._listener = None
+
+    # ---------- 订阅 ----------
+
+    def subscribe(self, thread_id, maxsize=1000):
+        """在事件循环中调用，返回一个接收该帖子事件的队列"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=maxsize)
+        with self._lock:
+            self._subscribers.setdefault(thread_id, set()).add((loop, queue))
+        if _backend() == 'postgres':
+            self._ensure_listener()
+        return queue
+
+    def unsubscribe(self, thread_id, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(thread_id)
+            if not subscribers:
+                return
+            subscribers.difference_update({item for item in subscribers if item[1] is queue})
+            if not subscribers:
+                del self._subscribers[thread_id]
+
+    def subscriber_count(self, thread_id=None):
+        with self._lock:
+            if thread_id is not None:
+                return len(self._subscribers.get(thread_id, ()))
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    # ---------- 发布 ----------
+
+    def publish(self, thread_id, event, data=None):
+        """可在任意线程中调用"""
+        message = {'thread_id': thread_id, 'event': event, 'data': data or {}}
+        if _backend() == 'postgres':
+            self._notify(message)
+        else:
+            self.dispatch(message)
+
+    def dispatch(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(message['thread_id'], ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_put_nowait, queue, message)
+            except RuntimeError:
+                # 事件循环已关闭，连接会在 finally 中自行退订
+                pass
+
+    def _notify(self, message):
+        payload = json.dumps(message, ensure_ascii=False, default=str)
+        if len(payload.encode('utf-8')) > MAX_NOTIFY_PAYLOAD:
+            # 太大的回复正文不走 NOTIFY，前端收到后通过增量接口补拉
+            message = {**message, 'data': {**message['data'], 'content': None, 'truncated': True}}
+            payload = json.dumps(message, ensure_ascii=False, default=str)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, payload])
+
+    # ---------- Postgres 监听 ----------
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen_forever, name='forum-event-listener', daemon=True)
+            self._listener.start()
+
+    def _listen_forever(self):
+        while True:
+            # 独立连接：LISTEN 会一直占用，不能从连接池中借用
+            wrapper = dedicated_connection()
+            try:
+                wrapper.ensure_connection()
+                raw = wrapper.connection
+                raw.autocommit = True
+                with raw.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL}')
+                if callable(raw.notifies):
+                    # psycopg 3
+                    while True:
+                        for notify in raw.notifies(timeout=5):
+                            self._handle_notify(notify.payload)
+                else:
+                    # psycopg2
+                    while True:
+                        if select.select([raw], [], [], 5) == ([], [], []):
+                            continue
+                        raw.poll()
+                        while raw.notifies:
+                            self._handle_notify(raw.notifies.pop(0).payload)
+            except Exception as e:
+                logger.warning(f"⚠️ 事件监听连接断开，稍后重连: {e}")
+                time.sleep(1)
+            finally:
+                try:
+                    wrapper.close()
+                except Exception:
+                    pass
+
+    def _handle_notify(self, payload):
+        try:
+            self.dispatch(json.loads(payload))
+        except (ValueError, KeyError):
+            pass
+
+
+class TokenBuffer:
+    """
+    把逐 token 的回调合并成较大的片段再发布，避免每个 token 一次 NOTIFY
+    """
+    def __init__(self, thread_id, agent_name, interval=0.1):
+        self.thread_id = thread_id
+        self.agent_name = agent_name
+        self.interval = interval
+        self._parts = []
+        self._last_flush = time.monotonic()
+
+    def __call__(self, text):
+        self._parts.append(text)
+        if time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            publish(self.thread_id, 'token', {'agent': self.agent_name, 'text': ''.join(self._parts)})
+            self._parts = []
+        self._last_flush = time.monotonic()
+
+
+def _put_nowait(queue, message):
+    try:
+        queue.put_nowait(message)
+    except asyncio.QueueFull:
+        # 客户端消费太慢时丢弃事件，已提交的回复仍可通过增量接口补齐
+        pass
+
+
+def _backend():
+    return getattr(settings, 'FORUM_EVENTS_BACKEND', 'local')
+
+
+broker = ThreadEventBroker()
+
+
+def publish(thread_id, event, data=None):
+    broker.publish(thread_id, event, data)
@@ -0,0 +1,186 @@
+"""
+知识库批量导入（manage.py ingest_knowledge）
+
+- 逐个读取目录下的文本文件或 JSONL 的每一行，切成带重叠的分块
+- 分块按内容哈希去重：知识库里已有的分块直接跳过，不会重新向量化，
+  所以中断后重新运行同一命令即可从断点继续
+- 每攒够一批分块才调用一次 embedder，并用 COPY（或 bulk_create）一次写入，
+  内存占用只和批大小有关
+"""
+import io
+import json
+import time
+from pathlib import Path
+
+from django.db import connection, transaction
+
+from .embeddings import content_hash
+from .models import Document
+
+TEXT_SUFFIXES = ('.txt', '.md', '.markdown', '.rst')
+_SEPARATORS = ('\n\n', '\n', '。', '！', '？', '. ', '! ', '? ')
+_SOURCE_MAX = Document._meta.get_field('source').max_length
+
+
+def iter_sources(path, text_field='text'):
+    """逐个产出 (source, text)：目录下的每个文本文件，或 JSONL 的每一行"""
+    path = Path(path)
+    if path.is_dir():
+        for file in sorted(p for p in path.rglob('*') if p.is_file() and p.suffix.lower() in TEXT_SUFFIXES):
+            yield str(file.relative_to(path)), file.read_text(encoding='utf-8', errors='replace')
+    elif path.suffix.lower() == '.jsonl':
+        with path.open(encoding='utf-8') as f:
+            for lineno, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                source = str(record.get('source') or record.get('id') or f'{path.name}:{lineno}')
+                yield source, record.get(text_field) or ''
+    else:
+        yield path.name, path.read_text(encoding='utf-8', errors='replace')
+
+
+def chunk_text(text, size=800, overlap=100):
+    """按字符数切块，尽量在段落/句子边界断开，相邻分块重叠 overlap 个字符"""
+    text = text.strip()
+    if len(text) <= size:
+        if text:
+            yield text
+        return
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            cut = max(text.rfind(sep, start + size // 2, end) + len(sep) for sep in _SEPARATORS)
+            if cut > start + size // 2:
+                end = cut
+        chunk = text[start:end].strip()
+        if chunk:
+            yield chunk
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+
+
+class KnowledgeIngestor:
+    """把分块分批向量化并写入某个知识库"""
+
+    def __init__(self, kb, embedder, batch_size=256, loader='copy', max_retries=3, log=print):
+        self.kb = kb
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.loader = loader if loader == 'bulk' or connection.vendor == 'postgresql' else 'bulk'
+        self.max_retries = max_retries
+        self.log = log
+        self._pending = []  # [(hash, source, text)]
+        self.sources = self.chunks = self.embedded = self.skipped = self.inserted = 0
+        self._started = time.perf_counter()
+
+    # ---------- 输入 ----------
+
+    def add_source(self, source, text, chunk_size, overlap):
+        self.sources += 1
+        for i, chunk in enumerate(chunk_text(text, chunk_size, overlap)):
+            self.chunks += 1
+            self._pending.append((content_hash(chunk), f'{source}#{i}'[:_SOURCE_MAX], chunk))
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        # 批内去重 + 跳过知识库中已有的分块
+        unique = {}
+        for digest, source, text in batch:
+            unique.setdefault(digest, (source, text))
+        existing = set(
+            Document.objects.filter(kb=self.kb, content_hash__in=list(unique)).values_list('content_hash', flat=True)
+        )
+        todo = [(digest, source, text) for digest, (source, text) in unique.items() if digest not in existing]
+        self.skipped += len(batch) - len(todo)
+        if not todo:
+            return
+
+        vectors = self._embed([text for _, _, text in todo])
+        self.embedded += len(todo)
+        rows = [(digest, source, text, vector) for (digest, source, text), vector in zip(todo, vectors)]
+        self.inserted += self._load_copy(rows) if self.loader == 'copy' else self._load_bulk(rows)
+
+    def _embed(self, texts):
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                vectors = self.embedder(texts)
+                if len(vectors) != len(texts):
+                    raise ValueError(f'embedder 返回了 {len(vectors)} 个向量，期望 {len(texts)} 个')
+                return vectors
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                wait = 2 ** attempt
+                self.log(f'⚠️ 向量化失败（第 {attempt} 次），{wait}s 后重试: {e}')
+                time.sleep(wait)
+
+    # ---------- 写入 ----------
+
+    def _load_bulk(self, rows):
+        docs = [
+            Document(kb=self.kb, content_hash=digest, source=source, text_content=text, embedding=vector)
+            for digest, source, text, vector in rows
+        ]
+        # 并发导入同一知识库时可能撞上唯一约束，冲突的行直接忽略
+        Document.objects.bulk_create(docs, ignore_conflicts=True)
+        return len(docs)
+
+    def _load_copy(self, rows):
+        table = Document._meta.db_table
+        buffer = io.StringIO()
+        for digest, source, text, vector in rows:
+            embedding = '[' + ','.join(repr(float(v)) for v in vector) + ']'
+            buffer.write('\t'.join((str(self.kb.pk), digest, copy_escape(source), copy_escape(text), embedding)))
+            buffer.write('\n')
+        buffer.seek(0)
+        columns = 'kb_id, content_hash, source, text_content, embedding'
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS forum_kb_ingest ('
+                'kb_id integer, content_hash varchar(64), source varchar(500), '
+                'text_content text, embedding vector(1536)) ON COMMIT DELETE ROWS'
+            )
+            copy_from(cursor.cursor, f'COPY forum_kb_ingest ({columns}) FROM STDIN', buffer)
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) SELECT {columns} FROM forum_kb_ingest '
+                f'ON CONFLICT (kb_id, content_hash) DO NOTHING'
+            )
+            return cursor.rowcount
+
+    # ---------- 统计 ----------
+
+    def stats(self):
+        elapsed = max(time.perf_counter() - self._started, 1e-9)
+        return {
+            'sources': self.sources,
+            'chunks': self.chunks,
+            'embedded': self.embedded,
+            'skipped': self.skipped,
+            'inserted': self.inserted,
+            'elapsed': elapsed,
+            'docs_per_sec': self.sources / elapsed,
+            'chunks_per_sec': self.chunks / elapsed,
+        }
+
+
+def copy_escape(value):
+    """COPY 文本格式的转义"""
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_from(raw_cursor, sql, buffer):
+    """COPY ... FROM STDIN，兼容 psycopg2 和 psycopg 3"""
+    if hasattr(raw_cursor, 'copy_expert'):
+        # psycopg2
+        raw_cursor.copy_expert(sql, buffer)
+    else:
+        # psycopg 3
+        with raw_cursor.copy(sql) as copy:
+            copy.write(buffer.getvalue())
@@ -0,0 +1,334 @@
+"""
+持久化的 AI 生成任务队列
+
+- enqueue_generation() 在发帖/回帖时调用，只写一行 GenerationJob，立即返回
+- 同一帖子最多一个排队中的任务，连续多条回复合并为一轮生成
+- WorkerPool 以固定数量的线程领取任务（SELECT ... FOR UPDATE SKIP LOCKED），
+  多个 web/worker 进程同时运行也不会重复生成
+- 运行中的任务由心跳线程定期续约；租约过期说明所在进程已崩溃，
+  recover_stale_jobs() 会把它重新排队（或在超过重试次数后标记失败）
+
+独立部署 worker：python manage.py run_ai_worker --workers 4
+开发环境下 FORUM_AI_EMBEDDED_WORKERS = True 时，web 进程会在第一次排队时自行启动一个池。
+"""
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Avg, Count, Exists, F, Min, OuterRef, Q
+from django.utils import timezone
+
+from . import metrics
+from .ai_tasks import generate_replies
+from .events import publish
+from .models import GenerationJob, RateLimitBucket, Thread
+from .log import log_context
+from .response_cache import invalidate_thread_list
+
+logger = logging.getLogger(__name__)
+
+
+def _lease_duration():
+    return timedelta(seconds=settings.FORUM_AI_JOB_LEASE_SECONDS)
+
+
+# ==================== 入队 ====================
+
+def enqueue_generation(thread_id, delay=None):
+    """为帖子排队一轮 AI 生成；该帖已有排队中的任务时直接合并。delay（秒）表示推迟执行"""
+    not_before = timezone.now() + timedelta(seconds=delay) if delay else None
+    # 部分唯一索引保证每个帖子至多一个 pending 任务，冲突即表示已合并
+    GenerationJob.objects.bulk_create(
+        [GenerationJob(thread_id=thread_id, not_before=not_before)], ignore_conflicts=True
+    )
+    if settings.FORUM_AI_EMBEDDED_WORKERS:
+        ensure_embedded_pool()
+
+
+# ==================== 领取 / 完成 ====================
+
+def claim_job(worker_id):
+    """领取最早排队的一个任务；同一帖子已有任务在运行时跳过，保证单帖串行"""
+    now = timezone.now()
+    running_same_thread = GenerationJob.objects.filter(
+        thread_id=OuterRef('thread_id'), status=GenerationJob.RUNNING
+    )
+    with transaction.atomic():
+        job = (
+            GenerationJob.objects.select_for_update(skip_locked=True)
+            .filter(status=GenerationJob.PENDING)
+            .filter(Q(not_before__isnull=True) | Q(not_before__lte=now))
+            .exclude(Exists(running_same_thread))
+            .order_by('created_at', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = GenerationJob.RUNNING
+        job.attempts += 1
+        job.started_at = now
+        job.lease_owner = worker_id
+        job.lease_expires_at = now + _lease_duration()
+        job.save(update_fields=['status', 'attempts', 'started_at', 'lease_owner', 'lease_expires_at'])
+    return job
+
+
+def finish_job(job, worker_id, error=None):
+    """结束任务；只有仍持有租约的 worker 才能写入结果"""
+    updated = GenerationJob.objects.filter(
+        pk=job.pk, status=GenerationJob.RUNNING, lease_owner=worker_id
+    ).update(
+        status=GenerationJob.FAILED if error else GenerationJob.DONE,
+        finished_at=timezone.now(),
+        lease_expires_at=None,
+        last_error=error or '',
+    )
+    if not updated:
+        logger.warning("⚠️ 任务的租约已丢失，结果被忽略", extra={'job_id': job.pk, 'thread_id': job.thread_id})
+    _settle_thread(job.thread_id, error=bool(error))
+
+
+def _settle_thread(thread_id, error=False):
+    """
+    该帖子没有排队/运行中的任务时，清除 ai_generating 并通知前端
+
+    先锁住帖子行再检查任务：回帖在同一事务中写入 ai_generating=True 并入队（见 views.api_reply_thread），
+    拿到锁时它已提交，随后的检查一定能看到新任务。单条 UPDATE ... WHERE NOT EXISTS 不够：
+    READ COMMITTED 下等锁之后只重新检查帖子行本身，子查询仍使用语句开始时的快照。
+    """
+    with transaction.atomic():
+        if not list(Thread.objects.select_for_update().filter(pk=thread_id).values_list('id', flat=True)):
+            return
+        active = GenerationJob.objects.filter(
+            thread_id=thread_id, status__in=[GenerationJob.PENDING, GenerationJob.RUNNING]
+        ).exists()
+        if active:
+            return
+        Thread.bump_version(thread_id, ai_generating=False)
+    publish(thread_id, 'generation_finished', {'error': True} if error else {})
+
+
+def run_job(job, worker_id):
+    # 本轮生成期间的日志（包括线程池中各角色的调用）都带上 job_id / thread_id
+    with log_context(job_id=job.pk, thread_id=job.thread_id):
+        logger.info(f"🤖 开始生成回复（第 {job.attempts} 次尝试）", extra={'worker': worker_id})
+        metrics.AI_ROUNDS_INFLIGHT.inc()
+        try:
+            posts = generate_replies(job.thread_id)
+        except Thread.DoesNotExist:
+            metrics.AI_ROUNDS.inc(outcome='failed')
+            finish_job(job, worker_id, error='帖子不存在')
+        except Exception as e:
+            metrics.AI_ROUNDS.inc(outcome='failed')
+            logger.exception(f"💥 AI 任务出错: {e}")
+            finish_job(job, worker_id, error=str(e))
+        else:
+            metrics.AI_ROUNDS.inc(outcome='done')
+            _observe_reply_delays(job, posts)
+            finish_job(job, worker_id)
+        finally:
+            metrics.AI_ROUNDS_INFLIGHT.dec()
+
+
+def _observe_reply_delays(job, posts):
+    """任务入队时间即用户发帖时间（连续回复合并时为第一条）"""
+    if not posts:
+        return
+    first = (min(post.created_at for post in posts) - job.created_at).total_seconds()
+    last = (max(post.created_at for post in posts) - job.created_at).total_seconds()
+    metrics.AI_FIRST_REPLY_DELAY.observe(first)
+    metrics.AI_LAST_REPLY_DELAY.observe(last)
+    logger.info("⏱️ 本轮回复完成", extra={
+        'replies': len(posts), 'first_reply_seconds': round(first, 3), 'last_reply_seconds': round(last, 3),
+    })
+
+
+# ==================== 续约 / 恢复 ====================
+
+def renew_leases(active):
+    """为运行中的任务续约（active: worker_id -> job_id）；租约已被回收的任务不再续约，返回续约的个数"""
+    renewed = 0
+    for worker_id, job_id in active.items():
+        renewed += GenerationJob.objects.filter(
+            pk=job_id, status=GenerationJob.RUNNING, lease_owner=worker_id
+        ).update(lease_expires_at=timezone.now() + _lease_duration())
+    return renewed
+
+
+def recover_stale_jobs():
+    """
+    处理租约已过期的运行中任务（所在进程已崩溃）：未超过重试次数的重新排队，否则标记失败。
+    最后把没有任何活跃任务却仍标记为生成中的帖子复位。
+    """
+    now = timezone.now()
+    stale = list(
+        GenerationJob.objects.filter(status=GenerationJob.RUNNING, lease_expires_at__lt=now)
+        .values_list('id', 'thread_id', 'attempts')
+    )
+    requeued = failed = 0
+    for job_id, thread_id, attempts in stale:
+        fields = {'lease_owner': '', 'lease_expires_at': None}
+        if attempts < settings.FORUM_AI_JOB_MAX_ATTEMPTS:
+            try:
+                with transaction.atomic():
+                    GenerationJob.objects.filter(pk=job_id, status=GenerationJob.RUNNING).update(
+                        status=GenerationJob.PENDING, **fields
+                    )
+                requeued += 1
+                continue
+            except IntegrityError:
+                # 该帖子已有新的排队任务，合并进去即可
+                pass
+        GenerationJob.objects.filter(pk=job_id, status=GenerationJob.RUNNING).update(
+            status=GenerationJob.FAILED, finished_at=now, last_error='租约过期', **fields
+        )
+        failed += 1
+
+    active_jobs = GenerationJob.objects.filter(
+        thread_id=OuterRef('pk'), status__in=[GenerationJob.PENDING, GenerationJob.RUNNING]
+    )
+    reset = Thread.objects.filter(ai_generating=True).exclude(Exists(active_jobs)).update(
+        ai_generating=False, version=F('version') + 1
+    )
+    if reset:
+        invalidate_thread_list()
+    if stale or reset:
+        logger.info(f"♻️ 恢复过期任务：重新排队 {requeued} 个，失败 {failed} 个，复位帖子 {reset} 个")
+    return requeued, failed, reset
+
+
+def prune_finished_jobs(older_than=timedelta(days=1)):
+    cutoff = timezone.now() - older_than
+    deleted, _ = GenerationJob.objects.filter(
+        status__in=[GenerationJob.DONE, GenerationJob.FAILED], finished_at__lt=cutoff
+    ).delete()
+    # 长时间未使用的令牌桶早已回满，删除后与新建等价
+    RateLimitBucket.objects.filter(updated_at__lt=cutoff).delete()
+    return deleted
+
+
+# ==================== 统计 ====================
+
+def queue_stats(window=timedelta(minutes=15)):
+    """队列深度和排队等待时间"""
+    now = timezone.now()
+    counts = GenerationJob.objects.aggregate(
+        pending=Count('id', filter=Q(status=GenerationJob.PENDING)),
+        running=Count('id', filter=Q(status=GenerationJob.RUNNING)),
+        oldest_pending=Min('created_at', filter=Q(status=GenerationJob.PENDING)),
+    )
+    recent = GenerationJob.objects.filter(started_at__gte=now - window).aggregate(
+        avg_wait=Avg(F('started_at') - F('created_at')),
+        started=Count('id'),
+    )
+    failed_recent = GenerationJob.objects.filter(
+        status=GenerationJob.FAILED, finished_at__gte=now - window
+    ).count()
+    oldest = counts['oldest_pending']
+    avg_wait = recent['avg_wait']
+    return {
+        "pending": counts['pending'],
+        "running": counts['running'],
+        "oldest_pending_wait_seconds": round((now - oldest).total_seconds(), 3) if oldest else 0,
+        "avg_wait_seconds": round(avg_wait.total_seconds(), 3) if avg_wait else 0,
+        "started_recent": recent['started'],
+        "failed_recent": failed_recent,
+        "window_seconds": int(window.total_seconds()),
+    }
+
+
+# ==================== Worker 池 ====================
+
+class WorkerPool:
+    """固定大小的 worker 线程池，外加一个心跳线程为运行中的任务续约"""
+
+    def __init__(self, size, poll_interval=1.0):
+        self.size = size
+        self.poll_interval = poll_interval
+        self.prefix = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._stop = threading.Event()
+        self._threads = []
+        self._active_lock = threading.Lock()
+        self._active = {}  # worker_id -> job_id
+
+    def start(self):
+        for i in range(self.size):
+            worker_id = f"{self.prefix}:w{i}"
+            t = threading.Thread(target=self._work_loop, args=(worker_id,), name=f"ai-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        hb = threading.Thread(target=self._heartbeat_loop, name='ai-worker-heartbeat', daemon=True)
+        hb.start()
+        self._threads.append(hb)
+        logger.info(f"🚀 AI worker 池已启动：{self.size} 个 worker ({self.prefix})")
+
+    def stop(self, timeout=None):
+        """不再领取新任务，等待运行中的任务结束"""
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+
+    @property
+    def busy(self):
+        with self._active_lock:
+            return len(self._active)
+
+    def _work_loop(self, worker_id):
+        while not self._stop.is_set():
+            close_old_connections()
+            try:
+                job = claim_job(worker_id)
+            except Exception as e:
+                logger.warning(f"⚠️ 领取任务失败: {e}")
+                job = None
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            with self._active_lock:
+                self._active[worker_id] = job.pk
+            try:
+                run_job(job, worker_id)
+            except Exception as e:
+                # 写回结果失败时租约会自然过期，由 recover_stale_jobs 接手
+                logger.warning(f"⚠️ 结束任务失败: {e}", extra={'job_id': job.pk, 'thread_id': job.thread_id})
+            finally:
+                with self._active_lock:
+                    self._active.pop(worker_id, None)
+                close_old_connections()
+
+    def _heartbeat_loop(self):
+        interval = max(1, settings.FORUM_AI_JOB_LEASE_SECONDS / 3)
+        while not self._stop.wait(interval):
+            with self._active_lock:
+                active = dict(self._active)
+            if not active:
+                continue
+            try:
+                renew_leases(active)
+            except Exception as e:
+                logger.warning(f"⚠️ 任务续约失败: {e}")
+            finally:
+                close_old_connections()
+
+
+_embedded_pool = None
+_embedded_lock = threading.Lock()
+
+
+def ensure_embedded_pool():
+    """在 web 进程内按需启动一个 worker 池（仅用于开发/单机部署）"""
+    global _embedded_pool
+    if _embedded_pool is not None:
+        return _embedded_pool
+    with _embedded_lock:
+        if _embedded_pool is None:
+            recover_stale_jobs()
+            pool = WorkerPool(settings.FORUM_AI_WORKERS)
+            pool.start()
+            _embedded_pool = pool
+    return _embedded_pool
@@ -0,0 +1,176 @@
+"""
+本地的 OpenAI 兼容接口替身（离线测试、压测用）
+
+实现 /v1/chat/completions（含 stream 和 stream_options.include_usage）与 /v1/embeddings，
+回复内容和向量都是确定性的：同样的请求总是得到同样的结果。延迟可配置，用来模拟真实模型的
+首 token 时间和生成速度；error_rate 按请求内容确定性地返回 500，用来检查失败路径。
+
+    python manage.py run_llm_stub --port 8900 --first-token-ms 400 --tokens-per-second 40
+    OPENAI_API_BASE=http://127.0.0.1:8900/v1 python manage.py run_ai_worker
+
+测试中用 start_stub_server(port=0) 在后台线程启动，用返回的 base_url 构造 AIService。
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .context import estimate_tokens
+from .embeddings import LocalHashEmbedder
+
+# 回复由这些句子按请求内容的哈希挑选拼接，每段就是流式输出的一个 chunk
+SENTENCES = [
+    '我同意楼上的观点，', '不过换个角度看，', '从工程实践来说，', '数据表明这个问题并不简单。',
+    '关键在于如何权衡成本和收益，', '我补充一个例子：', '这一点值得进一步讨论。', '总的来说，',
+    '缓存和索引往往比换框架更有效，', '先测量再优化。', '我倾向于保守一些的方案，', '欢迎大家补充。',
+]
+_NAME_RE = re.compile(r'请作为 "(.+?)" 参与讨论')
+
+
+@dataclass
+class StubConfig:
+    first_token_ms: float = 200        # 收到请求到第一段文本的延迟
+    tokens_per_second: float = 50      # 之后的生成速度；0 表示不限速
+    reply_tokens: int = 80             # 每条回复的大致 token 数（不超过请求的 max_tokens）
+    embedding_ms: float = 20           # 向量接口的延迟
+    error_rate: float = 0.0            # 按请求内容哈希确定性地失败的比例
+
+
+def _digest(*parts):
+    return hashlib.sha256('\x00'.join(parts).encode('utf-8')).digest()
+
+
+def stub_reply(messages, max_tokens, config):
+    """确定性的回复：[(文本片段, token 数), ...]"""
+    system = next((m['content'] for m in messages if m.get('role') == 'system'), '')
+    user = next((m['content'] for m in reversed(messages) if m.get('role') == 'user'), '')
+    name = _NAME_RE.search(system)
+    seed = _digest(system, user)
+    pieces = [f"（{name.group(1)}）" if name else '']
+    budget = min(config.reply_tokens, max_tokens or config.reply_tokens)
+    used, i = 0, 0
+    while used < budget:
+        sentence = SENTENCES[seed[i % len(seed)] % len(SENTENCES)]
+        pieces.append(sentence)
+        used += estimate_tokens(sentence)
+        i += 1
+    return [(piece, estimate_tokens(piece)) for piece in pieces if piece]
+
+
+def should_fail(body, config):
+    if config.error_rate <= 0:
+        return False
+    return _digest(json.dumps(body, sort_keys=True))[0] / 256 < config.error_rate
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config = StubConfig()
+    embedder = LocalHashEmbedder()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._json(400, {'error': {'message': 'invalid json'}})
+        if should_fail(body, self.config):
+            return self._json(500, {'error': {'message': 'stub injected failure', 'type': 'server_error'}})
+        path = self.path.rstrip('/')
+        if path.endswith('/chat/completions'):
+            return self._chat(body)
+        if path.endswith('/embeddings'):
+            return self._embeddings(body)
+        self._json(404, {'error': {'message': f'unknown path {self.path}'}})
+
+    def _chat(self, body):
+        config = self.config
+        messages = body.get('messages', [])
+        pieces = stub_reply(messages, body.get('max_tokens'), config)
+        prompt_tokens = sum(estimate_tokens(m.get('content') or '') for m in messages)
+        completion_tokens = sum(tokens for _, tokens in pieces)
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        }
+        base = {'id': 'chatcmpl-stub', 'created': int(time.time()), 'model': body.get('model', 'stub')}
+        time.sleep(config.first_token_ms / 1000)
+
+        if not body.get('stream'):
+            if config.tokens_per_second:
+                time.sleep(completion_tokens / config.tokens_per_second)
+            return self._json(200, {
+                **base, 'object': 'chat.completion',
+                'choices': [{
+                    'index': 0, 'finish_reason': 'stop',
+                    'message': {'role': 'assistant', 'content': ''.join(text for text, _ in pieces)},
+                }],
+                'usage': usage,
+            })
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        chunk = {**base, 'object': 'chat.completion.chunk'}
+        try:
+            for i, (text, tokens) in enumerate(pieces):
+                if i and config.tokens_per_second:
+                    time.sleep(tokens / config.tokens_per_second)
+                delta = {'content': text, **({'role': 'assistant'} if i == 0 else {})}
+                self._event({**chunk, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})
+            self._event({**chunk, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+            if (body.get('stream_options') or {}).get('include_usage'):
+                self._event({**chunk, 'choices': [], 'usage': usage})
+            self._write_chunk(b'data: [DONE]\n\n')
+            self._write_chunk(b'')
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端中途停止读取（如本轮生成超时被放弃），与真实接口一样直接结束
+            self.close_connection = True
+
+    def _embeddings(self, body):
+        texts = body.get('input', [])
+        if isinstance(texts, str):
+            texts = [texts]
+        time.sleep(self.config.embedding_ms / 1000)
+        tokens = sum(estimate_tokens(text) for text in texts)
+        self._json(200, {
+            'object': 'list',
+            'model': body.get('model', 'stub'),
+            'data': [
+                {'object': 'embedding', 'index': i, 'embedding': vector}
+                for i, vector in enumerate(self.embedder(texts))
+            ],
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+        })
+
+    def _event(self, data):
+        self._write_chunk(b'data: ' + json.dumps(data, ensure_ascii=False).encode('utf-8') + b'\n\n')
+
+    def _write_chunk(self, data):
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def _json(self, status, data):
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=0, host='127.0.0.1', config=None):
+    """在后台线程中启动替身服务，返回 (server, base_url)；用完调用 server.shutdown()"""
+    handler = type('StubHandler', (_Handler,), {'config': config or StubConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='llm-stub', daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}/v1'
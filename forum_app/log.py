@@ -0,0 +1,69 @@
+"""
+结构化日志
+
+- 各模块使用 logging.getLogger(__name__)，在 extra 中带上 thread_id / job_id / agent 等字段
+- log_context() 为一段代码（一个生成任务、一次请求）设置公共字段，期间所有日志自动带上；
+  字段存放在 contextvars 中，提交到线程池的任务需要用 contextvars.copy_context().run 传递
+- settings.FORUM_LOG_FORMAT 选择输出格式：'text' 便于本地阅读，'json' 每行一个 JSON 对象，便于日志系统检索
+
+本模块只依赖标准库，由 settings.LOGGING 在 Django 初始化前加载。
+"""
+import contextvars
+import json
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+_context = contextvars.ContextVar('forum_log_context', default={})
+
+# LogRecord 自带的属性，其余的都是通过 extra 传入的字段
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+@contextmanager
+def log_context(**fields):
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def _fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RESERVED}
+
+
+class ContextFilter(logging.Filter):
+    """把 log_context() 设置的字段加到日志记录上（extra 中的同名字段优先）"""
+
+    def filter(self, record):
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        text = super().format(record)
+        fields = _fields(record)
+        if fields:
+            text += '  ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return text
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **_fields(record),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
@@ -0,0 +1,81 @@
+"""
+压测命令共用的异步 HTTP/1.1 客户端（keep-alive），只依赖标准库
+
+文件名以下划线开头，Django 不会把它当作管理命令。
+"""
+import asyncio
+import json
+
+
+async def read_response(reader):
+    """读取一个 HTTP/1.1 响应（Content-Length 或 chunked），返回 (状态码, 响应头, 响应体, 是否可复用连接)"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ValueError('连接已关闭')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            chunks.append((await reader.readexactly(size + 2))[:-2])
+            if size == 0:
+                break
+        body = b''.join(chunks)
+    elif 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    elif status not in (204, 304):
+        # 没有长度信息时服务端会在响应结束后关闭连接
+        return status, headers, await reader.read(), False
+    else:
+        body = b''
+    return status, headers, body, headers.get('connection', '').lower() != 'close'
+
+
+def close(writer):
+    if writer is not None:
+        writer.close()
+    return None
+
+
+class Client:
+    """一条 keep-alive 连接；出错时关闭，下次请求自动重连"""
+
+    def __init__(self, host, port, timeout=5, headers=()):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.headers = list(headers)
+        self.reader = self.writer = None
+
+    async def request(self, method, path, data=None, headers=()):
+        """发送请求，返回 (状态码, 响应头, 响应体)；data 按 JSON 编码。超时抛 asyncio.TimeoutError，连接错误抛 OSError/ValueError"""
+        body = json.dumps(data).encode('utf-8') if data is not None else b''
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', 'Connection: keep-alive',
+                 *self.headers, *headers]
+        if data is not None:
+            lines += ['Content-Type: application/json', f'Content-Length: {len(body)}']
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+        try:
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), self.timeout
+                )
+            self.writer.write(request)
+            status, headers, body, keep_alive = await asyncio.wait_for(read_response(self.reader), self.timeout)
+        except (asyncio.TimeoutError, OSError, ValueError, asyncio.IncompleteReadError):
+            self.writer = close(self.writer)
+            raise
+        if not keep_alive:
+            self.writer = close(self.writer)
+        return status, headers, body
+
+    def close(self):
+        self.writer = close(self.writer)
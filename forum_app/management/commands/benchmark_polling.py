@@ -0,0 +1,114 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from ._http import close, read_response
+
+
+class Command(BaseCommand):
+    help = '模拟大量前端轮询客户端，测量单个服务进程能稳定支撑的并发轮询数（对比 WSGI / ASGI 部署）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/api/threads/', help='轮询的接口地址')
+        parser.add_argument('--pollers', default='50,100,200,500,1000', help='逗号分隔的并发轮询客户端数')
+        parser.add_argument('--interval', type=float, default=1.0, help='每个客户端的轮询间隔（秒），与前端一致')
+        parser.add_argument('--duration', type=float, default=15, help='每档并发持续的秒数')
+        parser.add_argument('--timeout', type=float, default=5, help='单次请求超时（秒）')
+        parser.add_argument('--header', action='append', default=[], help='附加请求头，如 "Authorization: Bearer xxx"')
+        parser.add_argument('--slow-ms', type=float, default=0,
+                            help='模拟慢速网络：请求分两段发送，中间间隔的毫秒数（WSGI 下这段时间占用一个 worker 线程）')
+
+    def handle(self, *args, **options):
+        parts = urlsplit(options['url'])
+        if parts.scheme != 'http' or not parts.hostname:
+            raise CommandError('只支持 http:// 地址')
+        target = {
+            'host': parts.hostname,
+            'port': parts.port or 80,
+            'path': (parts.path or '/') + (f'?{parts.query}' if parts.query else ''),
+            'headers': options['header'],
+        }
+
+        self.stdout.write(f"📡 {options['url']}：每个客户端每 {options['interval']}s 请求一次，每档 {options['duration']}s"
+                          + (f"，慢速客户端 {options['slow_ms']}ms" if options['slow_ms'] else ''))
+        self.stdout.write(f"{'并发':>6} {'请求/秒':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'错误':>6} {'超时':>6} {'按时率':>7}")
+        sustained = 0
+        for pollers in [int(n) for n in options['pollers'].split(',')]:
+            result = asyncio.run(_run_level(target, pollers, options))
+            self.stdout.write(
+                f"{pollers:>6} {result['rps']:>8.1f} {result['p50']:>8.1f} {result['p95']:>8.1f} {result['p99']:>8.1f} "
+                f"{result['errors']:>6} {result['timeouts']:>6} {result['on_time']:>6.1%}"
+            )
+            # 稳定支撑：95% 的请求在一个轮询间隔内返回，且失败率低于 1%
+            failed = result['errors'] + result['timeouts']
+            if result['p95'] < options['interval'] * 1000 and failed <= result['requests'] * 0.01:
+                sustained = pollers
+        self.stdout.write(self.style.SUCCESS(f'✅ 稳定支撑的最大并发轮询数：{sustained}'))
+
+
+async def _run_level(target, pollers, options):
+    latencies, counts = [], {'errors': 0, 'timeouts': 0}
+    deadline = time.monotonic() + options['duration']
+    # 客户端在一个间隔内均匀错开启动，和真实用户一样不会同时发起
+    tasks = [
+        asyncio.create_task(_poller(target, options, deadline, i * options['interval'] / pollers, latencies, counts))
+        for i in range(pollers)
+    ]
+    await asyncio.gather(*tasks)
+    samples = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    requests = len(latencies) + counts['errors'] + counts['timeouts']
+    return {
+        'requests': requests,
+        'rps': len(latencies) / options['duration'],
+        'p50': float(np.percentile(samples, 50)),
+        'p95': float(np.percentile(samples, 95)),
+        'p99': float(np.percentile(samples, 99)),
+        'errors': counts['errors'],
+        'timeouts': counts['timeouts'],
+        'on_time': float(np.mean(samples < options['interval'] * 1000)) if latencies else 0.0,
+    }
+
+
+async def _poller(target, options, deadline, delay, latencies, counts):
+    await asyncio.sleep(delay)
+    reader = writer = None
+    request = (
+        f"GET {target['path']} HTTP/1.1\r\nHost: {target['host']}:{target['port']}\r\n"
+        + ''.join(f'{h}\r\n' for h in target['headers'])
+        + "Connection: keep-alive\r\n\r\n"
+    ).encode('latin-1')
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(target['host'], target['port']), options['timeout']
+                )
+            if options['slow_ms']:
+                # 请求行先到，其余部分稍后到达
+                split = request.index(b'\r\n') + 2
+                writer.write(request[:split])
+                await writer.drain()
+                await asyncio.sleep(options['slow_ms'] / 1000)
+                writer.write(request[split:])
+            else:
+                writer.write(request)
+            status, _, _, keep_alive = await asyncio.wait_for(read_response(reader), options['timeout'])
+            if status >= 400:
+                counts['errors'] += 1
+            else:
+                latencies.append(time.monotonic() - started)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except asyncio.TimeoutError:
+            counts['timeouts'] += 1
+            writer = close(writer)
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            counts['errors'] += 1
+            writer = close(writer)
+        await asyncio.sleep(max(0.0, options['interval'] - (time.monotonic() - started)))
+    close(writer)
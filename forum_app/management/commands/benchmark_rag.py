@@ -0,0 +1,125 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from pgvector.django import CosineDistance
+
+from forum_app.models import Document, KnowledgeBase
+from forum_app.rag import search_documents
+
+DIMENSIONS = 1536
+KB_PREFIX = '__benchmark_rag__'
+
+
+class Command(BaseCommand):
+    help = '评估知识库向量检索：写入随机文档，对比精确检索计算 recall@k，并统计延迟'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--docs', type=int, default=100_000, help='写入的文档数量（如 100000 / 1000000）')
+        parser.add_argument('--kbs', type=int, default=10, help='文档分布到多少个知识库')
+        parser.add_argument('--agent-kbs', type=int, default=2, help='每次查询过滤的知识库数量（模拟一个 AI 挂载的知识库）')
+        parser.add_argument('--queries', type=int, default=100, help='查询次数')
+        parser.add_argument('--k', type=int, default=10, help='recall@k 的 k')
+        parser.add_argument('--ef-search', default='20,40,80,160', help='逗号分隔的 hnsw.ef_search 取值')
+        parser.add_argument('--batch-size', type=int, default=2000, help='写入批大小')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keep', action='store_true', help='保留测试数据（可跳过下次写入，配合 --reuse）')
+        parser.add_argument('--reuse', action='store_true', help='复用上次 --keep 保留的测试数据')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        # 文档围绕若干簇中心分布，比均匀随机向量更接近真实文本向量
+        centers = _normalize(rng.standard_normal((max(16, options['kbs'] * 8), DIMENSIONS)))
+
+        if options['reuse']:
+            kb_ids = list(KnowledgeBase.objects.filter(name__startswith=KB_PREFIX).values_list('id', flat=True))
+            self.stdout.write(f"♻️  复用 {Document.objects.filter(kb_id__in=kb_ids).count()} 个测试文档")
+        else:
+            kb_ids = self._load(rng, centers, options)
+
+        try:
+            self._run(rng, centers, kb_ids, options)
+        finally:
+            if not options['keep']:
+                KnowledgeBase.objects.filter(id__in=kb_ids).delete()
+                self.stdout.write('🧹 测试数据已清理')
+
+    def _load(self, rng, centers, options):
+        KnowledgeBase.objects.filter(name__startswith=KB_PREFIX).delete()
+        kbs = [KnowledgeBase.objects.create(name=f'{KB_PREFIX}{i}') for i in range(options['kbs'])]
+        kb_ids = [kb.id for kb in kbs]
+
+        total, batch_size = options['docs'], options['batch_size']
+        started = time.perf_counter()
+        for offset in range(0, total, batch_size):
+            n = min(batch_size, total - offset)
+            vectors = _sample(rng, centers, n)
+            owners = rng.integers(0, len(kb_ids), n)
+            Document.objects.bulk_create([
+                Document(kb_id=kb_ids[owners[i]], text_content=f'benchmark {offset + i}', embedding=vectors[i])
+                for i in range(n)
+            ])
+            done = offset + n
+            if done % (batch_size * 10) == 0 or done == total:
+                rate = done / (time.perf_counter() - started)
+                self.stdout.write(f'  📥 已写入 {done}/{total}（{rate:.0f} 条/秒，含索引维护）')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE forum_app_document')
+        return kb_ids
+
+    def _run(self, rng, centers, kb_ids, options):
+        k = options['k']
+        agent_kbs = max(1, min(options['agent_kbs'], len(kb_ids)))
+        queries = []
+        for vector in _sample(rng, centers, options['queries']):
+            filters = sorted(rng.choice(kb_ids, agent_kbs, replace=False).tolist())
+            queries.append((vector, filters))
+
+        self.stdout.write(f'🎯 计算精确结果（顺序扫描，{len(queries)} 次查询）...')
+        exact_latencies, truth = [], []
+        for vector, filters in queries:
+            start = time.perf_counter()
+            truth.append(set(_exact_search(vector, filters, k)))
+            exact_latencies.append(time.perf_counter() - start)
+        self.stdout.write(f'  精确检索  p50 {_pct(exact_latencies, 50):7.1f}ms  p99 {_pct(exact_latencies, 99):7.1f}ms')
+
+        for ef_search in [int(v) for v in options['ef_search'].split(',') if v.strip()]:
+            latencies, hits = [], 0
+            with override_settings(FORUM_RAG_EF_SEARCH=ef_search):
+                for (vector, filters), expected in zip(queries, truth):
+                    start = time.perf_counter()
+                    found = search_documents(vector, filters, k)
+                    latencies.append(time.perf_counter() - start)
+                    hits += len(expected & {doc_id for doc_id, _, _ in found})
+            recall = hits / max(1, sum(len(t) for t in truth))
+            self.stdout.write(
+                f'  ef_search={ef_search:<4} recall@{k} {recall:6.3f}  '
+                f'p50 {_pct(latencies, 50):7.1f}ms  p99 {_pct(latencies, 99):7.1f}ms'
+            )
+
+
+def _normalize(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _sample(rng, centers, n):
+    picked = centers[rng.integers(0, len(centers), n)]
+    return _normalize(picked + rng.standard_normal((n, DIMENSIONS)) * 0.03).astype(np.float32)
+
+
+def _exact_search(vector, kb_ids, k):
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_indexscan = off')
+            cursor.execute('SET LOCAL enable_bitmapscan = off')
+        return list(
+            Document.objects.filter(kb_id__in=kb_ids)
+            .order_by(CosineDistance('embedding', vector))
+            .values_list('id', flat=True)[:k]
+        )
+
+
+def _pct(latencies, p):
+    return float(np.percentile(latencies, p)) * 1000
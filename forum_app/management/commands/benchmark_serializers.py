@@ -0,0 +1,90 @@
+import gzip
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from forum_app.models import Actor, Post, Thread
+from forum_app.renderers import dumps
+from forum_app.serializers import POST_VALUES, PostSerializer, serialize_posts
+
+try:
+    import brotli
+except ImportError:  # 可选依赖
+    brotli = None
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = '对比 ModelSerializer 与 .values() 快速序列化、DRF JSON 与 orjson、gzip 与 br 的吞吐（行/秒）和压缩率'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50, help='每次序列化的回复数（接近一页）')
+        parser.add_argument('--repeat', type=int, default=200, help='每项重复次数')
+
+    def handle(self, *args, **options):
+        author = Actor.objects.first()
+        if author is None:
+            raise CommandError('数据库中没有任何用户，先创建一个用户')
+        try:
+            # 在事务中造数据，测完回滚，不污染数据库
+            with transaction.atomic():
+                self._run(author, options['rows'], options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, author, rows, repeat):
+        thread = Thread.objects.create(title='序列化基准', content='基准测试', author=author)
+        # 随机拼接词语，避免重复文本让压缩率失真
+        rng = random.Random(0)
+        words = ['论坛', '模型', '回复', '观点', '数据', '我认为', '不过', '例如', 'Python', 'API', '性能', '问题', '，', '。']
+        Post.objects.bulk_create([
+            Post(thread=thread, author=author, content='-',
+                 safe_content='<p>' + ''.join(rng.choices(words, k=80)) + '</p>')
+            for _ in range(rows)
+        ])
+        request = RequestFactory().get(f'/api/threads/{thread.pk}/')
+        posts = Post.objects.filter(thread=thread)
+
+        self.stdout.write(f"📊 {rows} 行 × {repeat} 次")
+        model_data = self._measure('ModelSerializer（含查询）', rows, repeat, lambda: PostSerializer(
+            posts.select_related('author__aiagent').defer('content', 'plain_text'),
+            many=True, context={'request': request},
+        ).data)
+        fast_data = self._measure('.values() 快速序列化（含查询）', rows, repeat,
+                                  lambda: serialize_posts(posts.values(*POST_VALUES), request))
+        if fast_data != model_data:
+            raise CommandError('两种序列化的输出不一致')
+
+        body = self._measure('DRF JSONRenderer', rows, repeat, lambda: JSONRenderer().render(fast_data))
+        self._measure('renderers.dumps（orjson）', rows, repeat, lambda: dumps(fast_data))
+
+        self.stdout.write(f"📦 未压缩 {len(body)} 字节")
+        level = settings.FORUM_COMPRESSION_GZIP_LEVEL
+        compressed = self._measure(f'gzip（level {level}）', rows, repeat,
+                                   lambda: gzip.compress(body, compresslevel=level, mtime=0))
+        self.stdout.write(f"   → {len(compressed)} 字节（{len(compressed) / len(body):.1%}）")
+        if brotli is not None:
+            quality = settings.FORUM_COMPRESSION_BROTLI_QUALITY
+            compressed = self._measure(f'br（quality {quality}）', rows, repeat,
+                                       lambda: brotli.compress(body, quality=quality))
+            self.stdout.write(f"   → {len(compressed)} 字节（{len(compressed) / len(body):.1%}）")
+
+    def _measure(self, label, rows, repeat, func):
+        result = func()  # 预热
+        started = time.perf_counter()
+        for _ in range(repeat):
+            result = func()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{label:<32} {elapsed / repeat * 1000:>8.3f} ms/次 {rows * repeat / elapsed:>12,.0f} 行/秒"
+        )
+        return result
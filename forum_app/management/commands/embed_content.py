@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from forum_app.models import Post, Thread
+from forum_app.search import embed_pending_content
+
+
+class Command(BaseCommand):
+    help = '为还没有向量的帖子/回复计算 embedding（语义搜索用；可中断，重新运行会从剩余的行继续）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=['thread', 'post', 'all'], default='all')
+        parser.add_argument('--batch-size', type=int, default=64, help='每次调用 embedder 的文本数')
+
+    def handle(self, *args, **options):
+        models = {'thread': [Thread], 'post': [Post], 'all': [Thread, Post]}[options['model']]
+        for model in models:
+            name = model._meta.verbose_name
+            remaining = model.objects.filter(embedding__isnull=True).exclude(plain_text='').count()
+            self.stdout.write(self.style.SUCCESS(f'🧮 {name}：待处理 {remaining} 行'))
+            started, total = time.perf_counter(), 0
+            while True:
+                done = embed_pending_content(options['batch_size'], models=[model], limit=options['batch_size'] * 10)
+                if not done:
+                    break
+                total += done
+                rate = total / (time.perf_counter() - started)
+                self.stdout.write(f'  ✅ 已处理 {total}/{remaining}（{rate:.0f} 行/秒）')
+            self.stdout.write(self.style.SUCCESS(f'✨ {name} 完成，共 {total} 行'))
@@ -0,0 +1,243 @@
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from ._http import Client
+
+OPERATIONS = ('create', 'reply', 'poll', 'list')
+
+
+class Command(BaseCommand):
+    help = ('模拟一批用户混合发帖、回帖、轮询，测量各接口的 p50/p99 延迟、吞吐和"发帖到第一条 AI 回复"的时间；'
+            '配合 run_llm_stub 可以离线运行，用于部署前的性能回归检查')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='服务地址（不含 /api）')
+        parser.add_argument('--users', type=int, default=20, help='并发的虚拟用户数')
+        parser.add_argument('--duration', type=float, default=60, help='持续秒数')
+        parser.add_argument('--think-ms', type=float, default=1000, help='每个用户两次操作之间的平均间隔（毫秒）')
+        parser.add_argument('--mix', default='create=1,reply=3,poll=10,list=2',
+                            help='各操作的权重：create 发帖、reply 回帖、poll 轮询帖子更新、list 帖子列表')
+        parser.add_argument('--ai-timeout', type=float, default=120, help='等待 AI 回复的最长秒数')
+        parser.add_argument('--ai-poll-ms', type=float, default=500, help='等待 AI 回复时的轮询间隔（毫秒）')
+        parser.add_argument('--timeout', type=float, default=10, help='单次请求超时（秒）')
+        parser.add_argument('--user-prefix', default='loadtest', help='虚拟用户名前缀，不存在时自动注册')
+        parser.add_argument('--password', default='loadtest-password')
+        parser.add_argument('--seed', type=int, default=0, help='随机种子，相同种子产生相同的操作序列')
+        parser.add_argument('--json', dest='json_path', help='把结果另存为 JSON 文件，便于与上次结果对比')
+
+    def handle(self, *args, **options):
+        parts = urlsplit(options['url'])
+        if parts.scheme != 'http' or not parts.hostname:
+            raise CommandError('只支持 http:// 地址')
+        mix = {}
+        for item in options['mix'].split(','):
+            name, _, weight = item.partition('=')
+            if name.strip() not in OPERATIONS:
+                raise CommandError(f'未知操作：{name}（可选 {", ".join(OPERATIONS)}）')
+            mix[name.strip()] = float(weight or 1)
+        options['mix'] = mix
+
+        self.stdout.write(f"🏋️ {options['url']}：{options['users']} 个用户，{options['duration']}s，"
+                          f"操作权重 {mix}，平均间隔 {options['think_ms']}ms")
+        result = asyncio.run(LoadTest(parts.hostname, parts.port or 80, options).run())
+
+        self.stdout.write(f"{'操作':<8} {'次数':>7} {'请求/秒':>8} {'p50 ms':>8} {'p99 ms':>8} {'错误':>6}")
+        for name, row in result['operations'].items():
+            self.stdout.write(f"{name:<8} {row['count']:>7} {row['rps']:>8.1f} {row['p50']:>8.1f} "
+                              f"{row['p99']:>8.1f} {row['errors']:>6}")
+        ai = result['ai_reply']
+        self.stdout.write(
+            f"🤖 发帖/回帖到第一条 AI 回复：{ai['count']} 次，p50 {ai['p50']:.2f}s，p99 {ai['p99']:.2f}s，"
+            f"超时 {ai['timeouts']}，未触发 AI（限流）{ai['skipped']}"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ 总吞吐 {result['rps']:.1f} 请求/秒，错误 {result['errors']}"
+        ))
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"📝 结果已写入 {options['json_path']}")
+
+
+def _summary(samples, duration):
+    values = np.array(samples) * 1000 if samples else np.zeros(1)
+    return {
+        'count': len(samples),
+        'rps': len(samples) / duration,
+        'p50': float(np.percentile(values, 50)),
+        'p99': float(np.percentile(values, 99)),
+    }
+
+
+class LoadTest:
+    def __init__(self, host, port, options):
+        self.host = host
+        self.port = port
+        self.options = options
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.ai_delays = []
+        self.ai_timeouts = 0
+        self.ai_skipped = 0
+        self.threads = []        # 可回帖/轮询的帖子：启动时的最新帖子 + 压测期间新发的帖子
+        self.watchers = []
+
+    def client(self, token=None):
+        headers = [f'Authorization: Bearer {token}'] if token else []
+        return Client(self.host, self.port, self.options['timeout'], headers)
+
+    async def run(self):
+        options = self.options
+        tokens = await asyncio.gather(*(self.login(i) for i in range(options['users'])))
+        client = self.client()
+        status, _, body = await client.request('GET', '/api/threads/')
+        client.close()
+        if status == 200:
+            self.threads = [thread['id'] for thread in json.loads(body)['results']]
+
+        started = time.monotonic()
+        deadline = started + options['duration']
+        await asyncio.gather(*(self.user(i, token, deadline) for i, token in enumerate(tokens)))
+        elapsed = time.monotonic() - started
+        # 压测结束后继续等待已发出的帖子拿到 AI 回复（各自有 ai_timeout 上限）
+        await asyncio.gather(*self.watchers)
+
+        operations = {
+            name: {**_summary(self.latencies[name], elapsed), 'errors': self.errors[name]}
+            for name in OPERATIONS if name in options['mix']
+        }
+        delays = np.array(self.ai_delays) if self.ai_delays else np.zeros(1)
+        return {
+            'users': options['users'],
+            'duration': round(elapsed, 1),
+            'rps': sum(row['count'] for row in operations.values()) / elapsed,
+            'errors': sum(self.errors.values()),
+            'operations': operations,
+            'ai_reply': {
+                'count': len(self.ai_delays),
+                'p50': float(np.percentile(delays, 50)),
+                'p99': float(np.percentile(delays, 99)),
+                'timeouts': self.ai_timeouts,
+                'skipped': self.ai_skipped,
+            },
+        }
+
+    async def login(self, i):
+        """登录第 i 个虚拟用户，不存在时先注册；返回 access token"""
+        username = f"{self.options['user_prefix']}_{i}"
+        credentials = {'username': username, 'password': self.options['password']}
+        client = self.client()
+        try:
+            status, _, body = await client.request('POST', '/api/login/', credentials)
+            if status == 401:
+                status, _, body = await client.request(
+                    'POST', '/api/register/', {**credentials, 'email': f'{username}@loadtest.local'}
+                )
+                if status != 201:
+                    raise CommandError(f'注册 {username} 失败：{status} {body[:200]!r}')
+                status, _, body = await client.request('POST', '/api/login/', credentials)
+            if status != 200:
+                raise CommandError(f'登录 {username} 失败：{status} {body[:200]!r}')
+            return json.loads(body)['access']
+        finally:
+            client.close()
+
+    async def user(self, i, token, deadline):
+        options = self.options
+        rng = random.Random(f"{options['seed']}:{i}")
+        names, weights = list(options['mix']), list(options['mix'].values())
+        client = self.client(token)
+        etags = {}
+        # 用户在一个间隔内错开启动
+        await asyncio.sleep(rng.random() * options['think_ms'] / 1000)
+        while time.monotonic() < deadline:
+            name = rng.choices(names, weights)[0]
+            if name in ('reply', 'poll') and not self.threads:
+                name = 'create'
+            started = time.monotonic()
+            try:
+                ok = await getattr(self, f'op_{name}')(client, rng, etags, f'{i}-{started:.6f}')
+            except (asyncio.TimeoutError, OSError, ValueError, asyncio.IncompleteReadError):
+                ok = False
+            if ok:
+                self.latencies[name].append(time.monotonic() - started)
+            else:
+                self.errors[name] += 1
+            # 指数分布的间隔，平均为 think_ms
+            await asyncio.sleep(rng.expovariate(1000 / options['think_ms']) if options['think_ms'] else 0)
+        client.close()
+
+    async def op_create(self, client, rng, etags, marker):
+        status, _, body = await client.request('POST', '/api/create/', {
+            'title': f'压测帖子 {marker}',
+            'content': f'<p>压测内容 {marker}：缓存、索引和连接池哪个对性能影响最大？</p>',
+        })
+        if status != 200:
+            return False
+        data = json.loads(body)
+        self.threads.append(data['thread_id'])
+        self.watch(data['thread_id'], data['ai'])
+        return True
+
+    async def op_reply(self, client, rng, etags, marker):
+        thread_id = rng.choice(self.threads[-50:])
+        status, _, body = await client.request('POST', f'/api/threads/{thread_id}/reply/', {
+            'content': f'<p>压测回复 {marker}：我觉得还要看具体的负载。</p>',
+        })
+        if status != 200:
+            return False
+        self.watch(thread_id, json.loads(body)['ai'], marker)
+        return True
+
+    async def op_poll(self, client, rng, etags, marker):
+        # 和前端一样带上 If-None-Match，没有变化时返回 304
+        thread_id = rng.choice(self.threads[-50:])
+        headers = [f'If-None-Match: {etags[thread_id]}'] if thread_id in etags else []
+        status, response_headers, _ = await client.request('GET', f'/api/threads/{thread_id}/posts/', headers=headers)
+        if 'etag' in response_headers:
+            etags[thread_id] = response_headers['etag']
+        return status in (200, 304)
+
+    async def op_list(self, client, rng, etags, marker):
+        status, _, _ = await client.request('GET', '/api/threads/')
+        return status == 200
+
+    def watch(self, thread_id, admission, marker=None):
+        if admission.get('status') == 'skipped':
+            self.ai_skipped += 1
+            return
+        self.watchers.append(asyncio.ensure_future(self.wait_for_ai(thread_id, marker, time.monotonic())))
+
+    async def wait_for_ai(self, thread_id, marker, started):
+        """
+        轮询帖子更新，直到自己的帖子/回复之后出现 AI 回复
+        新帖（marker 为 None）的所有回复都在它之后；回帖时按 marker 找到自己的回复，只统计它之后的 AI 回复
+        """
+        options = self.options
+        client = self.client()
+        after, own_id = 0, (0 if marker is None else None)
+        try:
+            while time.monotonic() - started < options['ai_timeout']:
+                try:
+                    status, _, body = await client.request('GET', f'/api/threads/{thread_id}/posts/?after={after}')
+                except (asyncio.TimeoutError, OSError, ValueError, asyncio.IncompleteReadError):
+                    status = 0
+                if status == 200:
+                    for post in json.loads(body)['posts']:
+                        after = post['id']
+                        if marker and marker in post['content'] and not post['is_ai']:
+                            own_id = post['id']
+                        elif post['is_ai'] and own_id is not None:
+                            self.ai_delays.append(time.monotonic() - started)
+                            return
+                await asyncio.sleep(options['ai_poll_ms'] / 1000)
+            self.ai_timeouts += 1
+        finally:
+            client.close()
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from forum_app.models import Category, Post, Thread
+
+
+class Command(BaseCommand):
+    help = ('按 Vote / Post 表重新计算回复得分，以及帖子的回复数、最后活动、得分和热度'
+            '（score / reply_count / last_post_at / last_post_author / hot_rank），以及各分类的帖子数')
+
+    def add_arguments(self, parser):
+        parser.add_argument('thread_ids', nargs='*', type=int, help='只修复指定的帖子（默认全部）')
+        parser.add_argument('--batch-size', type=int, default=1000, help='每条 UPDATE 处理的帖子数')
+
+    def handle(self, *args, **options):
+        ids = options['thread_ids'] or list(Thread.objects.order_by('id').values_list('id', flat=True))
+        batch_size = options['batch_size']
+        self.stdout.write(self.style.SUCCESS(f'🔧 开始修复 {len(ids)} 个帖子的计数...'))
+
+        updated = 0
+        for start in range(0, len(ids), batch_size):
+            # 分批更新，避免一次锁住整张帖子表；帖子得分由回复得分汇总，先算回复
+            batch = ids[start:start + batch_size]
+            Post.refresh_scores(batch)
+            updated += Thread.refresh_counters(batch)
+            self.stdout.write(f'  ✅ {min(start + batch_size, len(ids))}/{len(ids)}')
+
+        if not options['thread_ids']:
+            # 分类数量很少，一条 UPDATE 完成
+            self.stdout.write(f'  ✅ 分类帖子数：{Category.refresh_counts()} 个分类')
+
+        self.stdout.write(self.style.SUCCESS(f'✨ 完成！更新了 {updated} 个帖子'))
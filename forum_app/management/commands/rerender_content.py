@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from django.db.models import Q
+
+from forum_app.models import Post, Thread
+from forum_app.text import rerender_queryset
+
+
+class Command(BaseCommand):
+    help = '重新计算帖子/回复的清理后 HTML、纯文本、预览和全文检索向量（修改了处理规则或导入了旧数据后运行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=['thread', 'post', 'all'], default='all')
+        parser.add_argument('--only-missing', action='store_true', help='只处理还没有纯文本或全文检索向量的行')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        models = {'thread': [Thread], 'post': [Post], 'all': [Thread, Post]}[options['model']]
+        for model in models:
+            queryset = model.objects.all()
+            if options['only_missing']:
+                queryset = queryset.filter(Q(plain_text='') | Q(search_vector__isnull=True)).exclude(content='')
+            name = model._meta.verbose_name
+            self.stdout.write(self.style.SUCCESS(f'🔄 开始处理 {name}...'))
+            total = 0
+            for total in rerender_queryset(queryset, options['batch_size']):
+                self.stdout.write(f'  ✅ 已处理 {total} 行')
+            self.stdout.write(self.style.SUCCESS(f'✨ {name} 完成，共 {total} 行'))
@@ -0,0 +1,64 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from forum_app import metrics
+from forum_app.db import db_stats
+from forum_app.jobs import WorkerPool, prune_finished_jobs, queue_stats, recover_stale_jobs
+from forum_app.search import schedule_content_embedding
+
+
+class Command(BaseCommand):
+    help = '启动 AI 回复生成 worker（从任务队列中领取并执行生成任务）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.FORUM_AI_WORKERS,
+                            help='并发 worker 数量（默认 FORUM_AI_WORKERS）')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='队列为空时的轮询间隔（秒）')
+        parser.add_argument('--stats-interval', type=int, default=60,
+                            help='打印队列统计、回收过期任务的间隔（秒）')
+        parser.add_argument('--metrics-port', type=int, default=0,
+                            help='在该端口提供 Prometheus 指标（/metrics），0 表示不提供')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('🤖 启动 AI worker...'))
+
+        requeued, failed, reset = recover_stale_jobs()
+        self.stdout.write(f'  ♻️  启动恢复：重新排队 {requeued} 个，失败 {failed} 个，复位帖子 {reset} 个')
+
+        pool = WorkerPool(options['workers'], poll_interval=options['poll_interval'])
+        pool.start()
+
+        if options['metrics_port']:
+            metrics.start_http_server(options['metrics_port'])
+            self.stdout.write(f"  📈 指标：http://0.0.0.0:{options['metrics_port']}/metrics")
+            if not settings.FORUM_METRICS_TOKEN and not settings.FORUM_METRICS_PUBLIC:
+                self.stdout.write(self.style.WARNING(
+                    '  ⚠️  未设置 FORUM_METRICS_TOKEN（也未设置 FORUM_METRICS_PUBLIC），指标端口会拒绝所有请求'
+                ))
+
+        try:
+            while True:
+                time.sleep(options['stats_interval'])
+                # 其他进程崩溃留下的任务也在这里接手
+                recover_stale_jobs()
+                prune_finished_jobs()
+                # 其他进程写入的帖子/回复在这里补算向量
+                schedule_content_embedding()
+                stats = queue_stats()
+                self.stdout.write(
+                    f"📊 排队 {stats['pending']} / 运行 {stats['running']} / 本进程忙碌 {pool.busy}，"
+                    f"平均等待 {stats['avg_wait_seconds']}s，最久等待 {stats['oldest_pending_wait_seconds']}s"
+                )
+                db = db_stats()
+                if db['pool']:
+                    self.stdout.write(
+                        f"🗄️ 连接池 使用中 {db['pool']['in_use']}/{db['pool']['max_size']}，"
+                        f"等待 {db['pool']['waiting']}，累计超时/错误 {db['pool']['requests_errors']}"
+                    )
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('⏹️  正在停止，等待运行中的任务完成...'))
+            pool.stop()
+            self.stdout.write(self.style.SUCCESS('✨ 已停止'))
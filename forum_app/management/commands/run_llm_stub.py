@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from forum_app.llm_stub import StubConfig, start_stub_server
+
+
+class Command(BaseCommand):
+    help = '启动本地的 OpenAI 兼容接口替身（确定性回复和向量，可配置延迟），用于离线测试和压测'
+
+    def add_arguments(self, parser):
+        defaults = StubConfig()
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8900)
+        parser.add_argument('--first-token-ms', type=float, default=defaults.first_token_ms,
+                            help='收到请求到第一段文本的延迟（毫秒）')
+        parser.add_argument('--tokens-per-second', type=float, default=defaults.tokens_per_second,
+                            help='生成速度，0 表示不限速')
+        parser.add_argument('--reply-tokens', type=int, default=defaults.reply_tokens, help='每条回复的大致 token 数')
+        parser.add_argument('--embedding-ms', type=float, default=defaults.embedding_ms, help='向量接口的延迟（毫秒）')
+        parser.add_argument('--error-rate', type=float, default=defaults.error_rate,
+                            help='按请求内容确定性失败的比例（0-1）')
+
+    def handle(self, *args, **options):
+        config = StubConfig(
+            first_token_ms=options['first_token_ms'],
+            tokens_per_second=options['tokens_per_second'],
+            reply_tokens=options['reply_tokens'],
+            embedding_ms=options['embedding_ms'],
+            error_rate=options['error_rate'],
+        )
+        server, base_url = start_stub_server(options['port'], options['host'], config)
+        self.stdout.write(self.style.SUCCESS(f'🧪 模型接口替身已启动：{base_url}'))
+        self.stdout.write(f'   {config}')
+        self.stdout.write(f'   web / worker 进程设置 OPENAI_API_BASE={base_url} 即可使用')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+            self.stdout.write(self.style.SUCCESS('✨ 已停止'))
@@ -0,0 +1,436 @@
+import io
+import multiprocessing
+import os
+import time
+import zlib
+from datetime import datetime, timezone as dt_timezone
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from forum_app.embeddings import DIMENSIONS, content_hash
+from forum_app.ingest import copy_escape, copy_from
+from forum_app.models import Actor, AIAgent, Category, Document, HumanUser, KnowledgeBase, Post, Thread, Vote
+from forum_app.models.content_models import hot_rank
+from forum_app.response_cache import invalidate_thread_list
+from forum_app.text import render_content, search_vector_literal
+
+from .benchmark_rag import _normalize, _sample
+
+# 预留 id 时 advisory lock 的第一个键，与 admission.py 的 'FORU' 区分
+_ID_LOCK_CLASS = 0x53454544  # 'SEED'
+# 作者按 u ** 3 抽样：少数活跃用户贡献大部分帖子
+_ACTIVITY_SKEW = 3
+NULL = '\\N'
+
+WORDS = [
+    '数据库', '索引', '缓存', '性能', '架构', '部署', '并发', '事务', '连接池', '查询', '延迟', '吞吐',
+    '向量', '检索', '模型', '提示词', '上下文', '推理', '训练', '评估', '前端', '后端', '接口', '框架',
+    '我觉得', '其实', '但是', '因为', '所以', '如果', '可能', '应该', '比较', '非常', '还是', '已经',
+    '问题', '方案', '经验', '测试', '监控', '日志', '成本', '用户', '体验', '设计', '重构', '代码',
+    '哲学', '意义', '时间', '自由', '选择', '生活', '工作', '学习', '读书', '电影', '旅行', '音乐',
+    'Django', 'Postgres', 'Python', 'Redis', 'pgvector', 'HNSW', 'ASGI', 'JSON', 'SQL', 'API',
+]
+CATEGORIES = [
+    ('技术', '编程、架构与工具'), ('人工智能', '模型、提示词与应用'), ('哲学', '思辨与讨论'),
+    ('生活', '日常与经验分享'), ('读书', '书评与读书笔记'), ('影音', '电影、音乐与游戏'),
+    ('职场', '工作与职业发展'), ('闲聊', '随便聊聊'),
+]
+
+
+class Command(BaseCommand):
+    help = ('批量生成测试数据：用户、AI 角色、帖子（每帖回复数服从幂律分布）、投票、知识库文档（随机向量），'
+            '用于评估硬件规模和索引。数据按批用 COPY 写入，多进程并行，内存占用只和批大小有关。'
+            '请在测试库上、没有其他写入时运行')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='人类用户数')
+        parser.add_argument('--agents', type=int, default=10, help='AI 角色数；0 表示使用已有的 AI 角色')
+        parser.add_argument('--threads', type=int, default=10_000, help='帖子数')
+        parser.add_argument('--posts-per-thread', type=float, default=20, help='每帖平均回复数')
+        parser.add_argument('--alpha', type=float, default=1.5,
+                            help='回复数/投票数幂律分布的指数（须大于 1，越小长尾越重）')
+        parser.add_argument('--max-posts-per-thread', type=int, default=5000, help='单帖回复数上限')
+        parser.add_argument('--ai-share', type=float, default=0.3, help='回复中 AI 角色发言的比例')
+        parser.add_argument('--votes-per-post', type=float, default=2, help='每条回复平均投票数')
+        parser.add_argument('--days', type=float, default=365, help='发帖时间分布在最近多少天内')
+        parser.add_argument('--kbs', type=int, default=4, help='知识库数量')
+        parser.add_argument('--kb-docs', type=int, default=10_000, help='知识库文档总数（随机向量）')
+        parser.add_argument('--embedding-share', type=float, default=0.0,
+                            help='帖子/回复中写入随机向量的比例（评估 HNSW 索引规模；其余留空）')
+        parser.add_argument('--texts', type=int, default=5000, help='预先生成并渲染的正文数，回复从中抽取')
+        parser.add_argument('--chunk-threads', type=int, default=500, help='每批（一个事务）写入的帖子数')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='并行写入的进程数')
+        parser.add_argument('--defer-indexes', action='store_true',
+                            help='写入前删除文档/帖子/回复/投票表的二级索引和外键，写完后重建并一次性校验'
+                                 '（大批量时快得多；重建的是整张表，期间查询会很慢；进程被强制结束时不会恢复）')
+        parser.add_argument('--maintenance-work-mem', default='512MB', help='重建索引时使用的 maintenance_work_mem')
+        parser.add_argument('--prefix', default='seed', help='用户名、知识库名前缀；重复运行时在已有数据后追加')
+        parser.add_argument('--password', default='seed-password', help='所有生成用户的密码（可用于 load_test）')
+        parser.add_argument('--seed', type=int, default=0, help='随机种子；相同参数和种子生成相同的数据')
+
+    def handle(self, *args, **options):
+        if options['alpha'] <= 1:
+            raise CommandError('--alpha 须大于 1（否则分布没有有限的均值）')
+        if options['users'] < 1 and options['threads']:
+            raise CommandError('生成帖子至少需要 1 个用户')
+        started = time.perf_counter()
+
+        categories = [Category.objects.get_or_create(name=name, defaults={'description': description})[0].id
+                      for name, description in CATEGORIES]
+        humans = self._create_users(options)
+        agents = self._create_agents(options)
+        deferred = []
+        if options['defer_indexes']:
+            with connection.cursor() as cursor:
+                deferred = drop_secondary_indexes(cursor, (Document, Thread, Post, Vote))
+            self.stdout.write(f'🗑️ 暂时删除二级索引和外键 {len(deferred)} 个')
+        try:
+            self._create_documents(options, agents)
+            if options['threads']:
+                self._create_threads(options, humans, agents, categories)
+        finally:
+            if deferred:
+                self._rebuild_indexes(deferred, options)
+        # 各批并行写入，分类帖子数最后按 (category, created_at, id) 索引统一计算
+        Category.refresh_counts()
+
+        with connection.cursor() as cursor:
+            for model in (Actor, HumanUser, Thread, Post, Vote, Document):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+        invalidate_thread_list()
+        self.stdout.write(self.style.SUCCESS(f'✨ 完成，用时 {time.perf_counter() - started:.1f}s'))
+        if options['embedding_share'] < 1:
+            self.stdout.write(self.style.WARNING(
+                '⚠️ 没有向量的帖子/回复会在下次有新内容时由后台补算（FORUM_SEARCH_EMBEDDINGS）；'
+                '测试环境请把 FORUM_RAG_EMBEDDER 设为 local 或指向 run_llm_stub，避免调用真实接口'
+            ))
+
+    # ---------- 用户、AI 角色、知识库 ----------
+
+    def _create_users(self, options):
+        """返回 (第一个用户的 id, 用户数)：生成的用户 id 连续"""
+        n, prefix = options['users'], options['prefix']
+        offset = Actor.objects.filter(username__startswith=f'{prefix}_', humanuser__isnull=False).count()
+        password = make_password(options['password'])
+        now = timezone.now().isoformat()
+        with connection.cursor() as cursor:
+            first = reserve_ids(cursor, Actor, n)
+        batch = 50_000
+        for start in range(0, n, batch):
+            actors, users = io.StringIO(), io.StringIO()
+            for i in range(start, min(start + batch, n)):
+                username = f'{prefix}_{offset + i}'
+                actors.write(f'{first + i}\t{username}\t{now}\n')
+                users.write(f'{first + i}\t{password}\tf\t{username}@{prefix}.local\tf\tt\n')
+            with transaction.atomic(), connection.cursor() as cursor:
+                copy_rows(cursor, Actor, 'id, username, created_at', actors)
+                copy_rows(cursor, HumanUser, 'actor_ptr_id, password, is_superuser, email, is_staff, is_active', users)
+        self.stdout.write(f'👥 用户 {n} 个（{prefix}_{offset} ~ {prefix}_{offset + n - 1}，密码 {options["password"]}）')
+        return first, n
+
+    def _create_agents(self, options):
+        """AI 角色数量少，走 ORM，触发 AI 角色注册表的失效信号"""
+        n, prefix = options['agents'], options['prefix']
+        if not n:
+            ids = list(AIAgent.objects.values_list('pk', flat=True))
+            self.stdout.write(f'🤖 使用已有的 AI 角色 {len(ids)} 个')
+            return ids
+        offset = AIAgent.objects.filter(username__startswith=f'{prefix}_ai_').count()
+        ids = []
+        for i in range(offset, offset + n):
+            agent = AIAgent.objects.create(
+                username=f'{prefix}_ai_{i}',
+                bio='测试数据生成的 AI 角色',
+                system_prompt=f'你是论坛里的第 {i} 号测试角色，回复简洁，观点明确。',
+            )
+            ids.append(agent.pk)
+        self.stdout.write(f'🤖 AI 角色 {n} 个')
+        return ids
+
+    def _create_documents(self, options, agents):
+        n_kbs, total = options['kbs'], options['kb_docs']
+        if not n_kbs or not total:
+            return
+        prefix = options['prefix']
+        offset = KnowledgeBase.objects.filter(name__startswith=f'{prefix}_kb_').count()
+        kbs = [KnowledgeBase.objects.create(name=f'{prefix}_kb_{offset + i}') for i in range(n_kbs)]
+        rng = np.random.default_rng([options['seed'], 2])
+        # 生成的每个角色挂载 1~2 个知识库（不改动已有的角色）
+        for agent in AIAgent.objects.filter(pk__in=agents if options['agents'] else []):
+            agent.knowledge_bases.add(*rng.choice(kbs, min(len(kbs), rng.integers(1, 3)), replace=False))
+
+        texts = text_pool(options['seed'], options['texts'])
+        # 文档围绕若干簇中心分布，比均匀随机向量更接近真实文本向量（同 benchmark_rag）
+        centers = _normalize(rng.standard_normal((max(16, n_kbs * 8), DIMENSIONS)))
+        batch, done, started = 2000, 0, time.perf_counter()
+        for start in range(0, total, batch):
+            n = min(batch, total - start)
+            owners = rng.integers(0, n_kbs, n)
+            vectors = _sample(rng, centers, n)
+            buffer = io.StringIO()
+            for i in range(n):
+                text = f"{texts[rng.integers(len(texts))][2]}（{prefix} 文档 {offset}-{start + i}）"
+                buffer.write(f'{kbs[owners[i]].pk}\t{content_hash(text)}\t{prefix}\t{copy_escape(text)}\t'
+                             f'{vector_literal(vectors[i])}\n')
+            with transaction.atomic(), connection.cursor() as cursor:
+                copy_rows(cursor, Document, 'kb_id, content_hash, source, text_content, embedding', buffer)
+            done += n
+        self.stdout.write(f'📚 知识库 {n_kbs} 个，文档 {done} 条（{done / (time.perf_counter() - started):.0f} 条/秒）')
+
+    # ---------- 帖子、回复、投票 ----------
+
+    def _create_threads(self, options, humans, agents, categories):
+        now = time.time()
+        plan = {
+            **{key: options[key] for key in (
+                'seed', 'threads', 'chunk_threads', 'posts_per_thread', 'alpha', 'max_posts_per_thread',
+                'ai_share', 'votes_per_post', 'embedding_share', 'texts',
+            )},
+            'now': now,
+            'start': now - options['days'] * 86400,
+            'humans': humans,
+            'agents': agents,
+            'categories': categories,
+        }
+        chunks = range((options['threads'] + options['chunk_threads'] - 1) // options['chunk_threads'])
+        workers = max(1, min(options['workers'], len(chunks)))
+        self.stdout.write(f"📝 帖子 {options['threads']} 个，分 {len(chunks)} 批，{workers} 个进程并行写入...")
+
+        totals, started, reported = np.zeros(3, dtype=np.int64), time.perf_counter(), 0
+        if workers == 1:
+            results = (seed_chunk(plan, index) for index in chunks)
+        else:
+            # fork 前关闭本进程的连接（和连接池），子进程各自建立连接
+            connections.close_all()
+            for alias in connections:
+                if hasattr(connections[alias], 'close_pool'):
+                    connections[alias].close_pool()
+            executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+            results = (future.result() for future in as_completed(
+                [executor.submit(seed_chunk, plan, index) for index in chunks]
+            ))
+        for done, result in enumerate(results, 1):
+            totals += result
+            if done * 10 // len(chunks) > reported or done == len(chunks):
+                reported = done * 10 // len(chunks)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'  📥 {done}/{len(chunks)} 批：帖子 {totals[0]}，回复 {totals[1]}，投票 {totals[2]}'
+                                  f'（{totals[1] / elapsed:.0f} 条回复/秒）')
+        if workers > 1:
+            executor.shutdown()
+
+
+    def _rebuild_indexes(self, definitions, options):
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute('SET maintenance_work_mem = %s', [options['maintenance_work_mem']])
+            for name, definition in definitions:
+                step = time.perf_counter()
+                cursor.execute(definition)
+                self.stdout.write(f'  🔨 {name}：{time.perf_counter() - step:.1f}s')
+            cursor.execute('RESET maintenance_work_mem')
+        self.stdout.write(f'🔨 重建索引和外键 {len(definitions)} 个，用时 {time.perf_counter() - started:.1f}s')
+
+
+def drop_secondary_indexes(cursor, models):
+    """
+    删除不属于约束（主键、唯一约束）的索引以及外键，返回 [(名称, 重建用的语句), ...]
+    逐行维护 GIN 索引、逐行触发外键检查是批量写入的主要开销，写完后整体重建要快得多
+    """
+    tables = [model._meta.db_table for model in models]
+    cursor.execute(
+        'SELECT i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid) FROM pg_index i '
+        'WHERE i.indrelid = ANY(%s::regclass[]) '
+        'AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)',
+        [tables],
+    )
+    indexes = cursor.fetchall()
+    cursor.execute(
+        "SELECT conname, conrelid::regclass::text, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE contype = 'f' AND conrelid = ANY(%s::regclass[])",
+        [tables],
+    )
+    foreign_keys = [(name, table, f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}')
+                    for name, table, definition in cursor.fetchall()]
+    for name, _ in indexes:
+        cursor.execute(f'DROP INDEX {name}')
+    for name, table, _ in foreign_keys:
+        cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {name}')
+    return indexes + [(name, statement) for name, _, statement in foreign_keys]
+
+
+def reserve_ids(cursor, model, n):
+    """
+    预留 n 个连续的自增 id，返回第一个
+
+    并行的预留用 advisory lock 串行化；同时有其他写入（按序列逐个取 id）时可能冲突，所以只在空闲的库上运行。
+    """
+    if n <= 0:
+        return None
+    table = model._meta.db_table
+    key = zlib.crc32(table.encode()) & 0x7FFFFFFF
+    cursor.execute('SELECT pg_advisory_lock(%s, %s)', [_ID_LOCK_CLASS, key])
+    try:
+        cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id'))", [table])
+        first = cursor.fetchone()[0]
+        if n > 1:
+            cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)", [table, first + n - 1])
+    finally:
+        cursor.execute('SELECT pg_advisory_unlock(%s, %s)', [_ID_LOCK_CLASS, key])
+    return first
+
+
+def copy_rows(cursor, model, columns, buffer):
+    buffer.seek(0)
+    copy_from(cursor.cursor, f'COPY {model._meta.db_table} ({columns}) FROM STDIN', buffer)
+
+
+def power_law(rng, mean, alpha, size, cap):
+    """均值约为 mean 的离散幂律（Lomax）分布，截断到 cap"""
+    if mean <= 0 or cap <= 0:
+        return np.zeros(size, dtype=np.int64)
+    return np.minimum(np.floor(mean * (alpha - 1) * rng.pareto(alpha, size)), cap).astype(np.int64)
+
+
+def vector_literal(vector):
+    return '[' + ','.join(f'{v:.5f}' for v in vector.tolist()) + ']'
+
+
+def _random_unit(rng):
+    vector = rng.standard_normal(DIMENSIONS)
+    return vector / np.linalg.norm(vector)
+
+
+_text_pools = {}
+
+
+def text_pool(seed, size):
+    """
+    预先生成并渲染的正文 [(COPY 行的正文列, 回复的检索向量列, 纯文本), ...]，每个进程按参数缓存一份
+    正文列依次为 content、safe_content、plain_text、content_preview；回复从池中抽取，不必逐行解析 HTML 和分词
+    """
+    key = (seed, size)
+    if key not in _text_pools:
+        rng = np.random.default_rng([seed, 1])
+        pool = []
+        for _ in range(size):
+            # 正文长度同样是长尾分布：大多数回复很短，少数很长
+            words = rng.choice(WORDS, 4 + min(int(rng.pareto(1.5) * 12), 300))
+            sentences = [''.join(words[i:i + 6]) for i in range(0, len(words), 6)]
+            content = '<p>' + '，'.join(sentences) + '。</p>'
+            safe_content, plain_text, preview = render_content(content)
+            vector = search_vector_literal([(plain_text, 'B')])
+            fields = '\t'.join(copy_escape(value) for value in (content, safe_content, plain_text, preview))
+            pool.append((fields, copy_escape(vector) if vector else NULL, plain_text))
+        _text_pools[key] = pool
+    return _text_pools[key]
+
+
+def _timestamps(seconds):
+    """epoch 秒数组 -> COPY 可用的 UTC 时间字符串数组"""
+    return np.char.add(np.datetime_as_string((seconds * 1e6).astype('datetime64[us]'), unit='us'), '+00:00')
+
+
+def _skewed(rng, first, count, size):
+    return first + (count * rng.random(size) ** _ACTIVITY_SKEW).astype(np.int64)
+
+
+def seed_chunk(plan, index):
+    """
+    生成并写入第 index 批帖子及其回复、投票（一个事务），返回 (帖子数, 回复数, 投票数)
+
+    每批的随机数只由 (seed, index) 决定，与进程数和完成顺序无关。
+    帖子的冗余计数（回复数、最后活动、得分、热度）和回复得分按生成的回复、投票直接算好。
+    """
+    rng = np.random.default_rng([plan['seed'], 3, index])
+    texts = text_pool(plan['seed'], plan['texts'])
+    first_human, n_humans = plan['humans']
+    agents, categories = np.array(plan['agents'], dtype=np.int64), plan['categories']
+
+    position = index * plan['chunk_threads'] + np.arange(min(plan['chunk_threads'], plan['threads'] - index * plan['chunk_threads']))
+    n = len(position)
+    # 帖子 id 与发帖时间同序
+    thread_times = plan['start'] + (position + rng.random(n)) / plan['threads'] * (plan['now'] - plan['start'])
+    thread_authors = _skewed(rng, first_human, n_humans, n)
+    thread_categories = [categories[i] for i in (len(categories) * rng.random(n) ** 2).astype(int)]
+    counts = power_law(rng, plan['posts_per_thread'], plan['alpha'], n, plan['max_posts_per_thread'])
+
+    # 回复：时间间隔服从指数分布，按帖子分组累加
+    total = int(counts.sum())
+    owner = np.repeat(np.arange(n), counts)
+    gaps = rng.exponential(1800, total)
+    cumulative = np.cumsum(gaps)
+    group_start = np.repeat(np.cumsum(counts) - counts, counts)
+    post_times = np.minimum(thread_times[owner] + cumulative - cumulative[group_start] + gaps[group_start], plan['now'])
+    post_authors = _skewed(rng, first_human, n_humans, total)
+    if len(agents):
+        by_ai = rng.random(total) < plan['ai_share']
+        post_authors[by_ai] = agents[rng.integers(0, len(agents), int(by_ai.sum()))]
+    post_texts = rng.integers(0, len(texts), total)
+
+    # 投票：每条回复的票数同样是长尾分布，同一用户对同一回复只投一次
+    votes = power_law(rng, plan['votes_per_post'], plan['alpha'], total, min(n_humans, 1000))
+    vote_posts = np.repeat(np.arange(total), votes)
+    pairs = np.unique(np.stack([vote_posts, _skewed(rng, first_human, n_humans, len(vote_posts))], axis=1), axis=0)
+    directions = np.where(rng.random(len(pairs)) < 0.8, 1, -1)
+    post_scores = np.bincount(pairs[:, 0], weights=directions, minlength=total).astype(np.int64)
+    thread_scores = np.bincount(owner, weights=post_scores, minlength=n).astype(np.int64)
+
+    # 最后活动：有回复的帖子取最后一条回复，否则是楼主发帖
+    last_times, last_authors = thread_times, thread_authors
+    if total:
+        last, has_posts = np.maximum(np.cumsum(counts) - 1, 0), counts > 0
+        last_times = np.where(has_posts, post_times[last], thread_times)
+        last_authors = np.where(has_posts, post_authors[last], thread_authors)
+
+    with connection.cursor() as cursor:
+        # 测试数据：提交时不等待 WAL 落盘，崩溃最多丢失最后几批
+        cursor.execute('SET synchronous_commit = off')
+        first_thread = reserve_ids(cursor, Thread, n)
+        first_post = reserve_ids(cursor, Post, total) or 0
+
+    # 逐行拼接前转成 Python 列表，避免格式化 numpy 标量的开销
+    threads = io.StringIO()
+    for thread_id, created, stamp, author, category, count, score, last_stamp, last_author in zip(
+        range(first_thread, first_thread + n), thread_times.tolist(), _timestamps(thread_times).tolist(),
+        thread_authors.tolist(), thread_categories, counts.tolist(), thread_scores.tolist(),
+        _timestamps(last_times).tolist(), last_authors.tolist(),
+    ):
+        fields, _, plain_text = texts[rng.integers(len(texts))]
+        title = ''.join(rng.choice(WORDS, rng.integers(2, 6))) + '？'
+        vector = search_vector_literal([(title, 'A'), (plain_text, 'B')])
+        embedding = vector_literal(_random_unit(rng)) if rng.random() < plan['embedding_share'] else NULL
+        # 标题只由 WORDS 组成，不需要转义；版本号取回复数
+        rank = hot_rank(score, count, datetime.fromtimestamp(created, dt_timezone.utc))
+        threads.write(f'{thread_id}\t{title}\t{stamp}\tf\t{author}\t{category}\t{count}\t{last_stamp}\t'
+                      f'{last_author}\t{count}\t{score}\t{rank!r}\t{fields}\t{copy_escape(vector) if vector else NULL}\t{embedding}\n')
+
+    posts = io.StringIO()
+    embed = (rng.random(total) < plan['embedding_share']).tolist() if plan['embedding_share'] else [False] * total
+    for post_id, thread_id, author, stamp, score, text, embedded in zip(
+        range(first_post, first_post + total), (first_thread + owner).tolist(), post_authors.tolist(),
+        _timestamps(post_times).tolist(), post_scores.tolist(), post_texts.tolist(), embed,
+    ):
+        fields, vector, _ = texts[text]
+        embedding = vector_literal(_random_unit(rng)) if embedded else NULL
+        posts.write(f'{post_id}\t{thread_id}\t{author}\t{stamp}\t{score}\t{fields}\t{vector}\t{embedding}\n')
+
+    vote_rows = io.StringIO()
+    for (post, voter), direction in zip(pairs.tolist(), directions.tolist()):
+        vote_rows.write(f'{first_post + post}\t{voter}\t{direction}\n')
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        copy_rows(cursor, Thread,
+                  'id, title, created_at, ai_generating, author_id, category_id, version, last_post_at, '
+                  'last_post_author_id, reply_count, score, hot_rank, content, safe_content, plain_text, content_preview, '
+                  'search_vector, embedding', threads)
+        copy_rows(cursor, Post,
+                  'id, thread_id, author_id, created_at, score, content, safe_content, plain_text, content_preview, '
+                  'search_vector, embedding', posts)
+        copy_rows(cursor, Vote, 'post_id, voter_id, direction', vote_rows)
+    return n, total, len(pairs)
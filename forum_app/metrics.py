@@ -0,0 +1,328 @@
+"""
+进程内指标（Prometheus 文本格式，/api/metrics/）
+
+- 请求：每个路由的耗时直方图、每个请求的 SQL 条数和耗时（MetricsMiddleware + 连接上的 execute_wrapper）
+- AI 生成：每个角色的 generate_reply 耗时和结果、模型调用耗时/首 token 时间/token 数/失败数、
+  运行中的生成轮数、从用户发帖（任务入队）到第一条/最后一条 AI 回复的时间
+- 跨进程的状态（任务队列、全局模型调用名额、连接池）在抓取时读取
+
+指标只在本进程内累计：gunicorn 多进程部署时每次抓取只看到处理该请求的进程；
+独立的 AI worker 用 run_ai_worker --metrics-port 单独暴露（生成相关的指标主要在 worker 中）。
+"""
+import contextvars
+import hmac
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LLM_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+DELAY_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300, 600)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}']
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各桶计数..., 总和, 总数]
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def _render_sample(self, key, state):
+        lines = [
+            f'{self.name}_bucket{_format_labels(self.labels, key, [("le", _format_value(bound))])} {count}'
+            for bound, count in zip(self.buckets, state)
+        ]
+        lines.append(f'{self.name}_bucket{_format_labels(self.labels, key, [("le", "+Inf")])} {state[-1]}')
+        lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {_format_value(state[-2])}')
+        lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {state[-1]}')
+        return lines
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def register_collector(self, func):
+        """抓取前调用 func()，用于在抓取时才读取的 Gauge"""
+        self._collectors.append(func)
+        return func
+
+    def render(self):
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception as e:
+                logger.warning(f"⚠️ 指标采集失败: {e}")
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# ==================== 请求 ====================
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'forum_http_request_duration_seconds', '请求处理耗时（流式响应只计到返回响应头）', ('method', 'route', 'status'),
+)
+HTTP_DB_QUERIES = Histogram('forum_http_db_queries', '每个请求执行的 SQL 条数', ('route',), buckets=COUNT_BUCKETS)
+HTTP_DB_SECONDS = Histogram('forum_http_db_seconds', '每个请求的 SQL 总耗时', ('route',))
+DB_QUERIES = Counter('forum_db_queries_total', '本进程执行的 SQL 条数（含后台线程）', ('source',))
+DB_QUERY_SECONDS = Counter('forum_db_query_seconds_total', '本进程执行 SQL 的总耗时', ('source',))
+
+# ==================== AI 生成 ====================
+
+AI_ROUNDS_INFLIGHT = Gauge('forum_ai_rounds_inflight', '本进程正在运行的生成轮数')
+AI_ROUNDS = Counter('forum_ai_rounds_total', '生成轮数', ('outcome',))
+AI_REPLY_SECONDS = Histogram(
+    'forum_ai_generate_reply_seconds', '每个角色一次 generate_reply 的耗时（含检索和模型调用）', ('agent',),
+    buckets=LLM_BUCKETS,
+)
+AI_REPLIES = Counter('forum_ai_replies_total', '每个角色的回复结果（posted/busy/failed/timeout）', ('agent', 'outcome'))
+AI_FIRST_REPLY_DELAY = Histogram(
+    'forum_ai_time_to_first_reply_seconds', '从用户发帖（任务入队）到第一条 AI 回复写入', buckets=DELAY_BUCKETS,
+)
+AI_LAST_REPLY_DELAY = Histogram(
+    'forum_ai_time_to_last_reply_seconds', '从用户发帖（任务入队）到本轮最后一条 AI 回复写入', buckets=DELAY_BUCKETS,
+)
+LLM_REQUESTS = Counter('forum_llm_requests_total', '模型调用次数（outcome: ok/error/busy）', ('model', 'agent', 'outcome'))
+LLM_SECONDS = Histogram('forum_llm_request_duration_seconds', '模型调用耗时', ('model', 'agent'), buckets=LLM_BUCKETS)
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    'forum_llm_first_token_seconds', '流式调用收到第一段文本的时间', ('model', 'agent'), buckets=LLM_BUCKETS,
+)
+LLM_TOKENS = Counter('forum_llm_tokens_total', '模型返回的 token 用量（kind: prompt/completion）', ('model', 'agent', 'kind'))
+
+# ==================== 抓取时读取 ====================
+
+AI_QUEUE_JOBS = Gauge('forum_ai_queue_jobs', '任务队列中的任务数（所有进程）', ('status',))
+LLM_INFLIGHT = Gauge('forum_llm_inflight_calls', '正在进行的模型调用数（所有进程，全局名额）')
+DB_POOL_CONNECTIONS = Gauge('forum_db_pool_connections', '本进程连接池的连接数', ('state',))
+DB_POOL_WAITING = Gauge('forum_db_pool_waiting', '本进程等待连接池的请求数')
+DB_SERVER_CONNECTIONS = Gauge('forum_db_server_connections', '服务端本应用的连接数（所有进程）', ('state',))
+DB_SERVER_MAX_CONNECTIONS = Gauge('forum_db_server_max_connections', '数据库 max_connections')
+
+
+@registry.register_collector
+def _collect_shared_state():
+    from .admission import inflight_calls
+    from .db import db_stats
+    from .jobs import queue_stats
+
+    stats = queue_stats()
+    AI_QUEUE_JOBS.set(stats['pending'], status='pending')
+    AI_QUEUE_JOBS.set(stats['running'], status='running')
+    inflight = inflight_calls()
+    if inflight is not None:
+        LLM_INFLIGHT.set(inflight)
+    db = db_stats()
+    if db['pool']:
+        DB_POOL_CONNECTIONS.set(db['pool']['in_use'], state='in_use')
+        DB_POOL_CONNECTIONS.set(db['pool']['available'], state='available')
+        DB_POOL_WAITING.set(db['pool']['waiting'])
+    if 'server' in db:
+        DB_SERVER_CONNECTIONS.clear()
+        for state, count in db['server']['app_by_state'].items():
+            DB_SERVER_CONNECTIONS.set(count, state=state)
+        DB_SERVER_MAX_CONNECTIONS.set(db['server']['max_connections'])
+
+
+# ==================== SQL 统计 ====================
+
+# 当前请求的 [SQL 条数, 耗时]；sync_to_async 会复制上下文，列表本身是共享的
+_request_queries = contextvars.ContextVar('forum_request_queries', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats = _request_queries.get()
+        source = 'background' if stats is None else 'request'
+        DB_QUERIES.inc(source=source)
+        DB_QUERY_SECONDS.inc(elapsed, source=source)
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """connection_created 信号：为每个线程的数据库连接挂上 SQL 计时"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def start_request():
+    """开始统计当前请求的 SQL，返回传给 finish_request 的令牌"""
+    stats = [0, 0.0]
+    return stats, _request_queries.set(stats), time.perf_counter()
+
+
+def finish_request(request, response, state):
+    stats, token, started = state
+    _request_queries.reset(token)
+    match = getattr(request, 'resolver_match', None)
+    route = match.route if match is not None else 'unmatched'
+    status = response.status_code if response is not None else 500
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, route=route, status=status)
+    HTTP_DB_QUERIES.observe(stats[0], route=route)
+    HTTP_DB_SECONDS.observe(stats[1], route=route)
+
+
+# ==================== 暴露 ====================
+
+def authorized(authorization):
+    """
+    Authorization: Bearer <FORUM_METRICS_TOKEN> 匹配，或 FORUM_METRICS_PUBLIC 时允许抓取
+    两者都不满足时 worker 的指标端口一律拒绝，/api/metrics/ 只接受管理员（见 views.api_metrics）
+    """
+    token = settings.FORUM_METRICS_TOKEN
+    if token and hmac.compare_digest(authorization or '', f'Bearer {token}'):
+        return True
+    return settings.FORUM_METRICS_PUBLIC
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if not authorized(self.headers.get('Authorization')):
+            self.send_response(401)
+            self.end_headers()
+            return
+        try:
+            body = registry.render().encode('utf-8')
+        finally:
+            from django.db import connection
+            connection.close()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host='0.0.0.0'):
+    """在后台线程中提供 /metrics（用于没有 web 接口的 AI worker 进程）"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
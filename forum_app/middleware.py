@@ -0,0 +1,133 @@
+"""
+中间件（都同时支持同步和异步请求，ASGI 下不额外切换线程）
+
+MetricsMiddleware：按路由记录请求耗时和 SQL 条数/耗时（见 metrics.py），放在最外层
+
+CompressionMiddleware：按 Accept-Encoding 协商 br / gzip
+- 只压缩 JSON 和文本，且不小于 FORUM_COMPRESSION_MIN_BYTES；头像图片和流式响应（SSE）不压缩
+- brotli 为可选依赖，未安装时只用 gzip
+- 没有使用 Django 的 GZipMiddleware：它在异步请求中要切换线程，且不支持 br
+"""
+import gzip
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:  # 可选依赖
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript')
+
+
+def choose_encoding(accept_encoding):
+    """
+    按 Accept-Encoding 的 q 值选出 'br' / 'gzip'，都不接受时返回 None
+    q 值相同时优先 br（同样的速度下压缩率更高）
+    """
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+
+    wildcard = weights.get('*', 0.0)
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_q = None, 0.0
+    for name in candidates:
+        q = weights.get(name, wildcard)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def compress_response(request, response):
+    if response.streaming or response.has_header('Content-Encoding'):
+        return response
+    content_type = response.get('Content-Type', '')
+    if not content_type.startswith(COMPRESSIBLE_TYPES):
+        return response
+    # 无论这次是否压缩，缓存都要按 Accept-Encoding 区分
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if len(response.content) < settings.FORUM_COMPRESSION_MIN_BYTES:
+        return response
+
+    encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if encoding == 'br':
+        compressed = brotli.compress(response.content, quality=settings.FORUM_COMPRESSION_BROTLI_QUALITY)
+    elif encoding == 'gzip':
+        compressed = gzip.compress(response.content, compresslevel=settings.FORUM_COMPRESSION_GZIP_LEVEL, mtime=0)
+    else:
+        return response
+    if len(compressed) >= len(response.content):
+        return response
+
+    response.content = compressed
+    response['Content-Length'] = str(len(compressed))
+    response['Content-Encoding'] = encoding
+    # 压缩后的字节不同，强 ETag 改为弱 ETag（与 Django 的 GZipMiddleware 一致）
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+    return response
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return compress_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return compress_response(request, await self.get_response(request))
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = metrics.start_request()
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            metrics.finish_request(request, response, state)
+
+    async def __acall__(self, request):
+        state = metrics.start_request()
+        response = None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            metrics.finish_request(request, response, state)
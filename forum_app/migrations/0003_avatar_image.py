@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:51
+
+import base64
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_avatar_data_to_binary(apps, schema_editor):
+    """把 avatar_data 中的 base64 data URL 解码为二进制，写入 AvatarImage"""
+    Actor = apps.get_model('forum_app', 'Actor')
+    AvatarImage = apps.get_model('forum_app', 'AvatarImage')
+
+    actors = Actor.objects.exclude(avatar_data__isnull=True).exclude(avatar_data='')
+    for actor in actors.iterator(chunk_size=200):
+        value = actor.avatar_data
+        content_type = 'image/jpeg'
+        if value.startswith('data:') and ',' in value:
+            header, value = value.split(',', 1)
+            content_type = header[len('data:'):].split(';', 1)[0] or content_type
+        try:
+            data = base64.b64decode(value)
+        except (ValueError, TypeError):
+            continue
+        content_hash = hashlib.sha256(data).hexdigest()
+        AvatarImage.objects.update_or_create(
+            actor_id=actor.pk,
+            defaults={'data': data, 'content_type': content_type, 'content_hash': content_hash},
+        )
+        Actor.objects.filter(pk=actor.pk).update(avatar_hash=content_hash)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum_app', '0002_thread_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actor',
+            name='avatar_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.CreateModel(
+            name='AvatarImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.BinaryField()),
+                ('content_type', models.CharField(default='image/jpeg', max_length=50)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('actor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='avatar_image', to='forum_app.actor')),
+            ],
+        ),
+        migrations.RunPython(move_avatar_data_to_binary, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='actor',
+            name='avatar_data',
+        ),
+    ]
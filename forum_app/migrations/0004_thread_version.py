@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum_app', '0003_avatar_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thread',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['thread', 'id'], name='post_thread_id_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum_app', '0005_generation_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThreadSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField(blank=True, default='')),
+                ('summarized_until', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('thread', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='forum_app.thread')),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:01
+
+import pgvector.django.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # 大知识库上建 HNSW 索引耗时较长，并发构建不锁表
+    atomic = False
+
+    dependencies = [
+        ('forum_app', '0006_thread_summary'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='document',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='document_embedding_hnsw_idx', opclasses=['vector_cosine_ops']),
+        ),
+    ]
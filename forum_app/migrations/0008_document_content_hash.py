@@ -0,0 +1,45 @@
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_content_hash(apps, schema_editor):
+    """为已有文档计算内容哈希；同一知识库内完全相同的文档只保留最早的一条"""
+    Document = apps.get_model('forum_app', 'Document')
+    seen = set()
+    duplicates = []
+    for doc_id, kb_id, text in Document.objects.order_by('id').values_list('id', 'kb_id', 'text_content').iterator():
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        if (kb_id, digest) in seen:
+            duplicates.append(doc_id)
+            continue
+        seen.add((kb_id, digest))
+        Document.objects.filter(pk=doc_id).update(content_hash=digest)
+    if duplicates:
+        Document.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum_app', '0007_document_embedding_hnsw'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='content_hash',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='source',
+            field=models.CharField(blank=True, default='', max_length=500),
+        ),
+        migrations.RunPython(fill_content_hash, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='document',
+            constraint=models.UniqueConstraint(fields=('kb', 'content_hash'), name='uniq_document_kb_content_hash'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:08
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    """按已有回复计算 reply_count / last_post_at / last_post_author"""
+    Thread = apps.get_model('forum_app', 'Thread')
+    Post = apps.get_model('forum_app', 'Post')
+    posts = Post.objects.filter(thread=OuterRef('pk')).order_by()
+    latest = posts.order_by('-created_at', '-id')
+    Thread.objects.update(
+        reply_count=Coalesce(Subquery(posts.values('thread').annotate(c=Count('id')).values('c')), 0),
+        last_post_at=Coalesce(Subquery(latest.values('created_at')[:1]), F('created_at')),
+        last_post_author_id=Coalesce(Subquery(latest.values('author_id')[:1]), F('author_id')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum_app', '0008_document_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thread',
+            name='last_post_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='last_post_author',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='forum_app.actor'),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['last_post_at', 'id'], name='thread_last_post_id_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:10
+
+from django.db import migrations, models
+
+from forum_app.text import rerender_queryset
+
+
+def backfill_rendered_content(apps, schema_editor):
+    for name in ('Thread', 'Post'):
+        model = apps.get_model('forum_app', name)
+        for _ in rerender_queryset(model.objects.all()):
+            pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum_app', '0009_thread_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='content_preview',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='plain_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='safe_content',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='content_preview',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='plain_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='safe_content',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),        migrations.RunPython(backfill_rendered_content, migrations.RunPython.noop),
+    ]
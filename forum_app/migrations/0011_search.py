@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:16
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import pgvector.django.indexes
+import pgvector.django.vector
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # 帖子/回复表较大，索引并发构建不锁表；
+    # 已有数据的 search_vector 用 manage.py rerender_content --only-missing 回填，向量用 manage.py embed_content 计算
+    atomic = False
+
+    dependencies = [
+        ('forum_app', '0010_rendered_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='embedding',
+            field=pgvector.django.vector.VectorField(blank=True, dimensions=1536, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='embedding',
+            field=pgvector.django.vector.VectorField(blank=True, dimensions=1536, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        AddIndexConcurrently(
+            model_name='post',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='post_search_vector_gin'),
+        ),
+        AddIndexConcurrently(
+            model_name='post',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='post_embedding_hnsw_idx', opclasses=['vector_cosine_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='post',
+            index=models.Index(condition=models.Q(('embedding__isnull', True)), fields=['id'], name='post_embedding_pending_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='thread',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='thread_search_vector_gin'),
+        ),
+        AddIndexConcurrently(
+            model_name='thread',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='thread_embedding_hnsw_idx', opclasses=['vector_cosine_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='thread',
+            index=models.Index(condition=models.Q(('embedding__isnull', True)), fields=['id'], name='thread_embedding_pending_idx'),
+        ),
+    ]
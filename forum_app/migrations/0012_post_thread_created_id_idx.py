@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:18
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # 回复表较大，并发建索引不锁表
+    atomic = False
+
+    dependencies = [
+        ('forum_app', '0011_search'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='post',
+            index=models.Index(fields=['thread', 'created_at', 'id'], name='post_thread_created_id_idx'),
+        ),
+    ]
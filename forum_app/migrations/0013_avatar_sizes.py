@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum_app', '0012_post_thread_created_id_idx'),
+    ]
+
+    operations = [
+        # 旧版上传的头像都是最长边 200 像素的单张图片
+        migrations.AddField(
+            model_name='avatarimage',
+            name='size',
+            field=models.PositiveSmallIntegerField(default=200),
+        ),
+        migrations.AlterField(
+            model_name='avatarimage',
+            name='actor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='avatar_images', to='forum_app.actor'),
+        ),
+        migrations.AddConstraint(
+            model_name='avatarimage',
+            constraint=models.UniqueConstraint(fields=('actor', 'size'), name='uniq_avatar_actor_size'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:11
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Abs, Coalesce, Greatest, Log, Sign
+
+
+def hot_rank_expression(score, reply_count):
+    """
+    写这个迁移时的热度公式（content_models.hot_rank_expression 的副本）：迁移不随模型代码的修改而改变
+    参数取部署时的设置，设置项以后被删除时使用当时的默认值
+    """
+    votes = score + getattr(settings, 'FORUM_HOT_REPLY_WEIGHT', 1) * reply_count
+    age = models.Func(F('created_at'), template='EXTRACT(EPOCH FROM %(expressions)s)',
+                      output_field=models.FloatField()) - getattr(settings, 'FORUM_HOT_EPOCH', 1704067200)
+    return models.ExpressionWrapper(
+        Sign(votes) * Log(10, Greatest(Abs(votes), 1)) + age / getattr(settings, 'FORUM_HOT_DECAY_SECONDS', 45000),
+        output_field=models.FloatField(),
+    )
+
+
+def backfill_scores(apps, schema_editor):
+    """按已有投票计算回复得分、帖子得分和热度；不合法的票（0 或绝对值大于 1）规整为 ±1"""
+    Vote = apps.get_model('forum_app', 'Vote')
+    Post = apps.get_model('forum_app', 'Post')
+    Thread = apps.get_model('forum_app', 'Thread')
+    Vote.objects.filter(direction=0).delete()
+    Vote.objects.exclude(direction__in=[1, -1]).update(direction=Sign('direction'))
+    votes = Vote.objects.filter(post=OuterRef('pk')).order_by().values('post')
+    Post.objects.filter(votes__isnull=False).distinct().update(
+        score=Coalesce(Subquery(votes.annotate(s=Sum('direction')).values('s')), 0)
+    )
+    posts = Post.objects.filter(thread=OuterRef('pk')).order_by().values('thread')
+    Thread.objects.update(score=Coalesce(Subquery(posts.annotate(s=Sum('score')).values('s')), 0))
+    Thread.objects.update(hot_rank=hot_rank_expression(F('score'), F('reply_count')))
+    # 外键检查是延迟到提交时的，先执行掉，之后才能在同一事务中建索引、加约束
+    schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum_app', '0014_admission_control'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='hot_rank',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['hot_rank', 'id'], name='thread_hot_rank_id_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.CheckConstraint(condition=models.Q(('direction__in', [1, -1])), name='vote_direction_valid'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:16
+
+import django.db.models.deletion
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_thread_counts(apps, schema_editor):
+    Category = apps.get_model('forum_app', 'Category')
+    Thread = apps.get_model('forum_app', 'Thread')
+    threads = Thread.objects.filter(category=OuterRef('pk')).order_by().values('category')
+    Category.objects.update(thread_count=Coalesce(Subquery(threads.annotate(c=Count('id')).values('c')), 0))
+
+
+class Migration(migrations.Migration):
+    # 帖子表较大，并发建索引不锁表；新索引建好后再删除被它们覆盖的外键索引
+    atomic = False
+
+    dependencies = [
+        ('forum_app', '0015_votes_hot_rank'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='thread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        AddIndexConcurrently(
+            model_name='thread',
+            index=models.Index(fields=['category', 'created_at', 'id'], name='thread_cat_created_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='thread',
+            index=models.Index(fields=['category', 'last_post_at', 'id'], name='thread_cat_last_post_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='thread',
+            index=models.Index(fields=['category', 'hot_rank', 'id'], name='thread_cat_hot_rank_id_idx'),
+        ),
+        migrations.AlterField(
+            model_name='thread',
+            name='category',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='threads', to='forum_app.category'),
+        ),
+        migrations.RunPython(backfill_thread_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from forum_app.text import rerender_queryset
+
+
+def resanitize_code_spans(apps, schema_editor):
+    """旧的代码范围识别会放过转义的反引号、属性值里的反引号，只有同时含 ` 和 < 的内容可能受影响"""
+    for name in ('Thread', 'Post'):
+        model = apps.get_model('forum_app', name)
+        for _ in rerender_queryset(model.objects.filter(content__contains='`').filter(content__contains='<')):
+            pass
+
+
+class Migration(migrations.Migration):
+    # 分批提交，不在一个事务里长时间锁住大表
+    atomic = False
+
+    dependencies = [
+        ('forum_app', '0016_category_feeds'),
+    ]
+
+    operations = [
+        migrations.RunPython(resanitize_code_spans, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # 未配置共享缓存时，各进程从这个序列读取帖子列表的缓存版本号（见 response_cache.py）
+
+    dependencies = [
+        ('forum_app', '0017_resanitize_code_spans'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE SEQUENCE IF NOT EXISTS forum_list_version',
+            'DROP SEQUENCE IF EXISTS forum_list_version',
+        ),
+    ]
@@ -0,0 +1,13 @@
+from .actor_models import Actor, AvatarImage, HumanUser, HumanUserManager, AIAgent
+from .content_models import Category, Thread, Post, ThreadSummary
+from .interaction_models import Vote
+from .job_models import GenerationJob, RateLimitBucket
+from .rag_models import KnowledgeBase, Document
+
+__all__ = [
+    'Actor', 'AvatarImage', 'HumanUser', 'HumanUserManager', 'AIAgent',
+    'Category', 'Thread', 'Post', 'ThreadSummary',
+    'Vote',
+    'GenerationJob', 'RateLimitBucket',
+    'KnowledgeBase', 'Document',
+]
@@ -0,0 +1,171 @@
+import logging
+
+from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+from django.db import models
+
+from .. import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Actor(models.Model):
+    """
+    论坛中所有发言者的基类（人类用户和 AI 角色共用）
+    """
+    username = models.CharField(max_length=100, unique=True)
+    avatar_url = models.URLField(max_length=255, blank=True, null=True)
+    # 上传头像的内容哈希（sha256），图片本身存放在 AvatarImage 中
+    avatar_hash = models.CharField(max_length=64, blank=True, null=True)
+    bio = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.username
+
+    @property
+    def is_ai(self):
+        return hasattr(self, 'aiagent')
+
+    @property
+    def avatar(self):
+        return self.avatar_for(self.pk, self.avatar_hash, self.avatar_url)
+
+    @staticmethod
+    def avatar_for(pk, avatar_hash, avatar_url):
+        # 优先使用上传的头像（带版本号的短地址，可被浏览器长期缓存），其次是外链头像
+        # 单独提供给 .values() 查询出的行使用，不必构造模型实例
+        if avatar_hash:
+            return f"/api/avatars/{pk}/?v={avatar_hash[:16]}"
+        return avatar_url
+
+
+class AvatarImage(models.Model):
+    """
+    上传头像的二进制内容，与 Actor 分表存放，列表查询 select_related('author') 时不会带出图片
+
+    上传时一次性生成 FORUM_AVATAR_SIZES 中的每个尺寸，每个尺寸一行；
+    同一次上传的各行 content_hash 相同（即 Actor.avatar_hash，地址中的版本号）
+    """
+    actor = models.ForeignKey(Actor, on_delete=models.CASCADE, related_name='avatar_images')
+    size = models.PositiveSmallIntegerField(default=200)  # 最长边像素
+    data = models.BinaryField()
+    content_type = models.CharField(max_length=50, default='image/jpeg')
+    content_hash = models.CharField(max_length=64)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['actor', 'size'], name='uniq_avatar_actor_size'),
+        ]
+
+    def __str__(self):
+        return f"{self.actor} {self.size}px ({len(self.data)} bytes)"
+
+
+class HumanUserManager(BaseUserManager):
+    def create_user(self, username, email, password=None, **extra_fields):
+        if not username:
+            raise ValueError('用户名不能为空')
+        if not email:
+            raise ValueError('邮箱不能为空')
+        user = self.model(username=username, email=self.normalize_email(email), **extra_fields)
+        user.set_password(password)
+        user.save(using=self._db)
+        return user
+
+    def create_superuser(self, username, email, password=None, **extra_fields):
+        extra_fields.setdefault('is_staff', True)
+        extra_fields.setdefault('is_superuser', True)
+        return self.create_user(username, email, password, **extra_fields)
+
+
+class HumanUser(Actor, AbstractBaseUser, PermissionsMixin):
+    """
+    人类用户，同时作为 Django 的认证用户模型（AUTH_USER_MODEL）
+    """
+    actor_ptr = models.OneToOneField(Actor, on_delete=models.CASCADE, parent_link=True, primary_key=True)
+    email = models.EmailField(unique=True, verbose_name='邮箱')
+    is_staff = models.BooleanField(default=False)
+    is_active = models.BooleanField(default=True)
+
+    objects = HumanUserManager()
+
+    USERNAME_FIELD = 'username'
+    EMAIL_FIELD = 'email'
+    REQUIRED_FIELDS = ['email']
+
+    def __str__(self):
+        return self.username
+
+
+class AIAgent(Actor):
+    """
+    AI 角色：拥有独立的人设（system_prompt），可以挂载知识库做 RAG
+    """
+    actor_ptr = models.OneToOneField(Actor, on_delete=models.CASCADE, parent_link=True, primary_key=True)
+    system_prompt = models.TextField()
+    model_name = models.CharField(max_length=100, default='gemini-2.5-flash')
+    knowledge_bases = models.ManyToManyField('KnowledgeBase', blank=True, related_name='agents')
+
+    def search_knowledge(self, query, top_k=None):
+        """在挂载的知识库中检索与 query 最相关的文档片段"""
+        from ..rag import retrieve_for_agents
+
+        return retrieve_for_agents(query, [self], top_k)[self.pk]
+
+    def generate_reply(self, full_conversation_context, on_token=None, rag_snippets=None):
+        """
+        根据完整的对话历史，以该角色的身份生成一条回复
+
+        传入 on_token 时使用流式接口，每收到一段文本就回调一次。
+        rag_snippets 为本轮已检索好的参考资料；为 None 时自行检索。
+        """
+        with metrics.AI_REPLY_SECONDS.time(agent=self.username):
+            return self._generate_reply(full_conversation_context, on_token, rag_snippets)
+
+    def _generate_reply(self, full_conversation_context, on_token, rag_snippets):
+        from ..ai_service import get_ai_service
+        from ..rag import rag_query
+
+        if rag_snippets is None:
+            rag_snippets = []
+            try:
+                # 用最近的对话内容作为检索关键词
+                rag_snippets = self.search_knowledge(rag_query(full_conversation_context))
+            except Exception as e:
+                logger.warning(f"⚠️ 知识库检索失败: {e}", extra={'agent': self.username})
+        rag_info = ""
+        if rag_snippets:
+            rag_info = "\n\n【参考资料】\n" + "\n---\n".join(rag_snippets)
+
+        system_message = f"{self.system_prompt}{rag_info}\n\n请作为 \"{self.username}\" 参与讨论。"
+        user_message = (
+            f"【当前对话历史】\n{full_conversation_context}\n"
+            f"请根据上面的对话历史，作为 {self.username} 进行回复。"
+        )
+
+        if on_token is None:
+            reply = get_ai_service().chat(
+                model=self.model_name,
+                system_message=system_message,
+                user_message=user_message,
+                agent=self.username,
+            )
+        else:
+            parts = []
+            stream = get_ai_service().chat_stream(
+                model=self.model_name,
+                system_message=system_message,
+                user_message=user_message,
+                agent=self.username,
+            )
+            try:
+                for text in stream:
+                    parts.append(text)
+                    on_token(text)
+            finally:
+                # on_token 抛出异常（如本轮已放弃）时立即关闭流，归还全局调用名额
+                stream.close()
+            reply = "".join(parts)
+        logger.info("✅ 角色回复生成完成", extra={'agent': self.username, 'chars': len(reply)})
+        return reply
@@ -0,0 +1,354 @@
+import math
+
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models.functions import Abs, Cast, Coalesce, Greatest, Log, Sign
+from django.utils import timezone
+from pgvector.django import HnswIndex, VectorField
+
+from ..response_cache import invalidate_thread_list
+from ..text import RENDERED_FIELDS, render_content, search_vector_literal
+from .actor_models import Actor
+
+
+def build_search_vector(weighted_texts):
+    """[(text, 'A'|'B'|...), ...] -> 可直接赋给 SearchVectorField 的表达式"""
+    literal = search_vector_literal(weighted_texts)
+    if literal is None:
+        return None
+    return Cast(models.Value(literal), SearchVectorField())
+
+
+def hot_rank(score, reply_count, created_at):
+    """
+    时间衰减的热度（Reddit 式）：v = 得分 + 回复数 × 权重，v 每大 10 倍相当于晚发 FORUM_HOT_DECAY_SECONDS 秒
+    只依赖得分、回复数和发帖时间，不随时间流逝变化，所以只在投票、回复时更新，列表直接按索引排序
+    """
+    votes = score + settings.FORUM_HOT_REPLY_WEIGHT * reply_count
+    sign = (votes > 0) - (votes < 0)
+    age = created_at.timestamp() - settings.FORUM_HOT_EPOCH
+    return sign * math.log10(max(abs(votes), 1)) + age / settings.FORUM_HOT_DECAY_SECONDS
+
+
+def hot_rank_expression(score, reply_count):
+    """hot_rank() 的 SQL 表达式，score / reply_count 传入更新后的值（如 F('score') + 1）"""
+    votes = score + settings.FORUM_HOT_REPLY_WEIGHT * reply_count
+    age = models.Func(models.F('created_at'), template='EXTRACT(EPOCH FROM %(expressions)s)',
+                      output_field=models.FloatField()) - settings.FORUM_HOT_EPOCH
+    return models.ExpressionWrapper(
+        Sign(votes) * Log(10, Greatest(Abs(votes), 1)) + age / settings.FORUM_HOT_DECAY_SECONDS,
+        output_field=models.FloatField(),
+    )
+
+
+class Category(models.Model):
+    id = models.AutoField(primary_key=True)
+    name = models.CharField(max_length=100, unique=True)
+    description = models.TextField(blank=True, null=True)
+    # 分类下的帖子数，发帖、改分类、删帖时原子更新（见 Thread.save、thread_deleted），分类列表不再 COUNT 帖子表
+    thread_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # 分类列表与帖子列表共用缓存版本号
+        invalidate_thread_list()
+
+    @classmethod
+    def move_thread(cls, old, new):
+        """帖子从分类 old 移到 new（新建时 old 为 None，删除时 new 为 None），调整两边的帖子数"""
+        if old == new:
+            return
+        if old is not None:
+            cls.objects.filter(pk=old).update(thread_count=Greatest(models.F('thread_count') - 1, 0))
+        if new is not None:
+            cls.objects.filter(pk=new).update(thread_count=models.F('thread_count') + 1)
+
+    @classmethod
+    def refresh_counts(cls):
+        """按 Thread 表重新计算各分类的帖子数，返回更新的分类数"""
+        threads = Thread.objects.filter(category=models.OuterRef('pk')).order_by().values('category')
+        updated = cls.objects.update(
+            thread_count=Coalesce(models.Subquery(threads.annotate(c=models.Count('id')).values('c')), 0)
+        )
+        invalidate_thread_list()
+        return updated
+
+
+class RenderedContentManager(models.Manager):
+    # 检索列（tsvector 和 1536 维向量）只在搜索时用到，默认不读取
+    def get_queryset(self):
+        return super().get_queryset().defer('search_vector', 'embedding')
+
+
+class RenderedContentModel(models.Model):
+    """
+    保存时由 content 计算清理后的 HTML、纯文本、预览和全文检索向量，读取时不再解析 HTML
+    （已有数据用 manage.py rerender_content 重新计算）
+
+    语义检索用的 embedding 在事务提交后由后台线程补算（见 search.py）。
+    """
+    safe_content = models.TextField(blank=True, default='', editable=False)
+    plain_text = models.TextField(blank=True, default='', editable=False)
+    content_preview = models.CharField(max_length=100, blank=True, default='', editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+    embedding = VectorField(dimensions=1536, null=True, blank=True, editable=False)
+
+    objects = RenderedContentManager()
+
+    # 这些字段变化时需要重新计算
+    render_source_fields = ('content',)
+    rendered_fields = (*RENDERED_FIELDS, 'search_vector')
+
+    class Meta:
+        abstract = True
+
+    def search_texts(self):
+        """参与全文检索的 (文本, 权重) 列表"""
+        return [(self.plain_text, 'B')]
+
+    def embedding_text(self):
+        return self.plain_text
+
+    def render_content(self):
+        """重新计算 rendered_fields，返回纯文本是否发生了变化"""
+        previous = self.plain_text
+        self.safe_content, self.plain_text, self.content_preview = render_content(self.content)
+        self.search_vector = build_search_vector(self.search_texts())
+        return self.plain_text != previous
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        rendered = update_fields is None or bool(set(update_fields) & set(self.render_source_fields))
+        if rendered:
+            self.render_content()
+            # 标题或内容可能被修改，向量交给后台重新计算
+            self.embedding = None
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, *self.rendered_fields, 'embedding'}
+        super().save(*args, **kwargs)
+        if rendered and self.plain_text:
+            from ..search import schedule_content_embedding
+            transaction.on_commit(schedule_content_embedding)
+
+
+class Thread(RenderedContentModel):
+    """主题帖（楼主）"""
+    id = models.AutoField(primary_key=True)
+    title = models.CharField(max_length=255)
+    content = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # 标记 AI 是否正在生成回复，前端据此决定是否轮询
+    ai_generating = models.BooleanField(default=False)
+    # 每次有新回复或 ai_generating 变化时递增，用作增量接口的 ETag
+    version = models.PositiveIntegerField(default=0)
+
+    # 冗余计数与最后活动信息，写回复时原子更新，列表页无需聚合 Post 表
+    # （可用 manage.py repair_thread_counters 重新计算）
+    reply_count = models.PositiveIntegerField(default=0)
+    last_post_at = models.DateTimeField(default=timezone.now)
+    last_post_author = models.ForeignKey(
+        Actor, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    # 所有回复的得分之和，以及由它和回复数计算的热度（见 hot_rank），投票、回复时原子更新
+    score = models.IntegerField(default=0)
+    hot_rank = models.FloatField(default=0)
+
+    author = models.ForeignKey(Actor, on_delete=models.CASCADE, related_name='threads')
+    # 外键查询由下面以 category 开头的联合索引覆盖，不再单独建索引
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='threads',
+                                 db_index=False)
+
+    render_source_fields = ('title', 'content')
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # 列表页游标分页按 (created_at, id) 做范围扫描
+            models.Index(fields=['created_at', 'id'], name='thread_created_id_idx'),
+            # 按最近活动排序（?sort=activity）
+            models.Index(fields=['last_post_at', 'id'], name='thread_last_post_id_idx'),
+            # 热门排序（?sort=hot）
+            models.Index(fields=['hot_rank', 'id'], name='thread_hot_rank_id_idx'),
+            # 分类内的三种排序（?category=），只扫描该分类的索引范围，与分类大小无关
+            models.Index(fields=['category', 'created_at', 'id'], name='thread_cat_created_id_idx'),
+            models.Index(fields=['category', 'last_post_at', 'id'], name='thread_cat_last_post_id_idx'),
+            models.Index(fields=['category', 'hot_rank', 'id'], name='thread_cat_hot_rank_id_idx'),
+            GinIndex(fields=['search_vector'], name='thread_search_vector_gin'),
+            HnswIndex(name='thread_embedding_hnsw_idx', fields=['embedding'], m=16, ef_construction=64,
+                      opclasses=['vector_cosine_ops']),
+            # 后台补算向量时只扫描还没有向量的行
+            models.Index(fields=['id'], condition=models.Q(embedding__isnull=True), name='thread_embedding_pending_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+    def search_texts(self):
+        return [(self.title, 'A'), (self.plain_text, 'B')]
+
+    def embedding_text(self):
+        return f"{self.title}\n{self.plain_text}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 读出时的分类（没有读取该列时为 DEFERRED），save() 时据此调整分类帖子数
+        instance._stored_category_id = instance.__dict__.get('category_id', models.DEFERRED)
+        return instance
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        if adding:
+            if self.last_post_author_id is None:
+                # 没有回复时，最后活动就是楼主发帖
+                self.last_post_author_id = self.author_id
+            # created_at 在插入时才赋值，与这里的当前时间只差几微秒
+            self.hot_rank = hot_rank(self.score, self.reply_count, self.created_at or timezone.now())
+            stored = None
+        else:
+            stored = getattr(self, '_stored_category_id', models.DEFERRED)
+        # 与 Model.save 一致：指定了 update_fields 时只写其中的列，未读取的列不写
+        update_fields = kwargs.get('update_fields')
+        writes_category = 'category_id' in self.__dict__ and (
+            update_fields is None or bool({'category', 'category_id'} & set(update_fields))
+        )
+        if writes_category and stored != self.category_id:
+            # 帖子和分类计数在同一事务中写入；不知道原分类时先锁住帖子行读出
+            with transaction.atomic():
+                if stored is models.DEFERRED:
+                    stored = (Thread.objects.select_for_update().filter(pk=self.pk)
+                              .values_list('category_id', flat=True).first())
+                super().save(*args, **kwargs)
+                Category.move_thread(stored, self.category_id)
+        else:
+            super().save(*args, **kwargs)
+        if writes_category:
+            self._stored_category_id = self.category_id
+        invalidate_thread_list()
+
+    @classmethod
+    def bump_version(cls, thread_id, **fields):
+        """原子地递增版本号，并可同时更新其他字段（如 ai_generating）"""
+        updated = cls.objects.filter(pk=thread_id).update(version=models.F('version') + 1, **fields)
+        # 帖子详情的缓存键带 version，列表缓存用全局版本号，这里一并失效
+        invalidate_thread_list()
+        return updated
+
+    @classmethod
+    def record_post(cls, post, **fields):
+        """
+        新回复写入后调用：回复数 +1、更新最后活动和热度、递增版本号，一条 UPDATE 完成。
+        并发提交时只有更晚的回复才会覆盖最后活动信息。
+        """
+        newer = models.Q(last_post_at__lte=post.created_at)
+        reply_count = models.F('reply_count') + 1
+        return cls.bump_version(
+            post.thread_id,
+            reply_count=reply_count,
+            hot_rank=hot_rank_expression(models.F('score'), reply_count),
+            last_post_at=Greatest('last_post_at', models.Value(post.created_at)),
+            last_post_author_id=models.Case(
+                models.When(newer, then=models.Value(post.author_id)),
+                default=models.F('last_post_author_id'),
+                output_field=models.BigIntegerField(),
+            ),
+            **fields,
+        )
+
+    @classmethod
+    def record_vote(cls, thread_id, delta):
+        """回复得分变化 delta 后调用：更新帖子得分和热度，递增版本号（详情页缓存中的得分随之失效）"""
+        score = models.F('score') + delta
+        return cls.bump_version(thread_id, score=score, hot_rank=hot_rank_expression(score, models.F('reply_count')))
+
+    @classmethod
+    def refresh_counters(cls, thread_ids=None):
+        """按 Post 表重新计算冗余字段（含得分和热度），返回更新的帖子数"""
+        posts = Post.objects.filter(thread=models.OuterRef('pk')).order_by()
+        latest = posts.order_by('-created_at', '-id')
+        reply_count = posts.values('thread').annotate(c=models.Count('id')).values('c')
+        score = posts.values('thread').annotate(s=models.Sum('score')).values('s')
+        queryset = cls.objects.all() if thread_ids is None else cls.objects.filter(pk__in=thread_ids)
+        queryset.update(
+            reply_count=Coalesce(models.Subquery(reply_count), 0),
+            score=Coalesce(models.Subquery(score), 0),
+        )
+        # 热度依赖上面更新后的值，分两条 UPDATE
+        updated = queryset.update(
+            hot_rank=hot_rank_expression(models.F('score'), models.F('reply_count')),
+            last_post_at=Coalesce(
+                models.Subquery(latest.values('created_at')[:1]), models.F('created_at')
+            ),
+            last_post_author_id=Coalesce(
+                models.Subquery(latest.values('author_id')[:1]), models.F('author_id')
+            ),
+        )
+        invalidate_thread_list()
+        return updated
+
+
+def thread_deleted(sender, instance, **kwargs):
+    """
+    信号处理函数（post_delete）：帖子被删除后减少分类帖子数
+
+    用信号而不是重写 delete()：queryset.delete() 和删除用户引起的级联删除都不调用模型的 delete()，
+    但会逐个发送 post_delete（处理函数在删除所在的事务中执行）。
+    """
+    if instance.category_id is not None:
+        Category.move_thread(instance.category_id, None)
+    invalidate_thread_list()
+
+
+class Post(RenderedContentModel):
+    """主题下的回复（人类或 AI）"""
+    id = models.AutoField(primary_key=True)
+    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name='posts')
+    author = models.ForeignKey(Actor, on_delete=models.CASCADE, related_name='posts')
+    content = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # 赞成票数 - 反对票数，投票时原子更新（见 Vote.cast）
+    score = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            # 增量接口按 thread_id = ? AND id > ? 做范围扫描
+            models.Index(fields=['thread', 'id'], name='post_thread_id_idx'),
+            # 帖子详情按 (created_at, id) 游标分页
+            models.Index(fields=['thread', 'created_at', 'id'], name='post_thread_created_id_idx'),
+            GinIndex(fields=['search_vector'], name='post_search_vector_gin'),
+            HnswIndex(name='post_embedding_hnsw_idx', fields=['embedding'], m=16, ef_construction=64,
+                      opclasses=['vector_cosine_ops']),
+            models.Index(fields=['id'], condition=models.Q(embedding__isnull=True), name='post_embedding_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.author} @ {self.thread_id}"
+
+    @classmethod
+    def refresh_scores(cls, thread_ids=None):
+        """按 Vote 表重新计算回复得分，返回更新的回复数"""
+        from .interaction_models import Vote
+
+        votes = Vote.objects.filter(post=models.OuterRef('pk')).order_by().values('post')
+        queryset = cls.objects.all() if thread_ids is None else cls.objects.filter(thread_id__in=thread_ids)
+        return queryset.update(score=Coalesce(models.Subquery(votes.annotate(s=models.Sum('direction')).values('s')), 0))
+
+
+class ThreadSummary(models.Model):
+    """
+    长帖子早前讨论的滚动摘要，超出上下文预算的旧回复会被合并进来
+    """
+    thread = models.OneToOneField(Thread, on_delete=models.CASCADE, related_name='summary')
+    text = models.TextField(blank=True, default='')
+    # 摘要已覆盖到的最后一条回复 id
+    summarized_until = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Summary of {self.thread_id} (until post {self.summarized_until})"
@@ -0,0 +1,48 @@
+from django.db import models, transaction
+
+from .actor_models import Actor
+from .content_models import Post, Thread
+
+
+class Vote(models.Model):
+    """用户对回复的投票（1 为赞，-1 为踩）"""
+    voter = models.ForeignKey(Actor, on_delete=models.CASCADE, related_name='votes')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='votes')
+    direction = models.SmallIntegerField()
+
+    class Meta:
+        unique_together = ('voter', 'post')
+        constraints = [
+            models.CheckConstraint(condition=models.Q(direction__in=[1, -1]), name='vote_direction_valid'),
+        ]
+
+    def __str__(self):
+        return f"{self.voter} -> {self.post_id} ({self.direction})"
+
+    @classmethod
+    def cast(cls, voter_id, post_id, direction):
+        """
+        投票、改票（direction 为 1 / -1）或撤销（0），返回 (回复的新得分, 当前方向)；回复不存在时抛 Post.DoesNotExist
+
+        锁住回复这一行，对同一回复的投票依次进行；票、回复得分、帖子得分和热度在同一个事务中更新，
+        得分始终等于票数之和（可用 manage.py repair_thread_counters 校正）。
+
+        原来的票在拿到行锁之后用单独的查询读取：READ COMMITTED 下每条语句开始时取快照，
+        写在加锁语句的子查询里会读到等锁之前的旧票，并发的相同投票会重复插入，撤销与重投会重复计分。
+        """
+        with transaction.atomic():
+            post = Post.objects.select_for_update().only('id', 'thread_id', 'score').get(pk=post_id)
+            vote = cls.objects.filter(post_id=post_id, voter_id=voter_id).only('id', 'direction').first()
+            previous = vote.direction if vote else 0
+            delta = direction - previous
+            if not delta:
+                return post.score, direction
+            if direction == 0:
+                cls.objects.filter(pk=vote.pk).delete()
+            elif vote is None:
+                cls.objects.create(post_id=post_id, voter_id=voter_id, direction=direction)
+            else:
+                cls.objects.filter(pk=vote.pk).update(direction=direction)
+            Post.objects.filter(pk=post_id).update(score=models.F('score') + delta)
+            Thread.record_vote(post.thread_id, delta)
+        return post.score + delta, direction
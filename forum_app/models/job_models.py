@@ -0,0 +1,65 @@
+from django.db import models
+
+from .content_models import Thread
+
+
+class GenerationJob(models.Model):
+    """
+    一轮 AI 回复生成任务
+
+    同一帖子最多只有一个排队中（pending）的任务：短时间内的多条回复会合并成一轮生成。
+    worker 领取任务时获得租约（lease），运行期间定期续约；租约过期的任务视为
+    所在进程已崩溃，会被重新排队或标记失败。
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, '排队中'),
+        (RUNNING, '生成中'),
+        (DONE, '已完成'),
+        (FAILED, '失败'),
+    ]
+
+    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name='generation_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    lease_owner = models.CharField(max_length=100, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    # 帖子级限流触发时推迟执行，期间的新回复合并进同一个任务
+    not_before = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['thread'],
+                condition=models.Q(status='pending'),
+                name='uniq_pending_job_per_thread',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='genjob_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} (thread {self.thread_id}, {self.status})"
+
+
+class RateLimitBucket(models.Model):
+    """
+    令牌桶（AI 生成的准入控制，见 admission.py）
+
+    key 形如 user:<id> / thread:<id>。令牌数按上次更新时间惰性补充，
+    扣减在一条 INSERT ... ON CONFLICT DO UPDATE 中完成，多进程并发也不会超发。
+    """
+    key = models.CharField(max_length=100, unique=True)
+    tokens = models.FloatField()
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.2f}"
@@ -0,0 +1,46 @@
+from django.db import models
+from pgvector.django import HnswIndex, VectorField
+
+
+class KnowledgeBase(models.Model):
+    """AI 角色可以挂载的知识库"""
+    id = models.AutoField(primary_key=True)
+    name = models.CharField(max_length=255, unique=True)
+    description = models.TextField(blank=True, null=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Document(models.Model):
+    """知识库中的一段文本及其向量"""
+    id = models.AutoField(primary_key=True)
+    kb = models.ForeignKey(KnowledgeBase, on_delete=models.CASCADE, related_name='documents')
+    text_content = models.TextField()
+    # text_content 的 sha256，批量导入时据此去重，未变化的分块不会重新向量化
+    content_hash = models.CharField(max_length=64, db_index=True, editable=False)
+    source = models.CharField(max_length=500, blank=True, default='')
+    embedding = VectorField(dimensions=1536)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kb', 'content_hash'], name='uniq_document_kb_content_hash'),
+        ]
+        indexes = [
+            # 余弦距离的近似最近邻索引；构建参数见 0007 迁移，搜索宽度见 FORUM_RAG_EF_SEARCH
+            HnswIndex(
+                name='document_embedding_hnsw_idx',
+                fields=['embedding'],
+                m=16,
+                ef_construction=64,
+                opclasses=['vector_cosine_ops'],
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        from ..embeddings import content_hash
+        self.content_hash = content_hash(self.text_content)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.text_content[:50]
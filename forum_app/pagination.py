@@ -0,0 +1,126 @@
+"""
+基于 (排序字段, id) 的游标分页（keyset pagination）
+
+与 OFFSET 分页不同，每一页都是从上一页最后一行开始的索引范围扫描，
+翻到第 1000 页和翻第 1 页的代价相同。游标对前端是不透明的字符串。
+排序字段可以是时间（created_at、last_post_at），也可以是数值（hot_rank）。
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import DateTimeField, Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value, pk, field):
+    # 时间存为 ISO 字符串，数值原样存放（JSON 中的浮点数可以精确还原）；
+    # 带上排序字段，换了排序方式的游标直接拒绝
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([value, pk, field], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk, field = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if isinstance(value, str):
+            value = parse_datetime(value)
+        elif isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError
+        if value is None or isinstance(pk, bool) or not isinstance(pk, int) or not isinstance(field, str):
+            raise ValueError
+        return value, pk, field
+    except (ValueError, TypeError, UnicodeError):
+        raise InvalidCursor('无效的分页游标')
+
+
+def get_page_size(request, default=None, maximum=None):
+    default = default or settings.FORUM_PAGE_SIZE
+    maximum = maximum or settings.FORUM_MAX_PAGE_SIZE
+    try:
+        size = int(request.GET.get('page_size', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
+
+
+def _page_queryset(queryset, request, field):
+    """按游标过滤排序，返回 (queryset, cursor, backwards)"""
+    cursor = request.GET.get('cursor')
+    backwards = request.GET.get('direction') == 'prev'
+
+    if cursor:
+        value, pk, cursor_field = decode_cursor(cursor)
+        # 游标须来自同一种排序（如用按发帖时间的游标翻按最后回复排序的列表），值的类型须与字段一致
+        if cursor_field != field or (
+            isinstance(value, datetime) != isinstance(queryset.model._meta.get_field(field), DateTimeField)
+        ):
+            raise InvalidCursor('无效的分页游标')
+        if backwards:
+            # field__gte 让 Postgres 可以直接走 (field, id) 索引范围
+            queryset = queryset.filter(
+                Q(**{f'{field}__gte': value}) & (Q(**{f'{field}__gt': value}) | Q(id__gt=pk))
+            ).order_by(field, 'id')
+        else:
+            queryset = queryset.filter(
+                Q(**{f'{field}__lte': value}) & (Q(**{f'{field}__lt': value}) | Q(id__lt=pk))
+            ).order_by(f'-{field}', '-id')
+    else:
+        backwards = False
+        queryset = queryset.order_by(f'-{field}', '-id')
+    return queryset, cursor, backwards
+
+
+def _finish_page(rows, page_size, cursor, backwards, field):
+    # 多取的一行用来判断是否还有下一页
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if backwards:
+        rows.reverse()
+        has_newer, has_older = has_more, True
+    else:
+        has_newer, has_older = bool(cursor), has_more
+
+    next_cursor = _row_cursor(rows[-1], field) if rows and has_older else None
+    prev_cursor = _row_cursor(rows[0], field) if rows and has_newer else None
+    return rows, next_cursor, prev_cursor
+
+
+def _row_cursor(row, field):
+    # 行可以是模型实例，也可以是 .values() 的字典
+    if isinstance(row, dict):
+        return encode_cursor(row[field], row['id'], field)
+    return encode_cursor(getattr(row, field), row.id, field)
+
+
+def keyset_paginate(queryset, request, page_size=None, field='created_at'):
+    """
+    按 (-field, -id) 对 queryset 做游标分页，field 需与 id 一起建有联合索引
+
+    - ?cursor=<next_cursor> 取更旧的一页
+    - ?cursor=<prev_cursor>&direction=prev 取更新的一页
+
+    queryset 可以是 .values() 查询（需包含 field 和 id）。
+    返回 (rows, next_cursor, prev_cursor)，没有更多数据时对应游标为 None。
+    """
+    page_size = page_size or get_page_size(request)
+    queryset, cursor, backwards = _page_queryset(queryset, request, field)
+    rows = list(queryset[:page_size + 1])
+    return _finish_page(rows, page_size, cursor, backwards, field)
+
+
+async def akeyset_paginate(queryset, request, page_size=None, field='created_at'):
+    """keyset_paginate 的异步版本（异步视图中使用）"""
+    page_size = page_size or get_page_size(request)
+    queryset, cursor, backwards = _page_queryset(queryset, request, field)
+    rows = [row async for row in queryset[:page_size + 1]]
+    return _finish_page(rows, page_size, cursor, backwards, field)
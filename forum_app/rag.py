@@ -0,0 +1,131 @@
+"""
+RAG 知识库检索
+
+- Document.embedding 上建有 HNSW 索引（余弦距离），检索只在 AI 角色挂载的知识库内进行
+- 查询向量按文本缓存，同一段上下文不会重复调用向量接口
+- 一轮生成中被选中的多个 AI 共用一次检索：对所有角色知识库的并集取一次 top-k，
+  再按各自挂载的知识库分配；分配不足的角色才单独补查
+
+检索参数：
+- FORUM_RAG_EF_SEARCH       HNSW 搜索宽度（hnsw.ef_search），越大召回越高、越慢
+- FORUM_RAG_IVFFLAT_PROBES  使用 IVFFlat 索引时的 ivfflat.probes
+- FORUM_RAG_ITERATIVE_SCAN  pgvector >= 0.8 时带过滤条件的迭代扫描模式（如 'relaxed_order'），None 关闭
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from pgvector.django import CosineDistance
+
+from .embeddings import embedder_key, get_embedder
+from .models import Document
+
+logger = logging.getLogger(__name__)
+
+QUERY_CHARS = 200
+ITERATIVE_SCAN_MODES = ('strict_order', 'relaxed_order')
+
+_pgvector_version = None
+
+
+def _supports_iterative_scan():
+    global _pgvector_version
+    if _pgvector_version is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            row = cursor.fetchone()
+        _pgvector_version = tuple(int(p) for p in row[0].split('.')[:2]) if row else (0, 0)
+    return _pgvector_version >= (0, 8)
+
+
+def _embedding_cache_key(embedder, text):
+    digest = hashlib.sha1(f"{embedder_key(embedder)}\n{text}".encode('utf-8')).hexdigest()
+    return f'forum:embedding:{digest}'
+
+
+def embed_texts(texts):
+    """批量向量化，按文本缓存；只对未命中的文本调用一次 embedder，失败时抛出异常"""
+    embedder = get_embedder()
+    keys = [_embedding_cache_key(embedder, text) for text in texts]
+    cached = cache.get_many(keys)
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    if missing:
+        vectors = embedder([texts[i] for i in missing])
+        fresh = {keys[i]: vector for i, vector in zip(missing, vectors)}
+        cache.set_many(fresh, settings.FORUM_RAG_EMBEDDING_CACHE_SECONDS)
+        cached.update(fresh)
+    return [cached[key] for key in keys]
+
+
+def embed_query(text):
+    """返回 text 的向量；相同文本命中缓存，失败时返回 None"""
+    try:
+        return embed_texts([text])[0]
+    except Exception as e:
+        logger.error(f"💥 向量生成失败: {e}")
+        return None
+
+
+def apply_search_params(cursor):
+    # SET LOCAL 只在当前事务内生效，不影响连接上的其他查询
+    cursor.execute("SET LOCAL hnsw.ef_search = %s" % int(settings.FORUM_RAG_EF_SEARCH))
+    cursor.execute("SET LOCAL ivfflat.probes = %s" % int(settings.FORUM_RAG_IVFFLAT_PROBES))
+    mode = settings.FORUM_RAG_ITERATIVE_SCAN
+    if mode in ITERATIVE_SCAN_MODES and _supports_iterative_scan():
+        # 按知识库过滤后 HNSW 可能返回不足 top_k 条，迭代扫描会继续往下找
+        cursor.execute(f"SET LOCAL hnsw.iterative_scan = {mode}")
+
+
+def search_documents(embedding, kb_ids, top_k):
+    """在指定知识库中按余弦距离取最近的 top_k 个文档，返回 [(id, kb_id, text), ...]"""
+    if not kb_ids or embedding is None:
+        return []
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            apply_search_params(cursor)
+        return list(
+            Document.objects.filter(kb_id__in=kb_ids)
+            .order_by(CosineDistance('embedding', embedding))
+            .values_list('id', 'kb_id', 'text_content')[:top_k]
+        )
+
+
+def rag_query(conversation_context):
+    """用最近的对话内容作为检索关键词"""
+    return conversation_context[-QUERY_CHARS:]
+
+
+def agent_kb_ids(agent):
+    # 配合 prefetch_related('knowledge_bases') 使用时不会产生额外查询
+    return {kb.id for kb in agent.knowledge_bases.all()}
+
+
+def retrieve_for_agents(query, agents, top_k=None):
+    """
+    一次检索，分给多个 AI：返回 {agent.pk: [text, ...]}
+    """
+    top_k = top_k or settings.FORUM_RAG_TOP_K
+    kb_map = {agent.pk: agent_kb_ids(agent) for agent in agents}
+    union = set().union(*kb_map.values()) if kb_map else set()
+    results = {agent.pk: [] for agent in agents}
+    if not union or not query.strip():
+        return results
+
+    embedding = embed_query(query)
+    if embedding is None:
+        return results
+
+    # 多取一些，尽量让每个角色都能从共享结果里拿满 top_k
+    shared = search_documents(embedding, sorted(union), top_k * max(1, len(agents)))
+    for agent in agents:
+        kb_ids = kb_map[agent.pk]
+        if not kb_ids:
+            continue
+        picked = [text for _, kb_id, text in shared if kb_id in kb_ids][:top_k]
+        if len(picked) < top_k and len(kb_ids) < len(union):
+            # 该角色的知识库在共享结果里被挤掉了，单独补查（向量已缓存）
+            picked = [text for _, _, text in search_documents(embedding, sorted(kb_ids), top_k)]
+        results[agent.pk] = picked
+    return results
@@ -0,0 +1,282 @@
+"""
+帖子列表/详情的响应缓存
+
+- 缓存键带版本号：帖子详情用 Thread.version（每次回复、ai_generating 变化都会递增），
+  列表用一个全局版本号（任意帖子变化时递增）。写入后版本号变化，旧缓存自然失效，无需逐个删除
+- 本进程内存 LRU（FORUM_RESPONSE_CACHE_MAX_ENTRIES 条上限）+ 可选的共享缓存
+  （FORUM_RESPONSE_CACHE_SHARED 指定 Django CACHES 中的别名，如 Redis）；
+  配置了共享缓存时全局版本号也存放在其中；否则存放在 Postgres 序列中（每次读取一条查询）。
+  两种方式下各进程看到的都是同一个版本号，任一进程（包括独立 worker）写入后其他进程的列表缓存立即失效
+- 防击穿：同一个键同时只有一个请求查库，其余请求等待其结果
+- 命中/未命中计数见 stats()，通过 /api/cache/stats/ 查看
+- 异步视图使用 aget_or_build()：本地命中时不切换线程，防击穿使用 asyncio 锁
+"""
+import asyncio
+import threading
+import time
+import weakref
+import zlib
+from collections import Counter, OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+LIST_VERSION_KEY = 'forum:threads:list_version'
+# 未配置共享缓存时的列表版本号（见 0018_list_version_sequence）
+LIST_VERSION_SEQUENCE = 'forum_list_version'
+_LOCK_STRIPES = 64
+
+
+class LRUCache:
+    """线程安全、带过期时间的 LRU"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ResponseCache:
+    def __init__(self):
+        self._local = None
+        self._stats = Counter()
+        self._stats_lock = threading.Lock()
+        self._locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+        # asyncio 锁只能在创建它的事件循环中使用（WSGI 下每个异步请求一个事件循环）
+        self._async_locks = weakref.WeakKeyDictionary()
+        # 非 Postgres 数据库（开发环境）时退化为进程内版本号
+        self._local_list_version = 1
+
+    # ---------- 存储 ----------
+
+    @property
+    def local(self):
+        if self._local is None:
+            self._local = LRUCache(settings.FORUM_RESPONSE_CACHE_MAX_ENTRIES)
+        return self._local
+
+    def _shared(self):
+        alias = settings.FORUM_RESPONSE_CACHE_SHARED
+        return caches[alias] if alias else None
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    # ---------- 读取 ----------
+
+    def get_or_build(self, key, build, ttl):
+        """返回 key 对应的数据；都未命中时调用 build() 生成并写入缓存"""
+        if not settings.FORUM_RESPONSE_CACHE_ENABLED:
+            return build()
+
+        value = self.local.get(key)
+        if value is not None:
+            self._count('local_hits')
+            return value
+
+        shared = self._shared()
+        if shared is not None:
+            value = shared.get(key)
+            if value is not None:
+                self._count('shared_hits')
+                self.local.set(key, value, ttl)
+                return value
+
+        # 同一进程内同一个键只让一个请求去查库
+        with self._locks[zlib.crc32(key.encode('utf-8')) % _LOCK_STRIPES]:
+            value = self.local.get(key)
+            if value is not None:
+                self._count('coalesced')
+                return value
+            if shared is not None:
+                value = self._wait_for_other_process(shared, key)
+                if value is not None:
+                    self._count('coalesced')
+                    self.local.set(key, value, ttl)
+                    return value
+            self._count('misses')
+            try:
+                value = build()
+            finally:
+                if shared is not None:
+                    shared.delete(f'{key}:building')
+            self.local.set(key, value, ttl)
+            if shared is not None:
+                shared.set(key, value, ttl)
+            return value
+
+    def _wait_for_other_process(self, shared, key, wait=2.0):
+        """跨进程防击穿：抢到构建标记的进程去查库，其余进程短暂等待结果"""
+        if shared.add(f'{key}:building', 1, timeout=10):
+            return None
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            value = shared.get(key)
+            if value is not None:
+                return value
+        return None
+
+    async def aget_or_build(self, key, build, ttl):
+        """get_or_build 的异步版本，build 为协程函数"""
+        if not settings.FORUM_RESPONSE_CACHE_ENABLED:
+            return await build()
+
+        value = self.local.get(key)
+        if value is not None:
+            self._count('local_hits')
+            return value
+
+        shared = self._shared()
+        if shared is not None:
+            value = await shared.aget(key)
+            if value is not None:
+                self._count('shared_hits')
+                self.local.set(key, value, ttl)
+                return value
+
+        async with self._async_lock(key):
+            value = self.local.get(key)
+            if value is not None:
+                self._count('coalesced')
+                return value
+            if shared is not None:
+                value = await self._await_other_process(shared, key)
+                if value is not None:
+                    self._count('coalesced')
+                    self.local.set(key, value, ttl)
+                    return value
+            self._count('misses')
+            try:
+                value = await build()
+            finally:
+                if shared is not None:
+                    await shared.adelete(f'{key}:building')
+            self.local.set(key, value, ttl)
+            if shared is not None:
+                await shared.aset(key, value, ttl)
+            return value
+
+    def _async_lock(self, key):
+        loop = asyncio.get_running_loop()
+        with self._stats_lock:
+            locks = self._async_locks.get(loop)
+            if locks is None:
+                locks = self._async_locks[loop] = [asyncio.Lock() for _ in range(_LOCK_STRIPES)]
+        return locks[zlib.crc32(key.encode('utf-8')) % _LOCK_STRIPES]
+
+    async def _await_other_process(self, shared, key, wait=2.0):
+        if await shared.aadd(f'{key}:building', 1, timeout=10):
+            return None
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            value = await shared.aget(key)
+            if value is not None:
+                return value
+        return None
+
+    # ---------- 版本号 ----------
+
+    def list_version(self):
+        shared = self._shared()
+        if shared is None:
+            return self._db_list_version()
+        version = shared.get(LIST_VERSION_KEY)
+        if version is None:
+            shared.add(LIST_VERSION_KEY, 1, timeout=None)
+            version = shared.get(LIST_VERSION_KEY, 1)
+        return version
+
+    async def alist_version(self):
+        shared = self._shared()
+        if shared is None:
+            return await sync_to_async(self._db_list_version)()
+        version = await shared.aget(LIST_VERSION_KEY)
+        if version is None:
+            await shared.aadd(LIST_VERSION_KEY, 1, timeout=None)
+            version = await shared.aget(LIST_VERSION_KEY, 1)
+        return version
+
+    def _db_list_version(self):
+        if connection.vendor != 'postgresql':
+            return self._local_list_version
+        with connection.cursor() as cursor:
+            # 序列新建后 last_value 为 1、is_called 为假，第一次 nextval() 仍返回 1；加上 is_called 保证每次递增都能读到新值
+            cursor.execute(f"SELECT last_value + is_called::int FROM {LIST_VERSION_SEQUENCE}")
+            return cursor.fetchone()[0]
+
+    def bump_list_version(self):
+        shared = self._shared()
+        if shared is None:
+            if connection.vendor != 'postgresql':
+                with self._stats_lock:
+                    self._local_list_version += 1
+                return
+            # 序列的递增不受事务约束，也不持有行锁，并发写入互不等待
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT nextval(%s)", [LIST_VERSION_SEQUENCE])
+            return
+        try:
+            shared.incr(LIST_VERSION_KEY)
+        except ValueError:
+            shared.add(LIST_VERSION_KEY, 2, timeout=None)
+
+    # ---------- 统计 ----------
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        hits = stats.get('local_hits', 0) + stats.get('shared_hits', 0) + stats.get('coalesced', 0)
+        total = hits + stats.get('misses', 0)
+        return {
+            "local_hits": stats.get('local_hits', 0),
+            "shared_hits": stats.get('shared_hits', 0),
+            "coalesced": stats.get('coalesced', 0),
+            "misses": stats.get('misses', 0),
+            "hit_ratio": round(hits / total, 4) if total else 0,
+            "entries": len(self.local),
+            "max_entries": self.local.max_entries,
+            "evictions": self.local.evictions,
+            "list_version": self.list_version(),
+            "shared_backend": settings.FORUM_RESPONSE_CACHE_SHARED,
+        }
+
+
+response_cache = ResponseCache()
+
+
+def invalidate_thread_list():
+    """帖子数据变化后调用；在事务提交后才递增列表版本号"""
+    transaction.on_commit(response_cache.bump_list_version)
@@ -0,0 +1,190 @@
+"""
+帖子/回复搜索（/api/search/）
+
+- 全文检索：search_vector（tsvector，GIN 索引）在保存时由 Python 分词生成（见 text.search_tokens），
+  中文不依赖 zhparser 等数据库扩展；查询同样分词后拼成 tsquery，按 ts_rank_cd 排序
+- 语义检索：Thread/Post.embedding（HNSW 索引，余弦距离），保存后由后台线程补算
+- 两路各取 FORUM_SEARCH_CANDIDATES 个候选，按 RRF（倒数排名融合）合并打分后分页；
+  每路查询都有 statement_timeout，超时则退化为不排序的结果或直接放弃该路，保证延迟有上限
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, connection, transaction
+from pgvector.django import CosineDistance
+
+from .embeddings import get_embedder
+from .models import Post, Thread
+from .rag import apply_search_params, embed_query
+from .text import search_tokens
+
+logger = logging.getLogger(__name__)
+
+RRF_K = 60
+MAX_QUERY_TERMS = 16
+SEARCH_MODELS = {'thread': Thread, 'post': Post}
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='forum-embed')
+_scheduled = threading.Event()
+
+
+# ---------- 写入后补算向量 ----------
+
+def embed_pending_content(batch_size=64, models=None, limit=None):
+    """为还没有 embedding 的帖子/回复计算向量，返回处理的行数"""
+    embedder = get_embedder()
+    max_chars = settings.FORUM_SEARCH_EMBED_CHARS
+    done = 0
+    for model in models or SEARCH_MODELS.values():
+        while limit is None or done < limit:
+            batch = list(
+                model.objects.filter(embedding__isnull=True).exclude(plain_text='')
+                .order_by('id').only('id', 'plain_text', *model.render_source_fields)[:batch_size]
+            )
+            if not batch:
+                break
+            vectors = embedder([obj.embedding_text()[:max_chars] for obj in batch])
+            for obj, vector in zip(batch, vectors):
+                obj.embedding = vector
+            model.objects.bulk_update(batch, ['embedding'])
+            done += len(batch)
+    return done
+
+
+def _embed_worker():
+    _scheduled.clear()
+    try:
+        embed_pending_content()
+    except Exception as e:
+        logger.error(f"💥 帖子向量生成失败: {e}")
+    finally:
+        connection.close()
+
+
+def schedule_content_embedding():
+    """提交后台补算任务；已有任务在排队时不重复提交"""
+    if not settings.FORUM_SEARCH_EMBEDDINGS or _scheduled.is_set():
+        return
+    _scheduled.set()
+    _executor.submit(_embed_worker)
+
+
+# ---------- 查询 ----------
+
+def build_tsquery(query):
+    """把用户输入分词后拼成 AND 查询；无有效词时返回 None"""
+    terms = list(dict.fromkeys(search_tokens(query, for_query=True)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    # 每个词作为带引号的词素，不再经过 Postgres 的分词器
+    return ' & '.join("'" + term.replace("'", "''").replace('\\', '\\\\') + "'" for term in terms)
+
+
+def _set_timeout(cursor):
+    cursor.execute("SET LOCAL statement_timeout = %s" % int(settings.FORUM_SEARCH_TIMEOUT_MS))
+
+
+def text_candidates(model, tsquery, limit):
+    """全文检索候选 [id, ...]，按 ts_rank_cd 排序；排序超时时退化为按 id 倒序取匹配行"""
+    table = model._meta.db_table
+    ranked = (
+        f"SELECT id FROM {table} WHERE search_vector @@ %s::tsquery "
+        f"ORDER BY ts_rank_cd(search_vector, %s::tsquery) DESC, id DESC LIMIT %s"
+    )
+    unranked = f"SELECT id FROM {table} WHERE search_vector @@ %s::tsquery ORDER BY id DESC LIMIT %s"
+    for sql, params in ((ranked, [tsquery, tsquery, limit]), (unranked, [tsquery, limit])):
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                _set_timeout(cursor)
+                cursor.execute(sql, params)
+                return [row[0] for row in cursor.fetchall()]
+        except OperationalError as e:
+            # 常见词匹配行数过多，排序超时
+            logger.warning(f"⚠️ {table} 全文检索超时: {e}")
+    return []
+
+
+def vector_candidates(model, embedding, limit):
+    """语义检索候选 [id, ...]，按余弦距离排序，距离超过 FORUM_SEARCH_MAX_DISTANCE 的视为不相关"""
+    queryset = model.objects.annotate(distance=CosineDistance('embedding', embedding)).order_by('distance')
+    if settings.FORUM_SEARCH_MAX_DISTANCE is not None:
+        queryset = queryset.filter(distance__lt=settings.FORUM_SEARCH_MAX_DISTANCE)
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                _set_timeout(cursor)
+                apply_search_params(cursor)
+            return list(queryset.values_list('id', flat=True)[:limit])
+    except DatabaseError as e:
+        logger.warning(f"⚠️ {model._meta.db_table} 语义检索失败: {e}")
+        return []
+
+
+def fuse(rankings, k=RRF_K):
+    """
+    倒数排名融合：rankings 为 [(name, weight, [key, ...]), ...]
+    返回 [(key, score, [name, ...]), ...]，按得分降序
+    """
+    scores, matched = {}, {}
+    for name, weight, keys in rankings:
+        for rank, key in enumerate(keys, 1):
+            scores[key] = scores.get(key, 0.0) + weight / (k + rank)
+            matched.setdefault(key, []).append(name)
+    ordered = sorted(scores, key=lambda key: (-scores[key], key))
+    return [(key, scores[key], matched[key]) for key in ordered]
+
+
+def search(query, types=('thread', 'post')):
+    """返回融合排序后的 [(type, id, score, matched), ...]，最多 FORUM_SEARCH_CANDIDATES 条"""
+    limit = settings.FORUM_SEARCH_CANDIDATES
+    tsquery = build_tsquery(query)
+    embedding = embed_query(query) if settings.FORUM_SEARCH_EMBEDDINGS else None
+
+    rankings = []
+    for type_ in types:
+        model = SEARCH_MODELS[type_]
+        if tsquery:
+            ids = text_candidates(model, tsquery, limit)
+            rankings.append(('text', settings.FORUM_SEARCH_TEXT_WEIGHT, [(type_, pk) for pk in ids]))
+        if embedding is not None:
+            ids = vector_candidates(model, embedding, limit)
+            rankings.append(('semantic', settings.FORUM_SEARCH_VECTOR_WEIGHT, [(type_, pk) for pk in ids]))
+    return [(type_, pk, score, names) for (type_, pk), score, names in fuse(rankings)[:limit]]
+
+
+def hydrate(hits):
+    """按命中结果批量取出帖子/回复（每种类型一次查询），返回与 hits 同序的结果字典"""
+    ids = {}
+    for type_, pk, _, _ in hits:
+        ids.setdefault(type_, []).append(pk)
+    objects = {}
+    if 'thread' in ids:
+        for thread in (Thread.objects.filter(id__in=ids['thread']).select_related('author')
+                       .only('id', 'title', 'content_preview', 'created_at', 'author__username')):
+            objects['thread', thread.id] = thread
+    if 'post' in ids:
+        for post in (Post.objects.filter(id__in=ids['post']).select_related('author', 'thread')
+                     .only('id', 'thread_id', 'thread__title', 'content_preview', 'created_at',
+                           'author__username')):
+            objects['post', post.id] = post
+
+    results = []
+    for type_, pk, score, matched in hits:
+        obj = objects.get((type_, pk))
+        if obj is None:
+            continue  # 候选查询之后被删除
+        thread = obj if type_ == 'thread' else obj.thread
+        results.append({
+            "type": type_,
+            "id": obj.id,
+            "thread_id": thread.id,
+            "title": thread.title,
+            "snippet": obj.content_preview,
+            "author_name": obj.author.username,
+            "created_at": obj.created_at,
+            "score": round(score, 6),
+            "matched": matched,
+        })
+    return results
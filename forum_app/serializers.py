@@ -1,51 +1,141 @@
 from rest_framework import serializers
-from .models import Thread, Post, HumanUser
-import re
+from .models import Actor, Category, Thread, Post, HumanUser
 
-def strip_html_tags(text):
-    clean = re.compile('<.*?>')
-    return re.sub(clean, '', text).strip()
+def absolute_avatar_url(request, url):
+    # 前端与后端不同源，相对的头像地址需要补全为绝对地址
+    if url and url.startswith('/') and request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+class AvatarURLField(serializers.ReadOnlyField):
+    """输出头像的短地址（/api/avatars/<id>/?v=<hash>），而不是图片本身"""
+    def to_representation(self, value):
+        return absolute_avatar_url(self.context.get('request'), value)
 
 class PostSerializer(serializers.ModelSerializer):
+    # 输出保存时清理过的内容
+    content = serializers.CharField(source='safe_content', read_only=True)
     author_name = serializers.CharField(source='author.username', read_only=True)
-    author_avatar = serializers.CharField(source='author.avatar', read_only=True)
+    author_avatar = AvatarURLField(source='author.avatar')
     is_ai = serializers.BooleanField(source='author.is_ai', read_only=True)
 
     class Meta:
         model = Post
-        fields = ['id', 'content', 'created_at', 'author_name', 'author_avatar', 'is_ai']
+        fields = ['id', 'content', 'created_at', 'author_name', 'author_avatar', 'is_ai', 'score']
 
 class ThreadListSerializer(serializers.ModelSerializer):
     """
     用于帖子列表页的轻量级序列化器
     """
     author_name = serializers.CharField(source='author.username', read_only=True)
-    author_avatar = serializers.CharField(source='author.avatar', read_only=True)
-    post_count = serializers.IntegerField(read_only=True) # 由 annotate 提供
-    reply_count = serializers.SerializerMethodField()
-    content_preview = serializers.SerializerMethodField()
+    author_avatar = AvatarURLField(source='author.avatar')
+    post_count = serializers.SerializerMethodField()
+    last_post_author_name = serializers.CharField(source='last_post_author.username', read_only=True, default=None)
 
     class Meta:
         model = Thread
-        fields = ['id', 'title', 'created_at', 'author_name', 'author_avatar', 'ai_generating', 'post_count', 'reply_count', 'content_preview']
-
-    def get_reply_count(self, obj):
-        # post_count 包含了楼主的帖子，回复数要-1
-        return obj.post_count - 1 if hasattr(obj, 'post_count') and obj.post_count > 0 else 0
+        fields = ['id', 'title', 'created_at', 'author_name', 'author_avatar', 'ai_generating', 'post_count', 'reply_count', 'last_post_at', 'last_post_author_name', 'content_preview', 'score', 'category']
 
-    def get_content_preview(self, obj):
-        # 创建一个纯文本预览
-        plain_text = strip_html_tags(obj.content)
-        return plain_text[:100] if len(plain_text) > 100 else plain_text
+    def get_post_count(self, obj):
+        # post_count 包含楼主的帖子
+        return obj.reply_count + 1
 
 class ThreadSerializer(serializers.ModelSerializer):
     """
-    用于帖子详情页的完整序列化器
+    用于帖子详情页的序列化器（楼主内容；回复由视图分页后放入 posts）
     """
+    content = serializers.CharField(source='safe_content', read_only=True)
     author_name = serializers.CharField(source='author.username', read_only=True)
-    author_avatar = serializers.CharField(source='author.avatar', read_only=True)
-    posts = PostSerializer(many=True, read_only=True)
+    author_avatar = AvatarURLField(source='author.avatar')
 
     class Meta:
         model = Thread
-        fields = ['id', 'title', 'content', 'created_at', 'author_name', 'author_avatar', 'posts', 'ai_generating']
\ No newline at end of file
+        fields = ['id', 'title', 'content', 'created_at', 'author_name', 'author_avatar', 'reply_count', 'ai_generating', 'score', 'category']
+
+class CategorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'description', 'thread_count']
+
+
+# ==================== 快速序列化（.values()） ====================
+# 列表、详情、增量接口每次输出几十行，ModelSerializer 逐行逐字段调用字段对象、构造模型实例的开销占了大头。
+# 下面的函数直接把 .values() 查询出的字典转换为与上面序列化器相同的结构（字段、顺序、格式一致，见 tests.py）。
+
+_datetime_field = serializers.DateTimeField()
+
+AUTHOR_VALUES = ('author_id', 'author__username', 'author__avatar_hash', 'author__avatar_url')
+POST_VALUES = ('id', 'safe_content', 'created_at', *AUTHOR_VALUES, 'author__aiagent', 'score')
+THREAD_LIST_VALUES = (
+    'id', 'title', 'created_at', *AUTHOR_VALUES, 'ai_generating', 'reply_count', 'last_post_at',
+    'last_post_author__username', 'content_preview', 'score', 'category_id',
+    # 不输出，?sort=hot 时用作分页游标
+    'hot_rank',
+)
+THREAD_VALUES = (
+    'id', 'title', 'safe_content', 'created_at', *AUTHOR_VALUES, 'reply_count', 'ai_generating', 'score',
+    'category_id',
+)
+
+
+def _author_avatar(request, row):
+    return absolute_avatar_url(
+        request, Actor.avatar_for(row['author_id'], row['author__avatar_hash'], row['author__avatar_url'])
+    )
+
+
+def serialize_posts(rows, request):
+    """POST_VALUES 的行 -> 与 PostSerializer(many=True) 相同的输出"""
+    to_datetime = _datetime_field.to_representation
+    return [
+        {
+            "id": row['id'],
+            "content": row['safe_content'],
+            "created_at": to_datetime(row['created_at']),
+            "author_name": row['author__username'],
+            "author_avatar": _author_avatar(request, row),
+            "is_ai": row['author__aiagent'] is not None,
+            "score": row['score'],
+        }
+        for row in rows
+    ]
+
+
+def serialize_thread_list(rows, request):
+    """THREAD_LIST_VALUES 的行 -> 与 ThreadListSerializer(many=True) 相同的输出"""
+    to_datetime = _datetime_field.to_representation
+    return [
+        {
+            "id": row['id'],
+            "title": row['title'],
+            "created_at": to_datetime(row['created_at']),
+            "author_name": row['author__username'],
+            "author_avatar": _author_avatar(request, row),
+            "ai_generating": row['ai_generating'],
+            # post_count 包含楼主的帖子
+            "post_count": row['reply_count'] + 1,
+            "reply_count": row['reply_count'],
+            "last_post_at": to_datetime(row['last_post_at']),
+            "last_post_author_name": row['last_post_author__username'],
+            "content_preview": row['content_preview'],
+            "score": row['score'],
+            "category": row['category_id'],
+        }
+        for row in rows
+    ]
+
+
+def serialize_thread(row, request):
+    """THREAD_VALUES 的行 -> 与 ThreadSerializer 相同的输出"""
+    return {
+        "id": row['id'],
+        "title": row['title'],
+        "content": row['safe_content'],
+        "created_at": _datetime_field.to_representation(row['created_at']),
+        "author_name": row['author__username'],
+        "author_avatar": _author_avatar(request, row),
+        "reply_count": row['reply_count'],
+        "ai_generating": row['ai_generating'],
+        "score": row['score'],
+        "category": row['category_id'],
+    }
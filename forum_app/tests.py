@@ -1,3 +1,986 @@
-from django.test import TestCase
+import base64
+import io
+import threading
+import time
+from datetime import timedelta
+from html.parser import HTMLParser
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import ai_service, metrics
+from .admission import (
+    DEFERRED, QUEUED, SKIPPED, _Exhausted, _take, admission_stats, admit_generation, inflight_calls, llm_slot,
+)
+from .ai_tasks import generate_replies
+from .context import estimate_tokens, truncate_to_tokens
+from .jobs import claim_job, enqueue_generation, finish_job, recover_stale_jobs, renew_leases, run_job
+from .llm_stub import StubConfig, start_stub_server
+from .middleware import choose_encoding, compress_response
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+from .models import AIAgent, AvatarImage, Category, GenerationJob, HumanUser, Post, RateLimitBucket, Thread, Vote
+from .renderers import ORJSONRenderer, dumps
+from .response_cache import response_cache
+from .serializers import (
+    POST_VALUES, THREAD_LIST_VALUES, THREAD_VALUES, PostSerializer, ThreadListSerializer, ThreadSerializer,
+    serialize_posts, serialize_thread, serialize_thread_list,
+)
+from .text import DROP_CONTENT_TAGS, sanitize_html
+
+
+class FastSerializationParityTests(TestCase):
+    """.values() 快速序列化与 ModelSerializer 的输出必须完全一致"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.human = HumanUser.objects.create_user('alice', 'alice@example.com', 'pw')
+        cls.uploader = HumanUser.objects.create_user('bob', 'bob@example.com', 'pw', avatar_hash='ab' * 32)
+        cls.agent = AIAgent.objects.create(
+            username='小助手', system_prompt='你是一个助手', avatar_url='https://example.com/a.png'
+        )
+        cls.thread = Thread.objects.create(title='第一帖 <b>', content='<p>你好 世界</p>', author=cls.human,
+                                           category=Category.objects.create(name='技术'))
+        for author, text in [(cls.agent, 'AI 回复'), (cls.uploader, '<script>x</script>人类回复')]:
+            post = Post.objects.create(thread=cls.thread, author=author, content=text)
+            Thread.record_post(post)
+        # 没有回复的帖子，以及最后回复者被删除（last_post_author 为空）的帖子
+        Thread.objects.create(title='空帖', content='', author=cls.uploader)
+        orphan = Thread.objects.create(title='孤帖', content='内容', author=cls.agent)
+        Thread.objects.filter(pk=orphan.pk).update(last_post_author=None)
+
+    def setUp(self):
+        self.request = RequestFactory().get('/api/threads/')
+        self.context = {'request': self.request}
+
+    def test_posts(self):
+        posts = Post.objects.filter(thread=self.thread).order_by('id')
+        expected = PostSerializer(posts.select_related('author__aiagent'), many=True, context=self.context).data
+        self.assertEqual(serialize_posts(posts.values(*POST_VALUES), self.request), expected)
+
+    def test_thread_list(self):
+        threads = Thread.objects.order_by('id')
+        expected = ThreadListSerializer(
+            threads.select_related('author', 'last_post_author'), many=True, context=self.context
+        ).data
+        self.assertEqual(serialize_thread_list(threads.values(*THREAD_LIST_VALUES), self.request), expected)
+
+    def test_thread(self):
+        expected = ThreadSerializer(Thread.objects.get(pk=self.thread.pk), context=self.context).data
+        row = Thread.objects.filter(pk=self.thread.pk).values(*THREAD_VALUES).first()
+        self.assertEqual(serialize_thread(row, self.request), expected)
+
+    def test_rendered_bytes(self):
+        # 字段顺序也要一致，逐字节比较 DRF 默认渲染结果
+        threads = Thread.objects.order_by('id')
+        expected = JSONRenderer().render(ThreadListSerializer(threads, many=True, context=self.context).data)
+        fast = serialize_thread_list(threads.values(*THREAD_LIST_VALUES), self.request)
+        self.assertEqual(ORJSONRenderer().render(fast), expected)
+        self.assertEqual(dumps(fast), expected)
+
+
+class CompressionTests(SimpleTestCase):
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding('gzip, deflate, br'), 'br')
+        self.assertEqual(choose_encoding('gzip'), 'gzip')
+        self.assertEqual(choose_encoding('br;q=0.5, gzip;q=0.8'), 'gzip')
+        self.assertEqual(choose_encoding('*'), 'br')
+        self.assertEqual(choose_encoding('*;q=0, gzip'), 'gzip')
+        self.assertIsNone(choose_encoding('identity'))
+        self.assertIsNone(choose_encoding(''))
+
+    @override_settings(FORUM_COMPRESSION_MIN_BYTES=100)
+    def test_compress_response(self):
+        from django.http import HttpResponse, StreamingHttpResponse
+
+        body = dumps([{"content": "论坛回复内容"} for _ in range(50)])
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        response = compress_response(request, HttpResponse(body, content_type='application/json'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertLess(len(response.content), len(body))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        # 太小的响应只加 Vary，不压缩
+        response = compress_response(request, HttpResponse(b'{}', content_type='application/json'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        # SSE 等流式响应原样返回
+        stream = StreamingHttpResponse(iter([body]), content_type='text/event-stream')
+        self.assertFalse(compress_response(request, stream).has_header('Content-Encoding'))
+
+
+def _auth(user):
+    return {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+
+def _png():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), 'red').save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+class TruncateTests(SimpleTestCase):
+    """truncate_to_tokens 的边界：预算为 0 或负数、单个字符超出预算，都必须返回而不是死循环"""
+
+    def test_truncate(self):
+        text = '缓存和索引往往比换框架更有效 cache and index ' * 20
+        for budget in (1, 2, 7, 50, 10000):
+            with self.subTest(budget=budget):
+                result = truncate_to_tokens(text, budget)
+                self.assertTrue(text.startswith(result))
+                self.assertLessEqual(estimate_tokens(result), budget)
+        self.assertEqual(truncate_to_tokens(text, 10000), text)
+
+    def test_edge_cases(self):
+        for text, budget in (('长文本' * 10, 0), ('长文本', -5), ('缓', 0), ('', 0), ('缓', 0.5), ('a' * 9, 1)):
+            with self.subTest(text=text, budget=budget):
+                result = truncate_to_tokens(text, budget)
+                self.assertTrue(text.startswith(result))
+                self.assertLessEqual(estimate_tokens(result), max(budget, 0))
+
+
+class _TagCollector(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.tags = []
+
+    def handle_starttag(self, tag, attrs):
+        self.tags.append((tag, attrs))
+
+
+class SanitizerTests(SimpleTestCase):
+    """
+    sanitize_html 的输出会被前端当作 Markdown（允许原始 HTML）渲染，
+    无论渲染器把哪部分当作代码，输出都不能包含可执行的标签或属性
+    """
+
+    def assertSafe(self, content):
+        # 最坏情况：渲染器不把任何部分当作代码，整个输出按 HTML 解析
+        result = sanitize_html(content)
+        parser = _TagCollector()
+        parser.feed(result)
+        parser.close()
+        for tag, attrs in parser.tags:
+            self.assertNotIn(tag, DROP_CONTENT_TAGS, msg=result)
+            for name, value in attrs:
+                self.assertFalse(name.startswith('on'), msg=result)
+                self.assertNotIn('javascript:', (value or '').lower(), msg=result)
+        return result
+
+    def test_escaped_backticks(self):
+        result = self.assertSafe(r'hi \`<img src=x onerror=alert(1)>\` there')
+        self.assertEqual(result, r'hi \`<img src="x" />\` there')
+        # 偶数个反斜杠时反引号没有被转义，是正常的行内代码
+        self.assertEqual(sanitize_html(r'\\`<b>x</b>`'), r'\\`<b>x</b>`')
+
+    def test_backticks_inside_tags(self):
+        self.assertSafe('<img title="`" onerror=alert(1) x="`">')
+        self.assertSafe('`<img src=x `onerror=alert(1)>')
+        self.assertEqual(sanitize_html('<img src=x '), '&lt;img src=x ')
+
+    def test_unclosed_fence(self):
+        self.assertEqual(sanitize_html('```\n<img src=x onerror=alert(1)>\n'), '```\n&lt;img src=x onerror=alert(1)>\n')
+        # 列表中的围栏不识别为代码，后面顶格的内容按普通文本清理
+        self.assertSafe('- a\n  ```\n<img src=x onerror=alert(1)>\n')
+
+    def test_nested_fences(self):
+        content = '````\n```\n<div>x</div>\n```\n````\nafter <img src=x onerror=alert(1)>'
+        self.assertEqual(sanitize_html(content), '````\n```\n<div>x</div>\n```\n````\nafter <img src="x" />')
+        # 较短的围栏不能结束较长的围栏，也不能提前结束后面的清理
+        self.assertSafe('```\ncode\n``\n<script>alert(1)</script>\n```')
+
+    def test_code_is_kept(self):
+        for content in ('`a < b` and `<div class="x">`', '``co`de``', '```py\nif a < b:\n    pass\n```'):
+            with self.subTest(content=content):
+                self.assertEqual(sanitize_html(content), content)
+        # 代码中的危险标签转义后显示，而不是原样保留
+        self.assertEqual(sanitize_html('`<script>alert(1)</script>`'), '`&lt;script>alert(1)&lt;/script>`')
+
+    def test_attribute_handlers(self):
+        self.assertEqual(sanitize_html('<b onclick="x()" class="c">t</b>'), '<b class="c">t</b>')
+        self.assertEqual(sanitize_html('<a href="java\tscript:alert(1)" title="t">x</a>'), '<a title="t">x</a>')
+        self.assertEqual(sanitize_html('<img src="https://e.com/a.png" onload=alert(1)>'),
+                         '<img src="https://e.com/a.png" />')
+        self.assertEqual(sanitize_html('<p>a <!-- c --> b</p><svg onload=alert(1)><g/></svg>'), '<p>a  b</p>')
+        self.assertSafe('x <!-- <img src=x onerror=alert(1)>')
+
+
+class PaginationTests(TestCase):
+    """游标的编码/解码、无效游标、相同排序值按 id 分页，以及换了排序方式的游标"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = HumanUser.objects.create_user('alice', 'alice@example.com', 'pw')
+        cls.threads = [Thread.objects.create(title=f't{i}', content='内容', author=cls.user) for i in range(5)]
+        # 全部帖子的发帖时间相同，只能靠 id 区分先后
+        Thread.objects.update(created_at=cls.threads[0].created_at)
+
+    def setUp(self):
+        response_cache.local.clear()
+
+    def test_round_trip(self):
+        now = timezone.now()
+        for value, field in ((now, 'created_at'), (1.7e9 / 45000 + 0.1, 'hot_rank'), (-3, 'hot_rank')):
+            with self.subTest(value=value):
+                cursor = encode_cursor(value, 42, field)
+                self.assertNotIn('=', cursor)
+                self.assertEqual(decode_cursor(cursor), (value, 42, field))
+
+    def test_invalid(self):
+        def raw(payload):
+            return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+        valid = encode_cursor(timezone.now(), 1, 'created_at')
+        cursors = [
+            '!!!', '€', valid[:-4], raw('not json'), raw('{}'), raw('[1, 2]'), raw('[1, 2, "hot_rank", 4]'),
+            raw('["yesterday", 1, "created_at"]'), raw('[null, 1, "hot_rank"]'), raw('[true, 1, "hot_rank"]'),
+            raw('[1.5, "1", "hot_rank"]'), raw('[1.5, true, "hot_rank"]'), raw('[1.5, 1, null]'),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(InvalidCursor):
+                    decode_cursor(cursor)
+                self.assertEqual(self.client.get('/api/threads/', {'cursor': cursor}).status_code, 400)
+        self.assertEqual(self.client.get(f'/api/threads/{self.threads[0].pk}/', {'cursor': '!!!'}).status_code, 400)
+
+    def test_ties(self):
+        expected = [t.pk for t in reversed(self.threads)]
+        for urlconf in ('ai_forum_project.urls', 'ai_forum_project.urls_api'):
+            with self.subTest(urlconf=urlconf), override_settings(ROOT_URLCONF=urlconf):
+                response_cache.local.clear()
+                ids, params = [], {'page_size': 2}
+                while True:
+                    data = self.client.get('/api/threads/', params).json()
+                    ids += [t['id'] for t in data['results']]
+                    if data['next_cursor'] is None:
+                        break
+                    params['cursor'] = data['next_cursor']
+                self.assertEqual(ids, expected)
+
+                # 从最后一页往回翻，得到前一页
+                params.update(cursor=data['prev_cursor'], direction='prev')
+                data = self.client.get('/api/threads/', params).json()
+                self.assertEqual([t['id'] for t in data['results']], expected[2:4])
+
+    def test_cursor_from_other_sort(self):
+        cursors = {
+            sort: self.client.get('/api/threads/', {'page_size': 2, 'sort': sort}).json()['next_cursor']
+            for sort in ('', 'activity', 'hot')
+        }
+        for issued, cursor in cursors.items():
+            for sort in cursors:
+                with self.subTest(issued=issued, sort=sort):
+                    response = self.client.get('/api/threads/', {'page_size': 2, 'sort': sort, 'cursor': cursor})
+                    self.assertEqual(response.status_code, 200 if sort == issued else 400)
+
+
+# 不在测试进程中启动 worker 池；向量使用本地哈希，不联网
+@override_settings(FORUM_AI_EMBEDDED_WORKERS=False, FORUM_RAG_EMBEDDER='local', FORUM_AVATAR_WORKERS=0)
+class ViewQueryCountTests(TestCase):
+    """
+    urls.py 中每个接口的 SQL 条数（防止 N+1 等回归）
+    数量变化时先确认是否合理，再更新这里的断言。
+
+    TestCase 在事务中运行，视图里的 transaction.atomic() 会多出 SAVEPOINT / RELEASE 两条，
+    生产环境中对应的是 BEGIN / COMMIT，不计入查询数。
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = HumanUser.objects.create_user('alice', 'alice@example.com', 'pw')
+        cls.admin = HumanUser.objects.create_user('root', 'root@example.com', 'pw', is_staff=True)
+        cls.agent = AIAgent.objects.create(username='Bot', system_prompt='你是一个助手')
+        cls.thread = Thread.objects.create(title='性能优化', content='<p>如何优化数据库查询</p>', author=cls.user)
+        for author in (cls.agent, cls.user, cls.agent):
+            Thread.record_post(Post.objects.create(thread=cls.thread, author=author, content='数据库索引很重要'))
+        AvatarImage.objects.create(actor=cls.user, size=40, data=b'x', content_hash='ab' * 32)
+
+    def setUp(self):
+        # 列表版本号在事务提交后才递增，测试中不会变化，每个测试前清空进程内缓存
+        response_cache.local.clear()
+
+    def test_thread_list(self):
+        # 列表版本号（未配置共享缓存时读 Postgres 序列）+ 一页帖子
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/api/threads/').status_code, 200)
+        # 缓存命中时只读版本号
+        with self.assertNumQueries(1):
+            self.client.get('/api/threads/')
+
+    def test_list_version_shared_across_processes(self):
+        # 另一个进程（独立 worker）递增版本号后，本进程的列表缓存随之失效
+        other = response_cache.__class__()
+        version = response_cache.list_version()
+        other.bump_list_version()
+        self.assertEqual(response_cache.list_version(), version + 1)
+        self.assertEqual(other.list_version(), version + 1)
+
+    def test_thread_detail(self):
+        # 版本号 + 楼主 + 一页回复，回复数不影响查询数
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get(f'/api/threads/{self.thread.pk}/').status_code, 200)
+        with self.assertNumQueries(1):
+            self.client.get(f'/api/threads/{self.thread.pk}/')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/threads/0/').status_code, 404)
+
+    def test_thread_updates(self):
+        url = f'/api/threads/{self.thread.pk}/posts/'
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        # 版本未变化时只读 Thread 的一行
+        with self.assertNumQueries(1):
+            response = self.client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_thread_events(self):
+        # WSGI 下不提供事件流（会一直占住线程）：204 让 EventSource 不再重连，前端退回轮询
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/threads/{self.thread.pk}/events/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(response.streaming)
+
+    def test_create_thread(self):
+        # 认证 + 队列深度 + 用户令牌桶（含保存点 2 条）+ 帖子 + 任务
+        with self.assertNumQueries(7):
+            response = self.client.post('/api/create/', {'title': 't', 'content': '<p>内容</p>'},
+                                        content_type='application/json', headers=_auth(self.user))
+        self.assertEqual(response.status_code, 200)
+
+    def test_create_thread_in_category(self):
+        # 另有分类存在性检查，帖子与分类计数在同一事务中（多一对保存点和一条 UPDATE）
+        category = Category.objects.create(name='技术')
+        with self.assertNumQueries(11):
+            response = self.client.post('/api/create/', {'title': 't', 'content': '<p>内容</p>', 'category': category.pk},
+                                        content_type='application/json', headers=_auth(self.user))
+        self.assertEqual(response.status_code, 200)
+
+    def test_categories(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/api/categories/').status_code, 200)
+        with self.assertNumQueries(1):
+            self.client.get('/api/categories/')
+
+    def test_reply_thread(self):
+        # 认证 + 帖子 + 队列深度 + 用户/帖子令牌桶 + 回复与计数（同一事务）+ 任务，另有 2 对保存点
+        with self.assertNumQueries(12):
+            response = self.client.post(f'/api/threads/{self.thread.pk}/reply/', {'content': '回复'},
+                                        content_type='application/json', headers=_auth(self.user))
+        self.assertEqual(response.status_code, 200)
+
+    def test_vote(self):
+        # 认证 + 锁定回复 + 原来的票 + 写票 + 回复得分 + 帖子得分与热度，另有一对保存点
+        post = Post.objects.filter(thread=self.thread).first()
+        with self.assertNumQueries(8):
+            response = self.client.post(f'/api/posts/{post.pk}/vote/', {'direction': 1},
+                                        content_type='application/json', headers=_auth(self.user))
+        self.assertEqual(response.status_code, 200)
+        # 重复投同一方向：只有认证、锁定和读票
+        with self.assertNumQueries(5):
+            self.client.post(f'/api/posts/{post.pk}/vote/', {'direction': 1},
+                             content_type='application/json', headers=_auth(self.user))
+
+    def test_search(self):
+        # 先搜索一次，读取 pgvector 版本（进程内只查一次）
+        self.client.get('/api/search/', {'q': '数据库'})
+        # 每种类型：全文检索（超时设置 + 查询）、语义检索（超时和索引参数 + 查询），各在一个保存点内；
+        # 再按类型各取一次结果
+        with self.assertNumQueries(22):
+            response = self.client.get('/api/search/', {'q': '数据库'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_admin_stats(self):
+        headers = _auth(self.admin)
+        for url, queries in [('/api/ai/queue/', 5), ('/api/db/stats/', 3), ('/api/cache/stats/', 2)]:
+            with self.subTest(url=url), self.assertNumQueries(queries):
+                self.assertEqual(self.client.get(url, headers=headers).status_code, 200)
+
+    def test_metrics(self):
+        # 默认只对管理员开放；抓取时读取：队列统计 3 条、全局模型调用占用 1 条、服务端连接 2 条
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+        self.assertEqual(self.client.get('/api/metrics/', headers=_auth(self.user)).status_code, 401)
+        with self.assertNumQueries(1 + 6):
+            self.assertEqual(self.client.get('/api/metrics/', headers=_auth(self.admin)).status_code, 200)
+
+        with self.settings(FORUM_METRICS_TOKEN='secret'):
+            with self.assertNumQueries(6):
+                response = self.client.get('/api/metrics/', headers={'Authorization': 'Bearer secret'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.client.get('/api/metrics/', headers={'Authorization': 'Bearer x'}).status_code, 401)
+        with self.settings(FORUM_METRICS_PUBLIC=True):
+            self.assertEqual(self.client.get('/api/metrics/').status_code, 200)
+
+    def test_register_and_login(self):
+        # 用户名、邮箱查重 + Actor、HumanUser 两张表
+        with self.assertNumQueries(4):
+            response = self.client.post('/api/register/', {'username': 'bob', 'email': 'bob@example.com',
+                                                           'password': 'pw'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/login/', {'username': 'bob', 'password': 'pw'},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_current_user(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/user/me/', headers=_auth(self.user)).status_code, 200)
+
+    def test_avatar(self):
+        # 认证 + 替换各尺寸（删除、批量插入）+ 更新头像哈希，另有一对保存点
+        with self.assertNumQueries(6):
+            response = self.client.post('/api/user/avatar/', {'avatar': _png()},
+                                        content_type='application/json', headers=_auth(self.user))
+        self.assertEqual(response.status_code, 200)
+        # 选出尺寸 + 读取图片；ETag 命中时不读取图片
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/avatars/{self.user.pk}/', {'size': 40})
+        with self.assertNumQueries(1):
+            self.client.get(f'/api/avatars/{self.user.pk}/', {'size': 40}, headers={'If-None-Match': response['ETag']})
+
+
+@override_settings(ROOT_URLCONF='ai_forum_project.urls_api')
+class AsyncViewQueryCountTests(TestCase):
+    """ASGI 部署下的异步读接口（async_views.py）与同步版本查询数相同"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = HumanUser.objects.create_user('alice', 'alice@example.com', 'pw')
+        cls.thread = Thread.objects.create(title='标题', content='内容', author=cls.user)
+        Thread.record_post(Post.objects.create(thread=cls.thread, author=cls.user, content='回复'))
+
+    def setUp(self):
+        response_cache.local.clear()
+
+    def test_async_views(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/api/threads/').status_code, 200)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/api/threads/', {'category': 1}).status_code, 200)
+        self.assertEqual(self.client.get('/api/threads/', {'category': 'abc'}).status_code, 400)
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get(f'/api/threads/{self.thread.pk}/').status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/user/me/', headers=_auth(self.user)).status_code, 200)
+
+    def test_thread_events(self):
+        # 事件流本身在迭代时才查询状态，这里只计建立响应时的存在性检查
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/threads/{self.thread.pk}/events/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/threads/0/events/').status_code, 404)
+
+
+class VoteTests(TestCase):
+    """投票后回复得分、帖子得分和热度与 Vote 表一致，热门列表按热度分页"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = HumanUser.objects.create_user('alice', 'alice@example.com', 'pw')
+        cls.bob = HumanUser.objects.create_user('bob', 'bob@example.com', 'pw')
+        cls.thread = Thread.objects.create(title='标题', content='内容', author=cls.alice)
+        cls.posts = []
+        for _ in range(2):
+            post = Post.objects.create(thread=cls.thread, author=cls.alice, content='回复')
+            Thread.record_post(post)
+            cls.posts.append(post)
+
+    def setUp(self):
+        response_cache.local.clear()
+
+    def vote(self, user, post, direction=None):
+        url = f'/api/posts/{post.pk}/vote/'
+        if direction is None:
+            return self.client.delete(url, headers=_auth(user))
+        return self.client.post(url, {'direction': direction}, content_type='application/json', headers=_auth(user))
+
+    def assertConsistent(self):
+        thread = Thread.objects.get(pk=self.thread.pk)
+        snapshot = [(p.pk, p.score) for p in Post.objects.filter(thread=thread)] + [(thread.score, thread.hot_rank)]
+        Post.refresh_scores([thread.pk])
+        Thread.refresh_counters([thread.pk])
+        thread.refresh_from_db()
+        self.assertEqual(
+            [(p.pk, p.score) for p in Post.objects.filter(thread=thread)] + [(thread.score, thread.hot_rank)],
+            snapshot,
+        )
+
+    def test_vote_change_and_remove(self):
+        first, second = self.posts
+        version = Thread.objects.get(pk=self.thread.pk).version
+        for user, post, direction, score in [
+            (self.alice, first, 1, 1), (self.bob, first, 1, 2),
+            (self.bob, first, 1, 2),        # 重复投票不变
+            (self.bob, first, -1, 0),       # 改票
+            (self.alice, second, -1, -1),
+            (self.alice, first, None, -1),  # 撤销
+            (self.alice, first, None, -1),  # 没投过也可以撤销
+        ]:
+            response = self.vote(user, post, direction)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {'post_id': post.pk, 'score': score, 'direction': direction or 0})
+        self.assertEqual(Vote.objects.filter(post__thread=self.thread).count(), 2)
+        self.assertEqual(Thread.objects.get(pk=self.thread.pk).score, -2)
+        # 只有得分真正变化的 5 次投票递增版本号
+        self.assertEqual(Thread.objects.get(pk=self.thread.pk).version, version + 5)
+        self.assertConsistent()
+        self.assertEqual(self.client.get(f'/api/threads/{self.thread.pk}/').json()['score'], -2)
+
+    def test_invalid_vote(self):
+        for direction in (0, 2, 'up', ''):
+            with self.subTest(direction=direction):
+                self.assertEqual(self.vote(self.alice, self.posts[0], direction).status_code, 400)
+        self.assertEqual(self.client.post('/api/posts/0/vote/', {'direction': 1}, content_type='application/json',
+                                          headers=_auth(self.alice)).status_code, 404)
+        self.assertEqual(self.client.post(f'/api/posts/{self.posts[0].pk}/vote/', {'direction': 1},
+                                          content_type='application/json').status_code, 401)
+        self.assertFalse(Vote.objects.exists())
+
+    def test_hot_feed(self):
+        # 发帖时间几乎相同，有回复的帖子更热；回复都被踩之后排到没有回复的新帖后面
+        newer = Thread.objects.create(title='新帖', content='内容', author=self.bob)
+        threads = self.client.get('/api/threads/', {'sort': 'hot'}).json()['results']
+        self.assertEqual([t['id'] for t in threads], [self.thread.pk, newer.pk])
+
+        for user in (self.alice, self.bob):
+            for post in self.posts:
+                self.vote(user, post, -1)
+        response_cache.local.clear()
+        data = self.client.get('/api/threads/', {'sort': 'hot', 'page_size': 1}).json()
+        self.assertEqual([t['id'] for t in data['results']], [newer.pk])
+        data = self.client.get('/api/threads/', {'sort': 'hot', 'page_size': 1, 'cursor': data['next_cursor']}).json()
+        self.assertEqual([(t['id'], t['score']) for t in data['results']], [(self.thread.pk, -4)])
+        self.assertIsNone(data['next_cursor'])
+
+        # 按发帖时间列表的游标不能用来翻热门列表
+        cursor = self.client.get('/api/threads/', {'page_size': 1}).json()['next_cursor']
+        self.assertEqual(self.client.get('/api/threads/', {'sort': 'hot', 'cursor': cursor}).status_code, 400)
+
+
+@override_settings(FORUM_AI_EMBEDDED_WORKERS=False, FORUM_RAG_EMBEDDER='local')
+class CategoryFeedTests(TestCase):
+    """分类列表的帖子数与 Thread 表一致，?category= 只返回该分类的帖子并可分页"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = HumanUser.objects.create_user('alice', 'alice@example.com', 'pw')
+        cls.tech, cls.life = Category.objects.create(name='技术'), Category.objects.create(name='生活')
+        cls.tech_threads = [
+            Thread.objects.create(title=f'技术 {i}', content='内容', author=cls.user, category=cls.tech) for i in range(3)
+        ]
+        Thread.objects.create(title='生活', content='内容', author=cls.user, category=cls.life)
+        Thread.objects.create(title='未分类', content='内容', author=cls.user)
+
+    def setUp(self):
+        response_cache.local.clear()
+
+    def counts(self):
+        response_cache.local.clear()
+        return {c['name']: c['thread_count'] for c in self.client.get('/api/categories/').json()}
+
+    def test_create_in_category(self):
+        self.assertEqual(self.counts(), {'技术': 3, '生活': 1})
+        response = self.client.post('/api/create/', {'title': 't', 'content': '内容', 'category': self.life.pk},
+                                    content_type='application/json', headers=_auth(self.user))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Thread.objects.get(pk=response.json()['thread_id']).category_id, self.life.pk)
+        self.assertEqual(self.counts(), {'技术': 3, '生活': 2})
+
+        for category in (0, 'abc', [1]):
+            with self.subTest(category=category):
+                response = self.client.post('/api/create/', {'title': 't', 'content': '内容', 'category': category},
+                                            content_type='application/json', headers=_auth(self.user))
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(Thread.objects.count(), 6)
+
+        Category.objects.update(thread_count=0)
+        Category.refresh_counts()
+        self.assertEqual(self.counts(), {'技术': 3, '生活': 2})
+
+    def test_move_and_delete(self):
+        thread = self.tech_threads[0]
+        thread.category = self.life
+        thread.save()
+        self.assertEqual(self.counts(), {'技术': 2, '生活': 2})
+
+        # 从数据库读出时未读取分类列，同样按库中原分类调整
+        thread = Thread.objects.only('title').get(pk=thread.pk)
+        thread.category_id = None
+        thread.save()
+        self.assertEqual(self.counts(), {'技术': 2, '生活': 1})
+        thread.category = self.tech
+        thread.save(update_fields=['title'])
+        self.assertEqual(self.counts(), {'技术': 2, '生活': 1})
+        thread.save(update_fields=['category'])
+        self.assertEqual(self.counts(), {'技术': 3, '生活': 1})
+
+        thread.delete()
+        self.assertEqual(self.counts(), {'技术': 2, '生活': 1})
+        # queryset.delete() 和删除用户的级联删除不调用 Thread.delete()，靠 post_delete 信号
+        Thread.objects.filter(pk=self.tech_threads[1].pk).delete()
+        self.assertEqual(self.counts(), {'技术': 1, '生活': 1})
+        self.user.delete()
+        self.assertEqual(self.counts(), {'技术': 0, '生活': 0})
+
+    def test_filtered_feed(self):
+        expected = [t.pk for t in self.tech_threads]
+        for sort in ('', 'activity', 'hot'):
+            with self.subTest(sort=sort):
+                data = self.client.get('/api/threads/', {'category': self.tech.pk, 'sort': sort, 'page_size': 2}).json()
+                rows = data['results']
+                data = self.client.get('/api/threads/', {'category': self.tech.pk, 'sort': sort, 'page_size': 2,
+                                                         'cursor': data['next_cursor']}).json()
+                rows += data['results']
+                self.assertEqual(sorted(t['id'] for t in rows), expected)
+                self.assertEqual({t['category'] for t in rows}, {self.tech.pk})
+                self.assertIsNone(data['next_cursor'])
+        self.assertEqual(self.client.get('/api/threads/', {'category': 0}).json()['results'], [])
+        self.assertEqual(self.client.get('/api/threads/', {'category': 'abc'}).status_code, 400)
+        self.assertEqual(len(self.client.get('/api/threads/').json()['results']), 5)
+
+
+@override_settings(FORUM_AI_EMBEDDED_WORKERS=False, FORUM_AI_ADMISSION_ENABLED=True, FORUM_AI_USER_BURST=2, FORUM_AI_USER_REFILL_PER_MINUTE=1,
+                   FORUM_AI_THREAD_BURST=1, FORUM_AI_THREAD_REFILL_PER_MINUTE=1,
+                   FORUM_AI_MAX_PENDING_JOBS=10)
+class AdmissionTests(TestCase):
+    """令牌桶的补充/耗尽计算，以及 admit_generation 的推迟和拒绝（测试在一个事务中，now() 不变）"""
+
+    def rewind(self, key, seconds):
+        RateLimitBucket.objects.filter(key=key).update(updated_at=F('updated_at') - timedelta(seconds=seconds))
+
+    def tokens(self, key):
+        return RateLimitBucket.objects.get(key=key).tokens
+
+    def test_take(self):
+        _take('k', 2, 60)
+        _take('k', 2, 60)
+        self.assertEqual(self.tokens('k'), 0)
+        with self.assertRaises(_Exhausted) as cm:
+            _take('k', 2, 60)
+        self.assertEqual(cm.exception.key, 'k')
+        self.assertAlmostEqual(cm.exception.retry_after, 1)
+        # 令牌不足时不写入
+        self.assertEqual(self.tokens('k'), 0)
+
+        # 每秒补充 1 个：1.5 秒后可取一个，剩 0.5 个，再等 0.5 秒
+        self.rewind('k', 1.5)
+        _take('k', 2, 60)
+        self.assertAlmostEqual(self.tokens('k'), 0.5)
+        with self.assertRaises(_Exhausted) as cm:
+            _take('k', 2, 60)
+        self.assertAlmostEqual(cm.exception.retry_after, 0.5)
+
+        # 补充不超过 burst
+        self.rewind('k', 3600)
+        _take('k', 2, 60)
+        self.assertAlmostEqual(self.tokens('k'), 1)
+
+        # 不补充的桶用完后无法给出等待时间
+        _take('never', 1, 0)
+        with self.assertRaises(_Exhausted) as cm:
+            _take('never', 1, 0)
+        self.assertEqual(cm.exception.retry_after, 0)
+
+    def test_admit(self):
+        admission = admit_generation(1, 10)
+        self.assertEqual((admission.status, admission.as_dict()), (QUEUED, {'status': QUEUED}))
+
+        # 帖子桶不足：推迟到补满一个令牌，用户令牌照常扣减
+        admission = admit_generation(1, 10)
+        self.assertEqual((admission.status, admission.reason), (DEFERRED, 'thread_rate_limited'))
+        self.assertTrue(admission.admitted)
+        self.assertAlmostEqual(admission.retry_after, 60)
+        self.assertEqual(self.tokens('user:1'), 0)
+
+        # 用户桶不足：拒绝，帖子桶不扣减
+        admission = admit_generation(1, 20)
+        self.assertEqual((admission.status, admission.reason), (SKIPPED, 'user_rate_limited'))
+        self.assertFalse(admission.admitted)
+        self.assertAlmostEqual(admission.retry_after, 60)
+        self.assertFalse(RateLimitBucket.objects.filter(key='thread:20').exists())
+        self.assertEqual(admit_generation(2, 20).status, QUEUED)
+
+        self.rewind('user:1', 60)
+        self.assertEqual(admit_generation(1, 20).status, DEFERRED)
+
+        with override_settings(FORUM_AI_MAX_PENDING_JOBS=0):
+            admission = admit_generation(3, 30)
+        self.assertEqual((admission.status, admission.reason), (SKIPPED, 'overloaded'))
+        self.assertFalse(RateLimitBucket.objects.filter(key='user:3').exists())
+
+    def test_reply_response(self):
+        user = HumanUser.objects.create_user('alice', 'alice@example.com', 'pw')
+        thread = Thread.objects.create(title='t', content='内容', author=user)
+        statuses = []
+        for _ in range(3):
+            response = self.client.post(f'/api/threads/{thread.pk}/reply/', {'content': '回复'},
+                                        content_type='application/json', headers=_auth(user))
+            statuses.append(response.json()['ai']['status'])
+            # 第一轮开始运行，后面的回复另排一个任务
+            claim_job('w1')
+        self.assertEqual(statuses, [QUEUED, DEFERRED, SKIPPED])
+        self.assertEqual(Post.objects.filter(thread=thread).count(), 3)
+        job = GenerationJob.objects.get(thread=thread, status=GenerationJob.PENDING)
+        self.assertGreater(job.not_before, job.created_at + timedelta(seconds=59))
+
+
+@override_settings(FORUM_AI_EMBEDDED_WORKERS=False, FORUM_AI_JOB_LEASE_SECONDS=60, FORUM_AI_JOB_MAX_ATTEMPTS=2)
+class JobQueueTests(TestCase):
+    """任务的入队合并、推迟执行、租约续约和过期回收"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = HumanUser.objects.create_user('alice', 'alice@example.com', 'pw')
+        cls.thread = Thread.objects.create(title='t', content='内容', author=cls.user, ai_generating=True)
+
+    def jobs(self, **filters):
+        return list(GenerationJob.objects.filter(thread=self.thread, **filters).order_by('id'))
+
+    def expire(self, job):
+        GenerationJob.objects.filter(pk=job.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_enqueue_merges_pending(self):
+        # 部分唯一索引：每个帖子至多一个 pending 任务，运行中的任务不参与合并
+        enqueue_generation(self.thread.pk)
+        enqueue_generation(self.thread.pk)
+        self.assertEqual(len(self.jobs()), 1)
+        job = claim_job('w1')
+        enqueue_generation(self.thread.pk)
+        enqueue_generation(self.thread.pk, delay=30)
+        self.assertEqual([j.status for j in self.jobs()], [GenerationJob.RUNNING, GenerationJob.PENDING])
+        self.assertIsNone(self.jobs(status=GenerationJob.PENDING)[0].not_before)
+
+        # 同一帖子已有任务在运行时不领取
+        self.assertIsNone(claim_job('w2'))
+        finish_job(job, 'w1')
+        self.assertEqual(claim_job('w2').status, GenerationJob.RUNNING)
+
+    def test_not_before(self):
+        enqueue_generation(self.thread.pk, delay=60)
+        job, = self.jobs()
+        self.assertGreater(job.not_before, timezone.now() + timedelta(seconds=59))
+        self.assertIsNone(claim_job('w1'))
+        GenerationJob.objects.filter(pk=job.pk).update(not_before=timezone.now())
+        self.assertEqual(claim_job('w1').pk, job.pk)
+
+    def test_heartbeat(self):
+        enqueue_generation(self.thread.pk)
+        job = claim_job('w1')
+        self.expire(job)
+        self.assertEqual(renew_leases({'w2': job.pk}), 0)
+        self.assertEqual(renew_leases({'w1': job.pk}), 1)
+        job.refresh_from_db()
+        self.assertGreater(job.lease_expires_at, timezone.now() + timedelta(seconds=59))
+        self.assertEqual(recover_stale_jobs(), (0, 0, 0))
+
+    def test_stale_recovery(self):
+        enqueue_generation(self.thread.pk)
+        job = claim_job('w1')
+        self.expire(job)
+
+        # 租约过期：重新排队，由其他 worker 领取；原 worker 的结果和续约都被忽略
+        self.assertEqual(recover_stale_jobs(), (1, 0, 0))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.lease_owner, job.lease_expires_at), (GenerationJob.PENDING, '', None))
+        job = claim_job('w2')
+        self.assertEqual((job.attempts, job.lease_owner), (2, 'w2'))
+        self.assertEqual(renew_leases({'w1': job.pk}), 0)
+        finish_job(job, 'w1')
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.RUNNING)
+        self.assertTrue(Thread.objects.get(pk=self.thread.pk).ai_generating)
+
+        # 超过重试次数：标记失败并复位帖子的生成状态
+        self.expire(job)
+        self.assertEqual(recover_stale_jobs(), (0, 1, 1))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), (GenerationJob.FAILED, '租约过期'))
+        self.assertFalse(Thread.objects.get(pk=self.thread.pk).ai_generating)
+
+    def test_stale_merges_into_pending(self):
+        # 过期任务的帖子已有新的排队任务时，过期任务标记失败，由排队任务接手
+        enqueue_generation(self.thread.pk)
+        job = claim_job('w1')
+        enqueue_generation(self.thread.pk)
+        self.expire(job)
+        self.assertEqual(recover_stale_jobs(), (0, 1, 0))
+        self.assertEqual([j.status for j in self.jobs()], [GenerationJob.FAILED, GenerationJob.PENDING])
+        self.assertTrue(Thread.objects.get(pk=self.thread.pk).ai_generating)
+
+
+@override_settings(FORUM_AI_EMBEDDED_WORKERS=False, FORUM_RAG_EMBEDDER='local', FORUM_AI_REPLY_MODE='chained',
+                   FORUM_AI_AGENT_MAX_REPLIES=2, FORUM_AI_AGENT_MIN_SIMILARITY=-1)
+class AIGenerationStubTests(TestCase):
+    """用本地模型接口替身（llm_stub.py）跑完整的一轮生成"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server, base_url = start_stub_server(config=StubConfig(first_token_ms=0, tokens_per_second=0))
+        cls._service = ai_service._service
+        ai_service._service = ai_service.AIService(api_key='stub', base_url=base_url)
+
+    @classmethod
+    def tearDownClass(cls):
+        ai_service._service = cls._service
+        cls.server.shutdown()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = HumanUser.objects.create_user('alice', 'alice@example.com', 'pw')
+        for name in ('TechBot', 'HumorBot'):
+            AIAgent.objects.create(username=name, system_prompt=f'你是 {name}')
+        cls.thread = Thread.objects.create(title='缓存', content='如何设计缓存', author=cls.user, ai_generating=True)
+
+    def test_generation_round(self):
+        posted = metrics.AI_REPLIES._values.copy()
+        enqueue_generation(self.thread.pk)
+        job = claim_job('test:w0')
+        run_job(job, 'test:w0')
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.DONE)
+        replies = list(Post.objects.filter(thread=self.thread).select_related('author'))
+        self.assertEqual(len(replies), 2)
+        for post in replies:
+            # 替身的回复以角色名开头，内容由请求确定
+            self.assertTrue(post.content.startswith(f'（{post.author.username}）'))
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.reply_count, 2)
+        self.assertFalse(self.thread.ai_generating)
+        self.assertNotEqual(metrics.AI_REPLIES._values, posted)
+
+    def test_chained_failure_continues(self):
+        # 依次生成时一个角色出错，后面的角色照常回复（与并发模式一致）
+        generate_reply = AIAgent.generate_reply
+
+        def failing(agent, *args, **kwargs):
+            if agent.username == 'TechBot':
+                raise RuntimeError('boom')
+            return generate_reply(agent, *args, **kwargs)
+
+        with mock.patch.object(AIAgent, 'generate_reply', failing):
+            posts = generate_replies(self.thread.pk)
+        self.assertEqual([post.author.username for post in posts], ['HumorBot'])
+
+    @override_settings(FORUM_AI_REPLY_MODE='concurrent', FORUM_AI_ROUND_TIMEOUT=0.3, FORUM_AI_MAX_INFLIGHT_CALLS=4)
+    def test_abandoned_calls_release_slots(self):
+        # 每段文本间隔 0.5 秒、长达一百秒的回复：本轮超时后，调用在下一段文本时停止并归还名额
+        server, base_url = start_stub_server(config=StubConfig(first_token_ms=0, tokens_per_second=20,
+                                                               reply_tokens=2000))
+        service, ai_service._service = ai_service._service, ai_service.AIService(api_key='stub', base_url=base_url)
+        try:
+            self.assertEqual(generate_replies(self.thread.pk), [])
+            deadline = time.monotonic() + 5
+            while inflight_calls() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(inflight_calls(), 0)
+        finally:
+            ai_service._service = service
+            server.shutdown()
+
+
+# 事务真实提交，提交后的回调（向量计算）也会执行，关掉
+@override_settings(FORUM_AI_EMBEDDED_WORKERS=False, FORUM_SEARCH_EMBEDDINGS=False)
+class SettleRaceTests(TransactionTestCase):
+    """一轮生成结束时，不能清掉同时提交的新回复设置的 ai_generating（需要真实的并发事务）"""
+
+    def test_settle_waits_for_reply(self):
+        user = HumanUser.objects.create_user('alice', 'alice@example.com', 'pw')
+        thread = Thread.objects.create(title='标题', content='内容', author=user, ai_generating=True)
+        enqueue_generation(thread.pk)
+        job = claim_job('test:w0')
+
+        def finish():
+            try:
+                finish_job(job, 'test:w0')
+            finally:
+                connection.close()
+
+        # 回帖事务已写入 ai_generating 和新任务但尚未提交时，worker 结束上一轮
+        with transaction.atomic():
+            post = Post.objects.create(thread=thread, author=user, content='回复')
+            Thread.record_post(post, ai_generating=True)
+            enqueue_generation(thread.pk)
+            worker = threading.Thread(target=finish)
+            worker.start()
+            time.sleep(0.3)
+            # 等待帖子行锁
+            self.assertTrue(worker.is_alive())
+        worker.join(5)
+
+        thread.refresh_from_db()
+        self.assertTrue(thread.ai_generating)
+        self.assertEqual(GenerationJob.objects.get(pk=job.pk).status, GenerationJob.DONE)
+        self.assertTrue(GenerationJob.objects.filter(thread=thread, status=GenerationJob.PENDING).exists())
+
+        # 没有其他任务时正常清除
+        finish_job(claim_job('test:w0'), 'test:w0')
+        thread.refresh_from_db()
+        self.assertFalse(thread.ai_generating)
+
+
+class VoteRaceTests(TransactionTestCase):
+    """等待回复行锁的投票，拿到锁后必须读到前一个事务提交的票（需要真实的并发事务）"""
+
+    def test_concurrent_same_vote(self):
+        user = HumanUser.objects.create_user('alice', 'alice@example.com', 'pw')
+        thread = Thread.objects.create(title='标题', content='内容', author=user)
+        post = Post.objects.create(thread=thread, author=user, content='回复')
+        results, errors = [], []
+
+        def vote():
+            try:
+                results.append(Vote.cast(user.pk, post.pk, 1))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        # 两个相同的投票都在等回复的行锁
+        with transaction.atomic():
+            Post.objects.select_for_update().get(pk=post.pk)
+            workers = [threading.Thread(target=vote) for _ in range(2)]
+            for worker in workers:
+                worker.start()
+            time.sleep(0.3)
+            self.assertTrue(all(worker.is_alive() for worker in workers))
+        for worker in workers:
+            worker.join(5)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(results), [(1, 1), (1, 1)])
+        self.assertEqual(Vote.objects.filter(post=post).count(), 1)
+        self.assertEqual(Post.objects.get(pk=post.pk).score, 1)
+        self.assertEqual(Thread.objects.get(pk=thread.pk).score, 1)
+
+
+@override_settings(FORUM_AI_MAX_INFLIGHT_CALLS=4)
+class SlotReleaseTests(TransactionTestCase):
+    """名额（会话级 advisory lock）释放失败时关闭连接，不能让持锁的连接回到连接池"""
+
+    def test_release_on_aborted_transaction(self):
+        errors = admission_stats()['llm_slot_release_errors']
+        with self.assertLogs('forum_app.admission', 'WARNING'):
+            with llm_slot():
+                self.assertEqual(inflight_calls(), 1)
+                raw = connection.connection
+                # 在底层连接上留下一个已中止的事务，解锁语句随之失败
+                with raw.cursor() as cursor:
+                    cursor.execute('BEGIN')
+                    with self.assertRaises(Exception):
+                        cursor.execute('SELECT 1 / 0')
+        self.assertTrue(raw.closed)
+        self.assertEqual(admission_stats()['llm_slot_release_errors'], errors + 1)
+        connection.close()
+        self.assertEqual(inflight_calls(), 0)
@@ -0,0 +1,358 @@
+"""
+帖子/回复内容的写入时处理
+
+内容可能是 Markdown（当前编辑器），也可能是旧版富文本编辑器留下的 HTML。
+保存时计算一次，读取和拼接提示词时直接使用结果：
+- sanitize_html()  去掉脚本、事件属性、javascript: 链接等，保留 Markdown 原文和白名单内的标签
+- html_to_text()   纯文本，用于 AI 提示词和搜索
+- make_preview()   列表页的纯文本预览
+- search_tokens()  全文检索用的分词结果（中文默认按单字 + 二元组切分，安装了 jieba 时使用 jieba）
+"""
+import html
+import re
+from html.parser import HTMLParser
+
+try:
+    import jieba
+except ImportError:  # 可选依赖
+    jieba = None
+
+PREVIEW_LENGTH = 100
+RENDERED_FIELDS = ('safe_content', 'plain_text', 'content_preview')
+
+_TAG_RE = re.compile(r'<!--.*?-->|</?[a-zA-Z][^>]*>', re.DOTALL)
+_BLOCK_TAG_RE = re.compile(r'</?(p|div|br|li|h[1-6]|blockquote|pre|tr)\b[^>]*>', re.IGNORECASE)
+_SPACE_RE = re.compile(r'[ \t\r\f\v]+')
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Markdown 代码块（``` / ~~~ 围栏）和行内代码，识别规则见 _code_spans
+_FENCE_OPEN_RE = re.compile(r'^ {0,3}(`{3,}(?=[^`\n]*$)|~{3,})', re.MULTILINE)
+_BACKTICKS_RE = re.compile(r'`+')
+_BLANK_LINE_RE = re.compile(r'\n[ \t]*\n')
+# 文本中没有构成完整标签的 "<字母"、"</"、"<!"、"<?"（如内容末尾未闭合的标签），
+# 与后面的内容拼接后可能被浏览器当作标签，一律转义
+_TAG_OPENER_RE = re.compile(r'<(?=[a-zA-Z/!?])')
+
+_CJK_CHARS = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_CJK_RE = re.compile(f'[{_CJK_CHARS}]')
+_SEARCH_TOKEN_RE = re.compile(f'[{_CJK_CHARS}]+|[^\\W_{_CJK_CHARS}]+')
+# 太长的“单词”（base64、哈希等）对检索没有意义
+MAX_TOKEN_LENGTH = 64
+# Postgres tsvector 的限制：位置最大 16383，每个词最多记录 256 个位置
+MAX_TSVECTOR_POSITION = 16383
+MAX_TSVECTOR_POSITIONS = 256
+
+_MD_IMAGE_RE = re.compile(r'!\[([^\]]*)\]\([^)]*\)')
+_MD_LINK_RE = re.compile(r'\[([^\]]+)\]\([^)]*\)')
+_MD_MARKUP_RE = re.compile(r'^\s{0,3}(#{1,6}\s+|>\s?|[-*+]\s+|\d+\.\s+)|\*\*|__|~~|`+', re.MULTILINE)
+
+ALLOWED_TAGS = {
+    'a', 'abbr', 'b', 'blockquote', 'br', 'code', 'del', 'details', 'div', 'em', 'h1', 'h2', 'h3',
+    'h4', 'h5', 'h6', 'hr', 'i', 'img', 'ins', 'kbd', 'li', 'mark', 'ol', 'p', 'pre', 's', 'span',
+    'strong', 'sub', 'summary', 'sup', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'u', 'ul',
+}
+# 这些标签连同内容一起丢弃
+DROP_CONTENT_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'noscript', 'template', 'svg', 'math'}
+VOID_TAGS = {'br', 'hr', 'img'}
+ALLOWED_ATTRS = {
+    '*': {'class', 'title'},
+    'a': {'href'},
+    'img': {'src', 'alt', 'width', 'height'},
+    'td': {'colspan', 'rowspan', 'align'},
+    'th': {'colspan', 'rowspan', 'align'},
+    'ol': {'start'},
+}
+URL_ATTRS = {'href', 'src'}
+ALLOWED_SCHEMES = {'http', 'https', 'mailto'}
+
+
+def _inline_code_spans(text, offset):
+    """
+    行内代码：开头的反引号串与之后第一个等长的反引号串之间（CommonMark 规则）
+    被反斜杠转义的反引号不能作为开头；行内代码不跨越空行（段落）
+    """
+    position = 0
+    while True:
+        match = _BACKTICKS_RE.search(text, position)
+        if match is None:
+            return
+        start, run = match.start(), match.group(0)
+        backslashes = len(text[:start]) - len(text[:start].rstrip('\\'))
+        if backslashes % 2:
+            # 第一个反引号被转义，剩下的反引号串重新参与匹配
+            start, run = start + 1, run[1:]
+            if not run:
+                position = match.end()
+                continue
+        end = start + len(run)
+        closing = None
+        for candidate in _BACKTICKS_RE.finditer(text, end):
+            if _BLANK_LINE_RE.search(text, end, candidate.start()):
+                break
+            if len(candidate.group(0)) == len(run):
+                closing = candidate
+                break
+        if closing is None:
+            # 没有等长的结束串，开头的反引号只是普通字符
+            position = end
+            continue
+        yield offset + start, offset + closing.end()
+        position = closing.end()
+
+
+def _code_spans(content):
+    """
+    按 CommonMark 的规则找出代码块和行内代码，返回 [(start, end), ...]
+
+    围栏以行首（最多 3 个空格缩进）的 3 个以上 ` 或 ~ 开始，到同一字符、不短于开头的围栏行结束，
+    没有结束围栏时一直到内容末尾；更长的围栏内可以包含较短的围栏。
+    列表、引用等容器中的围栏不做识别，其中的内容按普通文本处理（只会更严格）。
+    """
+    spans = []
+    position = 0
+    while True:
+        fence = _FENCE_OPEN_RE.search(content, position)
+        text_end = fence.start() if fence else len(content)
+        spans.extend(_inline_code_spans(content[position:text_end], position))
+        if fence is None:
+            return spans
+        marker = fence.group(1)
+        closing = re.compile(rf'^ {{0,3}}{re.escape(marker[0])}{{{len(marker)},}}[ \t]*$', re.MULTILINE)
+        line_end = content.find('\n', fence.end())
+        match = closing.search(content, line_end) if line_end != -1 else None
+        end = match.end() if match else len(content)
+        spans.append((fence.start(), end))
+        position = end
+
+
+def _outside_code(content, func, code_func=None):
+    """对代码块/行内代码以外的部分应用 func，代码部分应用 code_func（默认原样保留）"""
+    pieces = []
+    last = 0
+    for start, end in _code_spans(content):
+        pieces.append(func(content[last:start]))
+        code = content[start:end]
+        pieces.append(code_func(code) if code_func else code)
+        last = end
+    pieces.append(func(content[last:]))
+    return ''.join(pieces)
+
+
+def _strip_tags(fragment):
+    text = _BLOCK_TAG_RE.sub('\n', fragment)
+    return html.unescape(_TAG_RE.sub('', text))
+
+
+def html_to_text(content):
+    """把富文本内容转为适合放进提示词的纯文本"""
+    text = _outside_code(content or '', _strip_tags)
+    text = _SPACE_RE.sub(' ', text)
+    return _BLANK_LINES_RE.sub('\n\n', text).strip()
+
+
+def make_preview(plain_text, length=PREVIEW_LENGTH):
+    """单行纯文本预览：去掉常见 Markdown 标记并压缩空白"""
+    text = _MD_IMAGE_RE.sub(r'\1', plain_text)
+    text = _MD_LINK_RE.sub(r'\1', text)
+    text = _MD_MARKUP_RE.sub('', text)
+    return _WHITESPACE_RE.sub(' ', text).strip()[:length]
+
+
+def search_tokens(text, for_query=False):
+    """
+    把文本切成检索词（已转小写、不含空串）
+
+    中文没有空格分词：索引时存单字和相邻二字组，查询时只用二字组（单字查询除外），
+    这样“数据库”会被匹配为 “数据” & “据库”。
+    """
+    tokens = []
+    for match in _SEARCH_TOKEN_RE.finditer((text or '').lower()):
+        run = match.group(0)
+        if not _CJK_RE.match(run):
+            if len(run) <= MAX_TOKEN_LENGTH:
+                tokens.append(run)
+        elif jieba is not None:
+            words = jieba.cut(run) if for_query else jieba.cut_for_search(run)
+            tokens.extend(w for w in words if w.strip())
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+            tokens.extend(bigrams if for_query else [*run, *bigrams])
+    return tokens
+
+
+def _tsvector_lexeme(token):
+    return "'" + token.replace('\\', '\\\\').replace("'", "''") + "'"
+
+
+def search_vector_literal(weighted_texts):
+    """
+    [(text, 'A'|'B'|'C'|'D'), ...] -> tsvector 的文本形式（带位置和权重），无检索词时返回 None
+
+    分词在 Python 中完成，数据库只做 ::tsvector 转换，不依赖中文分词扩展。
+    """
+    positions = {}
+    position = 0
+    for text, weight in weighted_texts:
+        for token in search_tokens(text):
+            position = min(position + 1, MAX_TSVECTOR_POSITION)
+            entry = positions.setdefault(token, [])
+            if len(entry) < MAX_TSVECTOR_POSITIONS:
+                entry.append(f'{position}{weight}')
+    if not positions:
+        return None
+    return ' '.join(f"{_tsvector_lexeme(token)}:{','.join(entry)}" for token, entry in positions.items())
+
+
+def _safe_url(value):
+    url = html.unescape(value).strip()
+    # 去掉控制字符和空白，防止 "java\tscript:" 之类的绕过
+    compact = re.sub(r'[\x00-\x20]+', '', url).lower()
+    scheme = compact.split(':', 1)[0] if ':' in compact.split('/', 1)[0] else None
+    return scheme is None or scheme in ALLOWED_SCHEMES
+
+
+class _Sanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.out = []
+        self._text = []  # 两个标签之间的文本，HTMLParser 会把它分成多段交给 handle_data
+        self._dropping = []  # 正在丢弃内容的标签栈
+
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, attrs, self_closing=False)
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag, attrs, self_closing=True)
+
+    def _start(self, tag, attrs, self_closing):
+        if self._dropping:
+            if tag == self._dropping[-1] and not self_closing:
+                self._dropping.append(tag)
+            return
+        if tag in DROP_CONTENT_TAGS:
+            if not self_closing:
+                self._dropping.append(tag)
+            return
+        if tag not in ALLOWED_TAGS:
+            return
+        allowed = ALLOWED_ATTRS['*'] | ALLOWED_ATTRS.get(tag, set())
+        parts = [tag]
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRS and not _safe_url(value):
+                continue
+            parts.append(f'{name}="{html.escape(html.unescape(value), quote=True)}"')
+        closing = ' /' if self_closing or tag in VOID_TAGS else ''
+        self._tag(f"<{' '.join(parts)}{closing}>")
+
+    def handle_endtag(self, tag):
+        if self._dropping:
+            if tag == self._dropping[-1]:
+                self._dropping.pop()
+            return
+        if tag in ALLOWED_TAGS and tag not in VOID_TAGS:
+            self._tag(f'</{tag}>')
+
+    def handle_data(self, data):
+        if not self._dropping:
+            self._text.append(data)
+
+    def handle_entityref(self, name):
+        if not self._dropping:
+            self._text.append(f'&{name};')
+
+    def handle_charref(self, name):
+        if not self._dropping:
+            self._text.append(f'&#{name};')
+
+    def handle_comment(self, data):
+        pass
+
+    def handle_decl(self, decl):
+        pass
+
+    def handle_pi(self, data):
+        pass
+
+    def unknown_decl(self, data):
+        pass
+
+    def result(self):
+        self.close()
+        self._flush_text()
+        return ''.join(self.out)
+
+    def _tag(self, markup):
+        self._flush_text()
+        self.out.append(markup)
+
+    def _flush_text(self):
+        # 非标签文本原样保留（Markdown 语法、"a < b" 等），只转义可能与后文拼成标签的 "<"
+        if self._text:
+            self.out.append(_TAG_OPENER_RE.sub('&lt;', ''.join(self._text)))
+            self._text = []
+
+
+def _sanitize_fragment(fragment):
+    if '<' not in fragment:
+        return fragment
+    parser = _Sanitizer()
+    parser.feed(fragment)
+    return parser.result()
+
+
+def _sanitize_code(code):
+    """
+    代码块/行内代码：清理后不变（没有不允许的标签、属性，也没有未闭合的标签）时原样保留；
+    否则转义其中所有的 "<"。
+
+    前端渲染器对代码范围的判断可能与 _code_spans 不同，这里保证即使代码部分被当作 HTML 解析也是安全的，
+    代价是含有危险标签的代码会显示为 &lt;。
+    """
+    if _sanitize_fragment(code) == code:
+        return code
+    return code.replace('<', '&lt;')
+
+
+def sanitize_html(content):
+    """按白名单清理内容中的 HTML；代码块内的文本尽量原样保留（见 _sanitize_code）"""
+    return _outside_code(content or '', _sanitize_fragment, _sanitize_code)
+
+
+def render_content(content):
+    """返回 (safe_content, plain_text, content_preview)"""
+    safe_content = sanitize_html(content)
+    # 纯文本基于清理后的内容，脚本等被丢弃的内容不会进入提示词
+    plain_text = html_to_text(safe_content)
+    return safe_content, plain_text, make_preview(plain_text)
+
+
+def rerender_queryset(queryset, batch_size=500):
+    """按 id 分批重新计算已有行的处理结果，每批一次 bulk_update，逐批 yield 已处理的行数"""
+    model = queryset.model
+    # 迁移中的历史模型没有自定义方法，只计算 RENDERED_FIELDS
+    source_fields = getattr(model, 'render_source_fields', ('content',))
+    fields = getattr(model, 'rendered_fields', RENDERED_FIELDS)
+    last_id, total = 0, 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id).order_by('id').only('id', 'plain_text', *source_fields)[:batch_size])
+        if not batch:
+            return
+        changed = []
+        for obj in batch:
+            if hasattr(obj, 'render_content'):
+                if obj.render_content():
+                    changed.append(obj.id)
+            else:
+                obj.safe_content, obj.plain_text, obj.content_preview = render_content(obj.content)
+        model.objects.bulk_update(batch, fields)
+        if changed:
+            # 纯文本变了的行清空向量，由后台重新计算
+            model.objects.filter(id__in=changed).update(embedding=None)
+        last_id = batch[-1].id
+        total += len(batch)
+        yield total
@@ -3,13 +3,23 @@ from . import views
 
 urlpatterns = [
     path('threads/', views.api_get_threads),
+    path('categories/', views.api_get_categories),
     path('threads/<int:thread_id>/', views.api_get_single_thread),
+    path('threads/<int:thread_id>/posts/', views.api_get_thread_updates),
+    path('threads/<int:thread_id>/events/', views.api_thread_events),
     path('threads/<int:thread_id>/reply/', views.api_reply_thread),
+    path('posts/<int:post_id>/vote/', views.api_vote),
     path('create/', views.api_create_thread),
+    path('search/', views.api_search),
+    path('ai/queue/', views.api_ai_queue_stats),
+    path('db/stats/', views.api_db_stats),
+    path('cache/stats/', views.api_cache_stats),
+    path('metrics/', views.api_metrics),
     
     # 认证相关
     path('register/', views.api_register),
     path('login/', views.api_login),
     path('user/me/', views.api_current_user),
     path('user/avatar/', views.api_upload_avatar),
+    path('avatars/<int:actor_id>/', views.api_get_avatar),
 ]
\ No newline at end of file
@@ -0,0 +1,17 @@
+"""
+ASGI 部署时 /api/ 的路由（见 asgi.py 的 APIHandler）：高频轮询的读接口换成异步视图、SSE 事件流只在这里提供，
+其余沿用 urls.py
+"""
+from django.urls import path
+
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('threads/', async_views.api_get_threads),
+    path('threads/<int:thread_id>/', async_views.api_get_single_thread),
+    path('threads/<int:thread_id>/events/', async_views.api_thread_events),
+    path('user/me/', async_views.api_current_user),
+    # 先匹配到的路由生效，上面的异步视图优先于 urls.py 中的同名同步视图
+    *sync_urlpatterns,
+]
@@ -1,93 +1,190 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
 from django.contrib.auth.hashers import check_password
-from django.db.models import Count
-from .models import Thread, HumanUser, AIAgent, Post
-from .serializers import ThreadSerializer, ThreadListSerializer
-import random
-import time
-import re
-import threading
-import base64
-import io
-from PIL import Image
-
-def strip_html_tags(text):
-    clean = re.compile('<.*?>')
-    return re.sub(clean, '', text).strip()
-
-def trigger_ai_reply_task(thread_id):
-    def generate_replies():
-        try:
-            thread = Thread.objects.select_related('author').get(id=thread_id)
-            
-            all_agents = list(AIAgent.objects.all())
-            if not all_agents:
-                thread.ai_generating = False
-                thread.save(update_fields=['ai_generating'])
-                return
-
-            conversation_history = f"【楼主】{thread.author.username}: {thread.content}\n"
-            
-            recent_posts = thread.posts.select_related('author').order_by('created_at')[:20]
-            
-            for post in recent_posts:
-                conversation_history += f"{post.author.username}: {post.content}\n"
-
-            num_to_reply = random.randint(3, 5)
-            selected_agents = random.sample(all_agents, min(num_to_reply, len(all_agents)))
-
-            print(f"🤖 [AI] 读取了 {len(recent_posts)+1} 条历史消息，正在思考...")
-
-            for agent in selected_agents:
-                reply_text = agent.generate_reply(full_conversation_context=conversation_history)
-                
-                # 创建并立即保存每个 Post
-                Post.objects.create(
-                    thread=thread,
-                    author=agent.actor_ptr,
-                    content=reply_text
-                )
-                
-                conversation_history += f"{agent.username}: {reply_text}\n"
-                
-                time.sleep(random.randint(1, 3))
-            
-            thread.ai_generating = False
-            thread.save(update_fields=['ai_generating'])
-            print("✅ AI回复生成完成")
-
-        except Thread.DoesNotExist:
-            print(f"💥 Thread {thread_id} 不存在")
-        except Exception as e:
-            print(f"💥 AI 任务出错: {e}")
-            try:
-                Thread.objects.filter(id=thread_id).update(ai_generating=False)
-            except:
-                pass
-    
-    thread = threading.Thread(target=generate_replies, daemon=True)
-    thread.start()
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.db import transaction
+from django.views.decorators.http import require_GET
+from .models import Category, Thread, HumanUser, Post, AvatarImage, Vote
+from .serializers import (
+    POST_VALUES, THREAD_LIST_VALUES, THREAD_VALUES, CategorySerializer, absolute_avatar_url, serialize_posts,
+    serialize_thread, serialize_thread_list,
+)
+from .pagination import get_page_size, keyset_paginate, InvalidCursor
+from .text import html_to_text, make_preview, sanitize_html
+from .jobs import enqueue_generation, queue_stats
+from .agents import registry as agent_registry
+from .admission import admission_stats, admit_generation
+from .response_cache import response_cache
+from .avatars import CONTENT_TYPE as AVATAR_CONTENT_TYPE, AvatarBusy, AvatarError, process_avatar, read_upload
+from .search import hydrate, search
+from .db import db_stats
+from .authentication import authenticate
+from . import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 帖子列表的 ?sort= 取值 -> 排序字段（均与 id 建有联合索引），默认按发帖时间
+THREAD_SORT_FIELDS = {'activity': 'last_post_at', 'hot': 'hot_rank'}
+
+def _parse_category(value):
+    """?category= / 发帖时的 category：返回分类 id，未指定时为 None，不是整数时抛 ValueError"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise ValueError(value)
+    return int(value)
+
+def _cache_key(request, prefix, version):
+    # 头像地址按请求的 host 补全，不同 host 分开缓存
+    query = request.GET.urlencode()
+    return f"forum:resp:{prefix}:v{version}:{request.get_host()}:{query}"
 
 @api_view(['GET'])
 def api_get_threads(request):
-    threads = Thread.objects.select_related('author').annotate(post_count=Count('posts')).order_by('-created_at')
-    serializer = ThreadListSerializer(threads, many=True)
-    return Response(serializer.data)
+    # 回复数、最后活动、得分都是 Thread 上的冗余字段，列表页不再聚合 Post 表
+    # ?sort=activity 按最后回复时间排序，?sort=hot 按热度排序（投票、回复时已算好），默认按发帖时间
+    # ?category=<id> 只看一个分类，走 (category, 排序字段, id) 索引
+    field = THREAD_SORT_FIELDS.get(request.query_params.get('sort'), 'created_at')
+    try:
+        category = _parse_category(request.query_params.get('category'))
+    except ValueError:
+        return Response({"error": "无效的分类"}, status=400)
+
+    def build():
+        # .values() + serialize_thread_list：与 ThreadListSerializer 输出相同，不构造模型实例
+        threads = Thread.objects.values(*THREAD_LIST_VALUES)
+        if category is not None:
+            threads = threads.filter(category_id=category)
+        rows, next_cursor, prev_cursor = keyset_paginate(threads, request, field=field)
+        return {
+            "results": serialize_thread_list(rows, request),
+            "next_cursor": next_cursor,
+            "prev_cursor": prev_cursor,
+        }
+
+    key = _cache_key(request, 'threads', response_cache.list_version())
+    try:
+        data = response_cache.get_or_build(key, build, settings.FORUM_RESPONSE_CACHE_LIST_TTL)
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=400)
+    return Response(data)
+
+@api_view(['GET'])
+def api_get_categories(request):
+    # 帖子数是 Category 上的冗余字段；发帖会递增列表版本号，缓存随之失效
+    def build():
+        return CategorySerializer(Category.objects.order_by('id'), many=True).data
+
+    key = _cache_key(request, 'categories', response_cache.list_version())
+    return Response(response_cache.get_or_build(key, build, settings.FORUM_RESPONSE_CACHE_LIST_TTL))
 
 @api_view(['GET'])
 def api_get_single_thread(request, thread_id):
+    # 用一次主键查询拿到版本号，版本号不变时直接返回缓存
+    version = Thread.objects.filter(id=thread_id).values_list('version', flat=True).first()
+    if version is None:
+        return Response({"error": "帖子不存在"}, status=404)
+
+    def build():
+        # 楼主内容 + 一页回复：默认最新的一页，?cursor= 向前翻，?cursor=&direction=prev 向后翻
+        thread = Thread.objects.filter(id=thread_id).values(*THREAD_VALUES).first()
+        if thread is None:
+            raise Thread.DoesNotExist
+        # author__aiagent：is_ai 随同一次查询取出
+        posts = Post.objects.filter(thread_id=thread_id).values(*POST_VALUES)
+        page_size = get_page_size(request, default=settings.FORUM_THREAD_POSTS_PAGE_SIZE)
+        rows, older_cursor, newer_cursor = keyset_paginate(posts, request, page_size=page_size)
+        data = serialize_thread(thread, request)
+        # 分页按时间倒序取，展示时按时间正序
+        data["posts"] = serialize_posts(rows[::-1], request)
+        data["posts_older_cursor"] = older_cursor
+        data["posts_newer_cursor"] = newer_cursor
+        return data
+
+    key = _cache_key(request, f'thread:{thread_id}', version)
     try:
-        thread = Thread.objects.select_related('author').prefetch_related(
-            'posts__author'
-        ).get(id=thread_id)
-        serializer = ThreadSerializer(thread)
-        return Response(serializer.data)
+        data = response_cache.get_or_build(key, build, settings.FORUM_RESPONSE_CACHE_DETAIL_TTL)
     except Thread.DoesNotExist:
         return Response({"error": "帖子不存在"}, status=404)
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=400)
+    return Response(data)
+
+@api_view(['GET'])
+def api_get_thread_updates(request, thread_id):
+    """增量轮询：只返回 after 之后的新回复和 AI 生成状态，版本未变时返回 304"""
+    try:
+        after = int(request.query_params.get('after', 0))
+    except ValueError:
+        return Response({"error": "after 参数无效"}, status=400)
+
+    # 只读 Thread 的一行，未变化时不触碰 Post 表
+    state = Thread.objects.filter(pk=thread_id).values('version', 'ai_generating').first()
+    if state is None:
+        return Response({"error": "帖子不存在"}, status=404)
+
+    etag = f'W/"{thread_id}-{state["version"]}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        posts = Post.objects.filter(thread_id=thread_id, id__gt=after).order_by('id').values(*POST_VALUES)
+        response = Response({
+            "posts": serialize_posts(posts, request),
+            "ai_generating": state['ai_generating'],
+            "version": state['version'],
+            "pacing_ms": settings.FORUM_AI_DISPLAY_PACING_MS,
+        })
+    response['ETag'] = etag
+    # 允许缓存，但每次都要带 If-None-Match 回源校验
+    patch_cache_control(response, no_cache=True)
+    return response
+
+@api_view(['GET'])
+def api_search(request):
+    """
+    搜索帖子和回复：?q=关键词&type=all|thread|post&page=1&page_size=20
+    全文检索与语义检索的结果按 RRF 融合排序，只在前 FORUM_SEARCH_CANDIDATES 条内分页
+    """
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({"error": "请输入搜索关键词"}, status=400)
+    search_type = request.query_params.get('type', 'all')
+    if search_type not in ('all', 'thread', 'post'):
+        return Response({"error": "type 参数无效"}, status=400)
+    try:
+        page = max(1, int(request.query_params.get('page', 1)))
+    except ValueError:
+        return Response({"error": "page 参数无效"}, status=400)
+    page_size = get_page_size(request)
+
+    types = ('thread', 'post') if search_type == 'all' else (search_type,)
+    hits = search(query[:200], types)
+    start = (page - 1) * page_size
+    return Response({
+        "results": hydrate(hits[start:start + page_size]),
+        "page": page,
+        "page_size": page_size,
+        "total": len(hits),
+        "has_more": start + page_size < len(hits),
+    })
+
+# ==================== 实时事件 (SSE) ====================
+
+@require_GET
+def api_thread_events(request, thread_id):
+    """
+    WSGI 部署下的 SSE 接口：不提供事件流，返回 204
+
+    WSGI 会在一个线程里把异步的事件流读到结束，而事件流永不结束，每个打开的页面都会占住一个线程。
+    EventSource 收到 204 后不再重连，前端退回增量轮询。事件流见 async_views.api_thread_events（ASGI 部署）。
+    """
+    return HttpResponse(status=204)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -98,22 +195,35 @@ def api_create_thread(request):
     user = request.user
     
     if not title or not title.strip():
-        plain_text = strip_html_tags(content)
-        title = plain_text[:50] if len(plain_text) > 50 else plain_text
+        title = make_preview(html_to_text(sanitize_html(content or '')), 50)
         if not title:
             title = "无标题"
+
+    try:
+        category = _parse_category(data.get('category'))
+    except (TypeError, ValueError):
+        return Response({"error": "无效的分类"}, status=400)
+    if category is not None and not Category.objects.filter(pk=category).exists():
+        return Response({"error": "分类不存在"}, status=400)
     
+    # 帖子总会保存；超出限额时本次不触发 AI（见 admission.py）
+    admission = admit_generation(user.pk)
     new_thread = Thread.objects.create(
         title=title,
         content=content,
         author=user.actor_ptr,
-        ai_generating=True
+        category_id=category,
+        ai_generating=admission.admitted
     )
-    
-    print("🤖 开始生成AI回复，用户等待中...")
-    trigger_ai_reply_task(new_thread.id)
 
-    return Response({"message": "发布成功！", "thread_id": new_thread.id})
+    log_fields = {'thread_id': new_thread.id, 'user_id': user.pk}
+    if admission.admitted:
+        logger.info("🤖 新帖已发布，AI 回复已排队", extra={**log_fields, 'delay': admission.retry_after})
+        enqueue_generation(new_thread.id, delay=admission.retry_after)
+    else:
+        logger.info(f"🚦 AI 生成被限流（{admission.reason}），不触发 AI", extra=log_fields)
+
+    return Response({"message": "发布成功！", "thread_id": new_thread.id, "ai": admission.as_dict()})
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -128,19 +238,109 @@ def api_reply_thread(request, thread_id):
     if not content or not content.strip():
         return Response({"error": "内容不能为空"}, status=400)
     
-    Post.objects.create(
-        thread=thread,
-        content=content,
-        author=request.user.actor_ptr
-    )
+    # 回复总会保存；超出用户限额时不触发 AI，超出帖子限额时推迟到有令牌时再生成
+    admission = admit_generation(request.user.pk, thread.id)
+    with transaction.atomic():
+        post = Post.objects.create(
+            thread=thread,
+            content=content,
+            author=request.user.actor_ptr
+        )
+        if admission.admitted:
+            # ai_generating 与任务一起提交，结束上一轮的 worker 不会在两者之间把标记清掉（见 jobs._settle_thread）
+            Thread.record_post(post, ai_generating=True)
+            enqueue_generation(thread.id, delay=admission.retry_after)
+        else:
+            Thread.record_post(post)
 
-    thread.ai_generating = True
-    thread.save(update_fields=['ai_generating'])
+    log_fields = {'thread_id': thread.id, 'post_id': post.id, 'user_id': request.user.pk}
+    if admission.admitted:
+        logger.info("🤖 新回复已发布，AI 回复已排队", extra={**log_fields, 'delay': admission.retry_after})
+    else:
+        logger.info(f"🚦 AI 生成被限流（{admission.reason}），不触发 AI", extra=log_fields)
 
-    print("🤖 开始生成AI回复（后台异步）...")
-    trigger_ai_reply_task(thread.id)
+    return Response({"message": "回复成功", "ai": admission.as_dict()})
 
-    return Response({"message": "回复成功"})
+@api_view(['POST', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def api_vote(request, post_id):
+    """给回复投票：POST {"direction": 1 | -1}，重复投同一方向不变，投相反方向即改票；DELETE 撤销"""
+    if request.method == 'DELETE':
+        direction = 0
+    else:
+        try:
+            direction = int(request.data.get('direction'))
+        except (TypeError, ValueError):
+            direction = None
+        if direction not in (1, -1):
+            return Response({"error": "direction 只能是 1 或 -1"}, status=400)
+    try:
+        score, direction = Vote.cast(request.user.pk, post_id, direction)
+    except Post.DoesNotExist:
+        return Response({"error": "回复不存在"}, status=404)
+    return Response({"post_id": post_id, "score": score, "direction": direction})
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def api_get_avatar(request, actor_id):
+    """返回头像图片的原始字节，带内容哈希 ETag 和长期缓存头；?size= 取不小于该边长的最小尺寸"""
+    avatars = AvatarImage.objects.filter(actor_id=actor_id).only('size', 'content_hash', 'content_type')
+    try:
+        size = int(request.query_params.get('size', 0))
+    except ValueError:
+        size = 0
+    avatar = avatars.filter(size__gte=size).order_by('size').first() if size else None
+    if avatar is None:
+        avatar = avatars.order_by('-size').first()
+    if avatar is None:
+        return Response({"error": "头像不存在"}, status=404)
+
+    etag = f'"{avatar.content_hash}-{avatar.size}"'
+    # 地址中的版本号与当前内容一致时，内容永远不会变，可以让浏览器/CDN 永久缓存
+    versioned = request.query_params.get('v') == avatar.content_hash[:16]
+
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        data = AvatarImage.objects.filter(pk=avatar.pk).values_list('data', flat=True).first()
+        response = HttpResponse(bytes(data), content_type=avatar.content_type)
+    response['ETag'] = etag
+    if versioned:
+        patch_cache_control(response, public=True, max_age=31536000, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=300)
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def api_ai_queue_stats(request):
+    """AI 生成队列的深度和排队等待时间，以及本进程的角色选择、准入控制统计"""
+    return Response({
+        **queue_stats(),
+        "agent_selection": agent_registry.stats(),
+        "admission": admission_stats(),
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def api_db_stats(request):
+    """本进程的数据库连接池占用/等待情况，以及服务端连接数"""
+    return Response(db_stats())
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def api_cache_stats(request):
+    """响应缓存的命中/未命中计数"""
+    return Response(response_cache.stats())
+
+@require_GET
+def api_metrics(request):
+    """Prometheus 文本格式的指标（见 metrics.py）；不经过 DRF，抓取端用 FORUM_METRICS_TOKEN 认证，管理员可用 JWT 访问"""
+    if not metrics.authorized(request.headers.get('Authorization')):
+        user = authenticate(request)
+        if user is None or not user.is_staff:
+            return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer realm="metrics"'})
+    return HttpResponse(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
 
 # ==================== 认证相关 API ====================
 
@@ -176,7 +376,7 @@ def api_register(request):
         "user": {
             "username": user.username,
             "email": user.email,
-            "avatar": user.avatar
+            "avatar": absolute_avatar_url(request, user.avatar)
         }
     }, status=status.HTTP_201_CREATED)
 
@@ -211,7 +411,7 @@ def api_login(request):
             "id": user.id,
             "username": user.username,
             "email": user.email,
-            "avatar": user.avatar
+            "avatar": absolute_avatar_url(request, user.avatar)
         }
     })
 
@@ -225,7 +425,7 @@ def api_current_user(request):
             "id": user.id,
             "username": user.username,
             "email": user.email,
-            "avatar": user.avatar
+            "avatar": absolute_avatar_url(request, user.avatar)
         })
     except Exception as e:
         return Response({"error": "Token无效或已过期"}, status=status.HTTP_401_UNAUTHORIZED)
@@ -233,59 +433,39 @@ def api_current_user(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def api_upload_avatar(request):
-    """上传头像（压缩并存储为 Base64）"""
+    """
+    上传头像（multipart 的 avatar 文件，或 JSON 中 base64 的 avatar 字段）
+    在进程池中生成各尺寸后以二进制存储，通过 /api/avatars/<id>/?size= 访问
+    """
     user = request.user
-    print(f"✅ 用户认证成功: {user.username}")
-    
-    # 获取上传的 base64 图片数据
-    avatar_base64 = request.data.get('avatar')
-    
-    if not avatar_base64:
-        return Response({"error": "请提供头像数据"}, status=status.HTTP_400_BAD_REQUEST)
-    
+
     try:
-        # 移除 data:image/xxx;base64, 前缀（如果有）
-        if ',' in avatar_base64:
-            avatar_base64 = avatar_base64.split(',', 1)[1]
-        
-        # 解码 base64
-        image_data = base64.b64decode(avatar_base64)
-        image = Image.open(io.BytesIO(image_data))
-        
-        # 转换为 RGB（处理 PNG 透明度）
-        if image.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            if image.mode == 'P':
-                image = image.convert('RGBA')
-            background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-            image = background
-        elif image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # 压缩：限制最大尺寸为 200x200
-        image.thumbnail((200, 200), Image.Resampling.LANCZOS)
-        
-        # 转换为 JPEG 并压缩
-        buffer = io.BytesIO()
-        image.save(buffer, format='JPEG', quality=85, optimize=True)
-        compressed_data = buffer.getvalue()
-        
-        # 转换为 base64
-        compressed_base64 = base64.b64encode(compressed_data).decode('utf-8')
-        avatar_data_url = f"data:image/jpeg;base64,{compressed_base64}"
-        
-        # 保存到数据库
-        user.avatar_data = avatar_data_url
-        user.save()
-        
-        # 计算压缩后的大小
-        size_kb = len(compressed_data) / 1024
-        
-        return Response({
-            "message": "头像上传成功",
-            "avatar": avatar_data_url,
-            "size_kb": round(size_kb, 2)
-        })
-        
+        image_data = read_upload(request)
+        content_hash, renditions = process_avatar(image_data)
+    except AvatarError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except AvatarBusy as e:
+        logger.warning(f"🚦 头像处理繁忙: {e}", extra={'user_id': user.pk})
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     except Exception as e:
-        return Response({"error": f"图片处理失败: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        logger.exception("💥 头像处理失败", extra={'user_id': user.pk})
+        return Response({"error": f"图片处理失败: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # 各尺寸一起替换，内容哈希同时作为 ETag 和地址中的版本号
+    with transaction.atomic():
+        AvatarImage.objects.filter(actor_id=user.pk).delete()
+        AvatarImage.objects.bulk_create([
+            AvatarImage(actor_id=user.pk, size=size, data=data, content_type=AVATAR_CONTENT_TYPE,
+                        content_hash=content_hash)
+            for size, data in renditions
+        ])
+        user.avatar_hash = content_hash
+        user.save(update_fields=['avatar_hash'])
+    logger.info("✅ 头像已更新", extra={'user_id': user.pk, 'bytes': len(image_data), 'hash': content_hash[:16]})
+
+    return Response({
+        "message": "头像上传成功",
+        "avatar": absolute_avatar_url(request, user.avatar),
+        "sizes": [size for size, _ in renditions],
+        "size_kb": round(len(renditions[0][1]) / 1024, 2),
+    })
@@ -14,9 +14,17 @@ import '@uiw/react-markdown-preview/markdown.css';
 const getAvatarSrc = (base64: string | undefined | null) => {
     if (!base64) return null;
     if (base64.startsWith('data:image')) return base64;
+    // 后端返回的头像地址（/api/avatars/...），直接使用
+    if (base64.startsWith('http')) return base64;
     return `data:image/png;base64,${base64}`;
 };
 
+interface Category {
+  id: number;
+  name: string;
+  thread_count: number;
+}
+
 interface UserInfo {
   id: number;
   username: string;
@@ -31,6 +39,15 @@ export default function CreateThread() {
   const [content, setContent] = useState('');
   const [isSubmitting, setIsSubmitting] = useState(false);
   const [colorMode, setColorMode] = useState<'light' | 'dark'>('light');
+  const [categories, setCategories] = useState<Category[]>([]);
+  const [category, setCategory] = useState<string>('');
+
+  useEffect(() => {
+    fetch('http://127.0.0.1:8000/api/categories/')
+      .then(res => res.json())
+      .then(setCategories)
+      .catch(err => console.error('加载分类失败', err));
+  }, []);
 
   useEffect(() => {
     const userStr = localStorage.getItem('user');
@@ -79,12 +96,16 @@ export default function CreateThread() {
         },
         body: JSON.stringify({ 
             title: trimmedTitle, 
-            content: trimmedContent
+            content: trimmedContent,
+            category: category ? Number(category) : null
         }),
       });
 
       if (res.ok) {
         const data = await res.json();
+        if (data.ai?.status === 'skipped') {
+          alert("帖子已发布，但 AI 回复过于频繁，本次不会触发 AI 讨论");
+        }
         router.push(`/thread/${data.thread_id}`);
       } else {
         const errorData = await res.json();
@@ -156,6 +177,18 @@ export default function CreateThread() {
                 onChange={(e) => setTitle(e.target.value)}
                 required
             />
+            {categories.length > 0 && (
+              <select
+                  className="mt-3 bg-white dark:bg-slate-800 border border-slate-200 dark:border-slate-700 rounded-xl px-4 py-2 text-sm outline-none focus:ring-2 focus:ring-blue-500/20 focus:border-blue-500 text-slate-700 dark:text-slate-200"
+                  value={category}
+                  onChange={(e) => setCategory(e.target.value)}
+              >
+                <option value="">不选分类</option>
+                {categories.map(c => (
+                  <option key={c.id} value={c.id}>{c.name}</option>
+                ))}
+              </select>
+            )}
           </div>
 
           {/* Markdown 编辑器 */}
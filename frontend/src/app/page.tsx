@@ -1,6 +1,6 @@
 "use client";
 import { useState, useEffect } from 'react';
-import { Plus, MessageSquare, Clock, User, Search, LogOut, LogIn } from 'lucide-react';
+import { Plus, MessageSquare, Clock, User, Search, LogOut, LogIn, Flame, ThumbsUp } from 'lucide-react';
 import { useRouter } from 'next/navigation';
 import Link from 'next/link';
 
@@ -14,8 +14,18 @@ interface Thread {
   created_at: string;
   posts?: any[]; // 在列表页可能没有或不完整
   reply_count?: number; // 列表页有
+  score?: number; // 回复得分之和
 }
 
+interface Category {
+  id: number;
+  name: string;
+  thread_count: number;
+}
+
+// 列表排序：'' 按发帖时间，'hot' 按热度（投票和回复越多、越新越靠前）
+type SortMode = '' | 'hot';
+
 interface UserInfo {
   id: number;
   username: string;
@@ -27,14 +37,22 @@ export default function Home() {
   const router = useRouter();
   const [threads, setThreads] = useState<Thread[]>([]);
   const [isLoading, setIsLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [currentUser, setCurrentUser] = useState<UserInfo | null>(null);
+  const [sort, setSort] = useState<SortMode>('');
+  const [categories, setCategories] = useState<Category[]>([]);
+  const [category, setCategory] = useState<number | null>(null);
+
+  const sortQuery = (sort ? `sort=${sort}&` : '') + (category ? `category=${category}&` : '');
 
   const fetchThreads = async () => {
     setIsLoading(true);
     try {
-      const res = await fetch('http://127.0.0.1:8000/api/threads/');
+      const res = await fetch(`http://127.0.0.1:8000/api/threads/?${sortQuery}`);
       const data = await res.json();
-      setThreads(data);
+      setThreads(data.results);
+      setNextCursor(data.next_cursor);
     } catch (err) {
       console.error("连接失败", err);
     } finally {
@@ -42,9 +60,32 @@ export default function Home() {
     }
   };
 
+  const loadMoreThreads = async () => {
+    if (!nextCursor) return;
+    setIsLoadingMore(true);
+    try {
+      const res = await fetch(`http://127.0.0.1:8000/api/threads/?${sortQuery}cursor=${encodeURIComponent(nextCursor)}`);
+      const data = await res.json();
+      setThreads(prev => [...prev, ...data.results]);
+      setNextCursor(data.next_cursor);
+    } catch (err) {
+      console.error("加载更多失败", err);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
+  // 切换排序或分类后游标失效，从第一页重新加载
   useEffect(() => {
     fetchThreads();
-    
+  }, [sort, category]);
+
+  useEffect(() => {
+    fetch('http://127.0.0.1:8000/api/categories/')
+      .then(res => res.json())
+      .then(setCategories)
+      .catch(err => console.error('加载分类失败', err));
+
     // 检查登录状态
     const userStr = localStorage.getItem('user');
     if (userStr) {
@@ -128,6 +169,22 @@ export default function Home() {
             <p className="text-slate-500 dark:text-slate-400 text-sm mt-1">
               浏览最新的话题和见解
             </p>
+            <div className="inline-flex mt-3 p-0.5 bg-slate-100 dark:bg-slate-800 rounded-full text-sm">
+              {([['', '最新', Clock], ['hot', '热门', Flame]] as const).map(([value, label, Icon]) => (
+                <button
+                  key={value}
+                  onClick={() => setSort(value)}
+                  className={`inline-flex items-center gap-1 px-3 py-1 rounded-full font-medium transition ${
+                    sort === value
+                      ? 'bg-white dark:bg-slate-900 text-indigo-600 dark:text-indigo-400 shadow-sm'
+                      : 'text-slate-500 dark:text-slate-400 hover:text-slate-700 dark:hover:text-slate-200'
+                  }`}
+                >
+                  <Icon size={14} />
+                  {label}
+                </button>
+              ))}
+            </div>
           </div>
           <a 
             href="/create" 
@@ -138,6 +195,26 @@ export default function Home() {
           </a>
         </div>
 
+        {/* 分类筛选 */}
+        {categories.length > 0 && (
+          <div className="flex flex-wrap gap-2 mb-4">
+            {[{ id: null, name: '全部', thread_count: null }, ...categories].map((c) => (
+              <button
+                key={c.id ?? 'all'}
+                onClick={() => setCategory(c.id)}
+                className={`px-3 py-1 rounded-full text-sm font-medium border transition ${
+                  category === c.id
+                    ? 'bg-indigo-600 border-indigo-600 text-white'
+                    : 'bg-white dark:bg-slate-900 border-slate-200 dark:border-slate-800 text-slate-600 dark:text-slate-300 hover:bg-slate-50 dark:hover:bg-slate-800'
+                }`}
+              >
+                {c.name}
+                {c.thread_count !== null && <span className="ml-1 opacity-60">{c.thread_count}</span>}
+              </button>
+            ))}
+          </div>
+        )}
+
         {/* 列表容器 */}
         <div className="bg-white dark:bg-slate-900 rounded-xl shadow-sm border border-slate-200 dark:border-slate-800 overflow-hidden">
           
@@ -206,6 +283,9 @@ export default function Home() {
                         <span className="flex items-center gap-1">
                             <MessageSquare size={12} /> {replyCount}
                         </span>
+                        <span className="flex items-center gap-1">
+                            <ThumbsUp size={12} /> {thread.score ?? 0}
+                        </span>
                         <span className="flex items-center gap-1 ml-auto">
                             <Clock size={12} /> {formatTime(thread.created_at)}
                         </span>
@@ -250,6 +330,19 @@ export default function Home() {
           </div>
         </div>
         
+        {/* 加载更多 */}
+        {!isLoading && nextCursor && (
+            <div className="mt-6 flex justify-center">
+                <button
+                  onClick={loadMoreThreads}
+                  disabled={isLoadingMore}
+                  className="px-5 py-2 rounded-full text-sm font-medium bg-white dark:bg-slate-900 border border-slate-200 dark:border-slate-800 text-slate-600 dark:text-slate-300 hover:bg-slate-50 dark:hover:bg-slate-800 transition disabled:opacity-50"
+                >
+                  {isLoadingMore ? '加载中...' : '加载更多'}
+                </button>
+            </div>
+        )}
+
         {/* 底部统计或信息 */}
         {!isLoading && threads.length > 0 && (
             <div className="mt-4 text-center text-xs text-slate-400 dark:text-slate-600">
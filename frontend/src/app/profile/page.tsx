@@ -16,6 +16,8 @@ export default function Profile() {
   const fileInputRef = useRef<HTMLInputElement>(null);
   const [currentUser, setCurrentUser] = useState<UserInfo | null>(null);
   const [previewUrl, setPreviewUrl] = useState<string>('');
+  // 选中的原始文件，以 multipart 二进制上传（比 base64 小约 1/3）
+  const [selectedFile, setSelectedFile] = useState<File | null>(null);
   const [isUploading, setIsUploading] = useState(false);
   const [uploadSuccess, setUploadSuccess] = useState(false);
 
@@ -55,6 +57,8 @@ export default function Profile() {
       return;
     }
 
+    setSelectedFile(file);
+
     // 读取文件并预览
     const reader = new FileReader();
     reader.onload = (event) => {
@@ -65,7 +69,7 @@ export default function Profile() {
   };
 
   const handleUpload = async () => {
-    if (!previewUrl || previewUrl === currentUser?.avatar) {
+    if (!selectedFile || !previewUrl || previewUrl === currentUser?.avatar) {
       alert('请先选择新头像');
       return;
     }
@@ -75,13 +79,15 @@ export default function Profile() {
 
     try {
       const token = localStorage.getItem('access_token');
+      const formData = new FormData();
+      formData.append('avatar', selectedFile);
+      // 不手动设置 Content-Type，由浏览器补上 multipart boundary
       const response = await fetch('http://127.0.0.1:8000/api/user/avatar/', {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json',
           'Authorization': `Bearer ${token}`
         },
-        body: JSON.stringify({ avatar: previewUrl })
+        body: formData
       });
 
       const data = await response.json();
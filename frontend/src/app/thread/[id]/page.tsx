@@ -1,7 +1,7 @@
 "use client";
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef, useCallback } from 'react';
 import Link from 'next/link';
-import { ArrowLeft, Send, Bot, User, Loader2, MessageSquarePlus, X, Sparkles, Clock, Hash, ChevronRight, MoreHorizontal } from 'lucide-react';
+import { ArrowLeft, Send, Bot, User, Loader2, MessageSquarePlus, X, Sparkles, Clock, Hash, ChevronRight, MoreHorizontal, ThumbsUp, ThumbsDown } from 'lucide-react';
 import useSWR from 'swr';
 
 import dynamic from 'next/dynamic';
@@ -20,6 +20,7 @@ interface Post {
   author_name: string;
   author_avatar?: string;
   is_ai: boolean;
+  score: number;
 }
 
 interface Thread {
@@ -30,6 +31,9 @@ interface Thread {
   author_name: string;
   author_avatar?: string;
   posts: Post[];
+  reply_count: number;
+  // 回复分页：详情接口只返回最新的一页
+  posts_older_cursor: string | null;
   ai_generating: boolean;
 }
 
@@ -51,6 +55,8 @@ const getAvatarSrc = (base64: string | undefined | null) => {
     if (!base64) return null;
     // 如果已经是 data URI, 直接返回
     if (base64.startsWith('data:image')) return base64;
+    // 后端返回的头像地址（/api/avatars/...），直接使用
+    if (base64.startsWith('http')) return base64;
     // 否则, 假定为纯 base64 字符串并添加前缀
     return `data:image/png;base64,${base64}`;
 };
@@ -94,6 +100,19 @@ export default function ThreadDetail({ params }: { params: Promise<{ id: string
   const [isSending, setIsSending] = useState(false);
   const [showReplyForm, setShowReplyForm] = useState(false);
   const [colorMode, setColorMode] = useState<'light' | 'dark'>('light');
+  // SSE 推送中的 AI 回复草稿（并发生成时可能同时有多个）
+  const [streaming, setStreaming] = useState<Record<string, string>>({});
+  const [sseConnected, setSseConnected] = useState(false);
+  // 新 AI 回复依次展示的间隔，由后端 FORUM_AI_DISPLAY_PACING_MS 配置
+  const pacingRef = useRef(0);
+  const nextRevealAtRef = useRef(0);
+  // 通过“加载更早的回复”取回的旧回复，以及下一页的游标（undefined 表示使用详情接口返回的游标）
+  const [olderPosts, setOlderPosts] = useState<Post[]>([]);
+  const [olderCursor, setOlderCursor] = useState<string | null | undefined>(undefined);
+  const [loadingOlder, setLoadingOlder] = useState(false);
+  // 投票结果：回复 id -> 最新得分 / 本次会话中自己的票（接口不返回历史投票，只在本页记录）
+  const [scores, setScores] = useState<Record<number, number>>({});
+  const [myVotes, setMyVotes] = useState<Record<number, number>>({});
 
   useEffect(() => {
     params.then(p => setThreadId(p.id));
@@ -118,13 +137,140 @@ export default function ThreadDetail({ params }: { params: Promise<{ id: string
     threadId ? `http://127.0.0.1:8000/api/threads/${threadId}/` : null,
     fetcher,
     {
-      refreshInterval: (data) => (data?.ai_generating ? 2000 : 0),
       revalidateOnFocus: false,
       revalidateOnReconnect: true,
       keepPreviousData: true,
     }
   );
 
+  // 按节奏逐条展示新回复（替代原先后端的随机 sleep）
+  const revealPosts = useCallback((posts: Post[]) => {
+    posts.forEach((post) => {
+      const now = Date.now();
+      const revealAt = Math.max(now, nextRevealAtRef.current);
+      nextRevealAtRef.current = revealAt + pacingRef.current;
+      setTimeout(() => {
+        setStreaming((prev) => {
+          const { [post.author_name]: _, ...rest } = prev;
+          return rest;
+        });
+        mutate((current) => current && (current.posts.some(p => p.id === post.id)
+          ? current
+          : { ...current, posts: [...current.posts, post] }), false);
+      }, revealAt - now);
+    });
+  }, [mutate]);
+
+  // 通过 SSE 实时接收 AI 生成事件（需要后端以 ASGI 方式部署）
+  useEffect(() => {
+    if (!threadId || typeof EventSource === 'undefined') return;
+
+    const source = new EventSource(`http://127.0.0.1:8000/api/threads/${threadId}/events/`);
+    source.onopen = () => setSseConnected(true);
+    source.onerror = () => setSseConnected(false);
+
+    source.addEventListener('state', (e) => {
+      const data = JSON.parse((e as MessageEvent).data);
+      pacingRef.current = data.pacing_ms ?? 0;
+    });
+    source.addEventListener('agent_started', (e) => {
+      const data = JSON.parse((e as MessageEvent).data);
+      setStreaming((prev) => ({ ...prev, [data.agent]: '' }));
+      mutate((current) => current && { ...current, ai_generating: true }, false);
+    });
+    source.addEventListener('token', (e) => {
+      const data = JSON.parse((e as MessageEvent).data);
+      setStreaming((prev) => ({ ...prev, [data.agent]: (prev[data.agent] ?? '') + data.text }));
+    });
+    source.addEventListener('post_committed', (e) => {
+      const post: Post & { truncated?: boolean } = JSON.parse((e as MessageEvent).data);
+      if (post.truncated) {
+        // 正文过长时事件里不带内容，重新拉取一次
+        setStreaming((prev) => {
+          const { [post.author_name]: _, ...rest } = prev;
+          return rest;
+        });
+        mutate();
+        return;
+      }
+      revealPosts([post]);
+    });
+    source.addEventListener('generation_finished', () => {
+      // 等排队展示的回复都出现后再收起“生成中”状态
+      setTimeout(() => {
+        setStreaming({});
+        mutate((current) => current && { ...current, ai_generating: false }, false);
+      }, Math.max(0, nextRevealAtRef.current - Date.now()));
+    });
+
+    return () => source.close();
+  }, [threadId, mutate, revealPosts]);
+
+  // SSE 不可用时退回轮询：只拉取增量（新回复 + 生成状态），内容未变化时后端返回 304
+  useEffect(() => {
+    if (!threadId || !thread?.ai_generating || sseConnected) return;
+
+    const timer = setInterval(async () => {
+      const lastId = thread.posts.length ? thread.posts[thread.posts.length - 1].id : 0;
+      try {
+        const res = await fetch(`http://127.0.0.1:8000/api/threads/${threadId}/posts/?after=${lastId}`);
+        if (!res.ok) return;
+        const delta: { posts: Post[]; ai_generating: boolean; pacing_ms?: number } = await res.json();
+        pacingRef.current = delta.pacing_ms ?? 0;
+        // 浏览器命中 304 时会返回缓存的旧响应，按 id 去重
+        const newPosts = delta.posts.filter(p => p.id > lastId);
+        if (newPosts.length > 0) revealPosts(newPosts);
+        if (!delta.ai_generating && nextRevealAtRef.current <= Date.now()) {
+          mutate((current) => current && { ...current, ai_generating: false }, false);
+        }
+      } catch (err) {
+        console.error('轮询失败', err);
+      }
+    }, 2000);
+
+    return () => clearInterval(timer);
+  }, [threadId, thread, mutate, sseConnected, revealPosts]);
+
+  const loadOlderPosts = async () => {
+    const cursor = olderCursor === undefined ? thread?.posts_older_cursor : olderCursor;
+    if (!threadId || !cursor) return;
+    setLoadingOlder(true);
+    try {
+      const res = await fetch(`http://127.0.0.1:8000/api/threads/${threadId}/?cursor=${encodeURIComponent(cursor)}`);
+      if (!res.ok) throw new Error('Failed to fetch');
+      const page: Thread = await res.json();
+      setOlderPosts((prev) => [...page.posts.filter(p => !prev.some(o => o.id === p.id)), ...prev]);
+      setOlderCursor(page.posts_older_cursor);
+    } catch (err) {
+      console.error('加载更早的回复失败', err);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
+  // 再点一次同一方向即撤销
+  const handleVote = async (postId: number, direction: 1 | -1) => {
+    if (!currentUser) return alert("请先登录");
+    const undo = myVotes[postId] === direction;
+    try {
+      const token = localStorage.getItem('access_token');
+      const res = await fetch(`http://127.0.0.1:8000/api/posts/${postId}/vote/`, {
+        method: undo ? 'DELETE' : 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': `Bearer ${token}`
+        },
+        body: undo ? undefined : JSON.stringify({ direction }),
+      });
+      if (!res.ok) throw new Error('Failed to vote');
+      const data: { score: number; direction: number } = await res.json();
+      setScores((prev) => ({ ...prev, [postId]: data.score }));
+      setMyVotes((prev) => ({ ...prev, [postId]: data.direction }));
+    } catch (err) {
+      console.error('投票失败', err);
+    }
+  };
+
   const handleReply = async (e: React.FormEvent) => {
     e.preventDefault();
     if (!currentUser) return alert("请先登录");
@@ -145,9 +291,13 @@ export default function ThreadDetail({ params }: { params: Promise<{ id: string
       });
 
       if (res.ok) {
+        const data = await res.json();
         setReplyContent('');
         setShowReplyForm(false);
         await mutate();
+        if (data.ai?.status === 'skipped') {
+          alert("回复已发布，但 AI 回复过于频繁，本次不会触发 AI 讨论");
+        }
         setTimeout(() => document.getElementById('posts-end')?.scrollIntoView({ behavior: 'smooth' }), 100);
       } else {
         alert("回复失败");
@@ -191,6 +341,8 @@ export default function ThreadDetail({ params }: { params: Promise<{ id: string
   
   const threadAuthorAvatarSrc = getAvatarSrc(thread.author_avatar);
   const currentUserAvatarSrc = getAvatarSrc(currentUser?.avatar);
+  const posts = [...olderPosts.filter(o => !thread.posts.some(p => p.id === o.id)), ...thread.posts];
+  const hasOlderPosts = Boolean(olderCursor === undefined ? thread.posts_older_cursor : olderCursor);
 
   return (
     <div className="min-h-screen bg-[#F8FAFC] dark:bg-[#020617] font-sans relative selection:bg-indigo-500/30">
@@ -221,7 +373,7 @@ export default function ThreadDetail({ params }: { params: Promise<{ id: string
                 </div>
                 <div className="flex items-center gap-1.5 px-3 py-1.5 rounded-full bg-indigo-50 dark:bg-indigo-500/10 text-indigo-600 dark:text-indigo-400 text-xs font-bold border border-indigo-100 dark:border-indigo-500/20">
                     <MessageSquarePlus size={14} />
-                    <span>{thread.posts.length}</span>
+                    <span>{Math.max(thread.reply_count, posts.length)}</span>
                 </div>
             </div>
          </div>
@@ -297,7 +449,20 @@ export default function ThreadDetail({ params }: { params: Promise<{ id: string
             {/* 垂直连接线 (Timeline line) */}
             <div className="absolute left-6 top-4 bottom-12 w-0.5 bg-slate-200 dark:bg-slate-800 hidden md:block -z-10"></div>
 
-            {thread.posts.map((post, index) => {
+            {hasOlderPosts && (
+              <div className="flex justify-center mb-8">
+                <button
+                  onClick={loadOlderPosts}
+                  disabled={loadingOlder}
+                  className="flex items-center gap-2 px-5 py-2 rounded-full bg-white dark:bg-slate-900 border border-slate-200 dark:border-slate-800 text-sm font-semibold text-slate-600 dark:text-slate-300 hover:bg-slate-50 dark:hover:bg-slate-800 transition-colors disabled:opacity-50"
+                >
+                  {loadingOlder ? <Loader2 size={16} className="animate-spin" /> : <MoreHorizontal size={16} />}
+                  加载更早的回复
+                </button>
+              </div>
+            )}
+
+            {posts.map((post, index) => {
               const postAuthorAvatarSrc = getAvatarSrc(post.author_avatar);
               return (
               <div key={post.id} className={`
@@ -371,10 +536,29 @@ export default function ThreadDetail({ params }: { params: Promise<{ id: string
                     <div className={MARKDOWN_CLASS}>
                         <MarkdownPreview source={post.content} />
                     </div>
+
+                    {/* 投票 */}
+                    <div className="flex items-center gap-1 mt-6 text-sm text-slate-500 dark:text-slate-400">
+                        <button
+                          onClick={() => handleVote(post.id, 1)}
+                          className={`p-1.5 rounded-full transition hover:bg-slate-100 dark:hover:bg-slate-800 ${myVotes[post.id] === 1 ? 'text-indigo-600 dark:text-indigo-400' : ''}`}
+                          aria-label="赞"
+                        >
+                          <ThumbsUp size={16} />
+                        </button>
+                        <span className="min-w-6 text-center font-semibold tabular-nums">{scores[post.id] ?? post.score ?? 0}</span>
+                        <button
+                          onClick={() => handleVote(post.id, -1)}
+                          className={`p-1.5 rounded-full transition hover:bg-slate-100 dark:hover:bg-slate-800 ${myVotes[post.id] === -1 ? 'text-red-500 dark:text-red-400' : ''}`}
+                          aria-label="踩"
+                        >
+                          <ThumbsDown size={16} />
+                        </button>
+                    </div>
                 </div>
 
                 {/* 楼层连接小尾巴 (视觉引导) */}
-                {index !== thread.posts.length - 1 && (
+                {index !== posts.length - 1 && (
                    <div className="block md:hidden absolute left-1/2 -bottom-4 w-px h-8 bg-slate-200 dark:bg-slate-800 -z-10"></div>
                 )}
               </div>
@@ -388,6 +572,21 @@ export default function ThreadDetail({ params }: { params: Promise<{ id: string
                              <Loader2 size={20} className="text-emerald-500 animate-spin" />
                         </div>
                     </div>
+                    {Object.keys(streaming).length > 0 ? (
+                    <div className="space-y-4">
+                    {Object.entries(streaming).map(([agent, text]) => (
+                    <div key={agent} className="rounded-2xl md:rounded-3xl p-8 border border-emerald-100 dark:border-emerald-900/30 bg-gradient-to-b from-emerald-50/30 to-transparent dark:from-emerald-900/10">
+                        <div className="flex items-center gap-2 mb-6">
+                            <span className="font-bold text-lg text-emerald-950 dark:text-emerald-100">{agent}</span>
+                            <span className="text-xs text-emerald-600 dark:text-emerald-400">正在输入...</span>
+                        </div>
+                        <div className={MARKDOWN_CLASS}>
+                            <MarkdownPreview source={text} />
+                        </div>
+                    </div>
+                    ))}
+                    </div>
+                    ) : (
                     <div className="rounded-2xl md:rounded-3xl p-8 border border-emerald-100 dark:border-emerald-900/30 bg-gradient-to-b from-emerald-50/30 to-transparent dark:from-emerald-900/10">
                         <div className="flex gap-3 mb-6">
                             <div className="h-5 bg-emerald-100 dark:bg-emerald-900/30 rounded w-32" />
@@ -399,6 +598,7 @@ export default function ThreadDetail({ params }: { params: Promise<{ id: string
                             <div className="h-4 bg-slate-200/50 dark:bg-slate-800 rounded w-4/6" />
                         </div>
                     </div>
+                    )}
                </div>
             )}
             